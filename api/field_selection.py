@@ -0,0 +1,174 @@
+from typing import Any, Dict, List, Optional, Set, Tuple
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch
+from rest_framework import serializers
+
+
+def parse_fields(value: Optional[str]) -> Optional[Dict[str, Any]]:
+    """
+    Convertir ?fields= en un árbol de campos
+    
+    "title,modules.title,modules.chunks.title" ->
+    {'title': None, 'modules': {'title': None, 'chunks': {'title': None}}}
+    
+    None como valor significa el campo completo (sin recortar sus hijos).
+    """
+    if value is None:
+        return None
+    
+    spec = {}
+    for path in filter(None, (part.strip() for part in value.split(','))):
+        node = spec
+        names = path.split('.')
+        for name in names[:-1]:
+            if name in node and node[name] is None:
+                break  # El padre ya se pidió completo
+            node = node.setdefault(name, {})
+        else:
+            node[names[-1]] = None
+    
+    return spec or None
+
+
+def parse_expand(value: Optional[str]) -> Optional[Set[str]]:
+    """
+    Convertir ?expand= en el conjunto de relaciones anidadas a incluir
+    
+    "modules.chunks" incluye también "modules".
+    """
+    if value is None:
+        return None
+    
+    expand = set()
+    for path in filter(None, (part.strip() for part in value.split(','))):
+        names = path.split('.')
+        expand.update('.'.join(names[:depth]) for depth in range(1, len(names) + 1))
+    
+    return expand
+
+
+def select_fields(serializer, fields: Optional[Dict[str, Any]] = None, expand: Optional[Set[str]] = None, path: str = ''):
+    """
+    Quitar del serializer, y de sus serializers anidados, los campos no pedidos
+    
+    Sin fields se conservan todos los campos; sin expand, todas las relaciones.
+    """
+    for name, field in list(serializer.fields.items()):
+        nested = getattr(field, 'child', field)
+        field_path = f'{path}{name}'
+        
+        if fields is not None and name not in fields:
+            serializer.fields.pop(name)
+        elif isinstance(nested, serializers.BaseSerializer):
+            if expand is not None and field_path not in expand:
+                serializer.fields.pop(name)
+            else:
+                select_fields(nested, fields.get(name) if fields else None, expand, f'{field_path}.')
+
+
+def queryset_requirements(serializer, model) -> Tuple[Set[str], List[str], List[Any]]:
+    """
+    Columnas (only), select_related y prefetch_related que usa un serializer ya recortado
+    
+    Los campos que no son columnas del modelo (SerializerMethodField,
+    anotaciones) declaran las columnas que leen en Meta.field_dependencies.
+    """
+    only = {model._meta.pk.name}
+    select, prefetch = [], []
+    dependencies = getattr(getattr(serializer, 'Meta', None), 'field_dependencies', {})
+    
+    for name, field in serializer.fields.items():
+        only.update(dependencies.get(name, []))
+        nested = getattr(field, 'child', field)
+        
+        if isinstance(nested, serializers.BaseSerializer):
+            relation = model._meta.get_field(field.source)
+            child_only, child_select, child_prefetch = queryset_requirements(nested, relation.related_model)
+            
+            if relation.one_to_many:
+                # El FK hacia el padre es necesario para repartir las filas precargadas
+                child_only.add(relation.field.name)
+                prefetch.append(Prefetch(field.source, queryset=load_only(
+                    relation.related_model.objects.all(), child_only, child_select, child_prefetch
+                )))
+            else:
+                select.append(field.source)
+                select.extend(f'{field.source}__{lookup}' for lookup in child_select)
+                only.update(f'{field.source}__{column}' for column in child_only)
+                prefetch.extend(f'{field.source}__{lookup}' for lookup in child_prefetch)
+            continue
+        
+        if not field.source_attrs:
+            continue  # source='*'
+        
+        if len(field.source_attrs) > 1:
+            # Campo de una relación directa, por ejemplo source='course.title'
+            relation_path = '__'.join(field.source_attrs[:-1])
+            select.append(relation_path)
+            only.update([field.source_attrs[0], '__'.join(field.source_attrs)])
+            continue
+        
+        try:
+            if model._meta.get_field(field.source).concrete:
+                only.add(field.source)
+        except FieldDoesNotExist:
+            pass
+    
+    return only, select, prefetch
+
+
+def load_only(queryset, only, select, prefetch):
+    """Aplicar los requisitos de queryset_requirements() a un queryset"""
+    if select:
+        queryset = queryset.select_related(*select)  # Sin argumentos seguiría todos los FK
+    return queryset.prefetch_related(*prefetch).only(*only)
+
+
+class DynamicFieldsMixin:
+    """
+    Serializer que acepta fields= y expand= (árboles de parse_fields/parse_expand)
+    para devolver solo una parte de su representación
+    """
+    
+    def __init__(self, *args, fields=None, expand=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is not None or expand is not None:
+            select_fields(self, fields, expand)
+
+
+class FieldSelectionMixin:
+    """
+    Parámetros ?fields= y ?expand= en las acciones de lectura de un ViewSet
+    
+    El serializer se recorta a los campos pedidos y select_queryset() limita
+    el queryset a las columnas y relaciones que esos campos necesitan. Sin
+    parámetros el ViewSet responde exactamente como antes.
+    """
+    
+    field_selection_actions = ['list', 'retrieve']
+    
+    def get_field_selection(self) -> Optional[Dict[str, Any]]:
+        if self.action not in self.field_selection_actions:
+            return None
+        
+        params = self.request.query_params
+        if 'fields' not in params and 'expand' not in params:
+            return None
+        
+        return {
+            'fields': parse_fields(params.get('fields')),
+            'expand': parse_expand(params.get('expand')),
+        }
+    
+    def get_serializer(self, *args, **kwargs):
+        selection = self.get_field_selection()
+        if selection is not None:
+            kwargs.update(selection)
+        return super().get_serializer(*args, **kwargs)
+    
+    def select_queryset(self, queryset, extra_fields: List[str] = ()):
+        """
+        Cargar solo lo que usan los campos pedidos (only/select_related/prefetch_related)
+        """
+        only, select, prefetch = queryset_requirements(self.get_serializer(), queryset.model)
+        return load_only(queryset, [*only, *extra_fields], select, prefetch)
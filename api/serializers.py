@@ -1,5 +1,19 @@
 from rest_framework import serializers
+from django.db.models import Prefetch
 from courses.models import Course, Module, Chunk, Video, Quiz, UserProgress, GenerationLog
+from .field_selection import DynamicFieldsMixin
+
+
+def module_content_prefetches(prefix=''):
+    """
+    Relaciones que serializa ModuleSerializer: chunks con su video y quizzes
+    
+    Con prefix='modules__' sirve para cargar los módulos de un curso.
+    """
+    return [
+        Prefetch(f'{prefix}chunks', queryset=Chunk.objects.select_related('video')),
+        f'{prefix}quizzes',
+    ]
 
 
 class VideoSerializer(serializers.ModelSerializer):
@@ -20,7 +34,7 @@ class ChunkSerializer(serializers.ModelSerializer):
     class Meta:
         model = Chunk
         fields = [
-            'chunk_id', 'chunk_order', 'total_chunks', 
+            'chunk_id', 'chunk_order', 'total_chunks', 'title',
             'content', 'checksum', 'video'
         ]
 
@@ -43,7 +57,7 @@ class ModuleSerializer(serializers.ModelSerializer):
         fields = [
             'module_id', 'title', 'description', 'objective', 
             'concepts', 'summary', 'practical_exercise', 
-            'resources', 'chunks', 'quizzes', 'module_order'
+            'resources', 'chunks', 'quizzes', 'module_order', 'is_complete'
         ]
 
 
@@ -78,13 +92,18 @@ class CourseCreateSerializer(serializers.ModelSerializer):
 class CourseStatusSerializer(serializers.ModelSerializer):
     """Serializer para estado del curso (polling)"""
     progress_percentage = serializers.SerializerMethodField()
+    chunks_ready = serializers.SerializerMethodField()
     
     class Meta:
         model = Course
-        fields = ['id', 'status', 'title', 'progress_percentage']
+        fields = ['id', 'status', 'title', 'progress_percentage', 'chunks_ready']
     
     def get_progress_percentage(self, obj):
         return obj.get_progress_percentage()
+    
+    def get_chunks_ready(self, obj):
+        """Chunks del módulo 1 ya disponibles (crece durante el streaming)"""
+        return obj.get_ready_chunks_count(module_order=1)
 
 
 class CourseMetadataSerializer(serializers.ModelSerializer):
@@ -100,7 +119,7 @@ class CourseMetadataSerializer(serializers.ModelSerializer):
         ]
 
 
-class CourseDetailSerializer(serializers.ModelSerializer):
+class CourseDetailSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     """Serializer completo del curso con todos los módulos"""
     modules = ModuleSerializer(many=True, read_only=True)
     progress_percentage = serializers.SerializerMethodField()
@@ -114,12 +133,13 @@ class CourseDetailSerializer(serializers.ModelSerializer):
             'final_project_data', 'modules', 'status', 'progress_percentage',
             'created_at', 'updated_at', 'completed_at'
         ]
+        field_dependencies = {'progress_percentage': ['status']}
     
     def get_progress_percentage(self, obj):
         return obj.get_progress_percentage()
 
 
-class CourseListSerializer(serializers.ModelSerializer):
+class CourseListSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     """Serializer para lista de cursos"""
     progress_percentage = serializers.SerializerMethodField()
     modules_count = serializers.SerializerMethodField()
@@ -131,16 +151,21 @@ class CourseListSerializer(serializers.ModelSerializer):
             'status', 'progress_percentage', 'modules_count', 
             'created_at', 'updated_at'
         ]
+        field_dependencies = {'progress_percentage': ['status']}
     
     def get_progress_percentage(self, obj):
         return obj.get_progress_percentage()
     
     def get_modules_count(self, obj):
+        """Conteo anotado por CourseViewSet.get_queryset; si falta, se consulta"""
+        if hasattr(obj, 'modules_count'):
+            return obj.modules_count
         return obj.modules.count()
 
 
 class UserProgressSerializer(serializers.ModelSerializer):
     """Serializer para progreso del usuario"""
+    completed_chunks = serializers.SerializerMethodField()
     completion_percentage = serializers.SerializerMethodField()
     course_title = serializers.CharField(source='course.title', read_only=True)
     current_module_title = serializers.CharField(source='current_module.title', read_only=True)
@@ -153,21 +178,28 @@ class UserProgressSerializer(serializers.ModelSerializer):
             'started_at', 'last_accessed', 'completed_at'
         ]
     
+    def get_completed_chunks(self, obj):
+        return obj.get_completed_chunk_ids()
+    
     def get_completion_percentage(self, obj):
         return obj.get_completion_percentage()
 
 
 class MarkChunkCompleteSerializer(serializers.Serializer):
-    """Serializer para marcar chunks como completados"""
+    """
+    Serializer para marcar chunks como completados
+    
+    Requiere el curso en el contexto; el chunk validado queda en validated_data['chunk'].
+    """
     chunk_id = serializers.CharField(max_length=100)
     
-    def validate_chunk_id(self, value):
-        """Validar que el chunk existe"""
-        try:
-            chunk = Chunk.objects.get(chunk_id=value)
-            return value
-        except Chunk.DoesNotExist:
-            raise serializers.ValidationError("Chunk no encontrado")
+    def validate(self, data):
+        """Validar que el chunk existe en el curso"""
+        chunk = self.context['course'].get_chunk(data['chunk_id'])
+        if chunk is None:
+            raise serializers.ValidationError({'chunk_id': "Chunk no encontrado"})
+        data['chunk'] = chunk
+        return data
 
 
 class GenerationLogSerializer(serializers.ModelSerializer):
@@ -189,7 +221,7 @@ class CourseWithLogsSerializer(CourseDetailSerializer):
         fields = CourseDetailSerializer.Meta.fields + ['logs']
 
 
-class ModuleDetailSerializer(serializers.ModelSerializer):
+class ModuleDetailSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     """Serializer detallado para un módulo específico"""
     chunks = ChunkSerializer(many=True, read_only=True)
     quizzes = QuizSerializer(many=True, read_only=True)
@@ -200,7 +232,7 @@ class ModuleDetailSerializer(serializers.ModelSerializer):
         fields = [
             'module_id', 'title', 'description', 'objective', 
             'concepts', 'summary', 'practical_exercise', 
-            'resources', 'chunks', 'quizzes', 'module_order',
+            'resources', 'chunks', 'quizzes', 'module_order', 'is_complete',
             'course_title', 'created_at', 'updated_at'
         ]
 
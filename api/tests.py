@@ -1,3 +1,418 @@
-from django.test import TestCase
+import json
+from unittest import mock
+from django.contrib import admin
+from django.test import TestCase, override_settings
 
-# Create your tests here.
+from courses.admin import CourseAdmin
+from courses.models import Course, CourseSnapshot, Module, Chunk, ChunkCompletion, Video, Quiz, UserProgress
+from generation.services.snapshot_service import course_snapshot_service
+from generation.services.status_events import status_event_service
+
+
+def create_course(total_modules=6, chunks_per_module=6, status=Course.StatusChoices.READY):
+    """Curso con videos y quizzes para medir consultas por endpoint"""
+    course = Course.objects.create(
+        user_prompt='Python desde cero',
+        status=status,
+        title='Python desde cero',
+        total_modules=total_modules
+    )
+    
+    for module_order in range(1, total_modules + 1):
+        module = Module.objects.create(
+            course=course,
+            module_id=f'modulo_{module_order}',
+            module_order=module_order,
+            title=f'Módulo {module_order}',
+            description=''
+        )
+        for chunk_order in range(1, chunks_per_module + 1):
+            chunk = Chunk.objects.create(
+                module=module,
+                chunk_id=f'modulo_{module_order}_chunk_{chunk_order}',
+                title=f'Chunk {chunk_order}',
+                chunk_order=chunk_order,
+                total_chunks=chunks_per_module,
+                content=f'Contenido del chunk {chunk_order}'
+            )
+            Video.objects.create(
+                chunk=chunk,
+                video_id=f'video{module_order}{chunk_order}',
+                title='Video',
+                url='https://www.youtube.com/watch?v=video',
+                embed_url='https://www.youtube.com/embed/video',
+                thumbnail_url='https://img.youtube.com/vi/video/0.jpg',
+                duration='10:00'
+            )
+        Quiz.objects.create(module=module, question='¿Pregunta?', options=['A', 'B'], correct_answer=0)
+        module.update_total_chunks()
+    
+    course.refresh_from_db()
+    return course
+
+
+class EndpointQueryCountTests(TestCase):
+    """Consultas por endpoint: constantes, sin depender del tamaño del curso"""
+    
+    def setUp(self):
+        self.course = create_course()
+    
+    def test_course_detail(self):
+        # Snapshot (no existe), curso, módulos, chunks con video y quizzes
+        with self.assertNumQueries(5):
+            response = self.client.get(f'/api/courses/{self.course.id}/')
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['modules']), 6)
+        self.assertEqual(response.data['modules'][0]['chunks'][0]['video']['video_id'], 'video11')
+    
+    def test_course_logs(self):
+        with self.assertNumQueries(5):
+            response = self.client.get(f'/api/courses/{self.course.id}/logs/')
+        
+        self.assertEqual(response.status_code, 200)
+    
+    def test_progress_list(self):
+        for _ in range(3):
+            course = create_course(total_modules=1, chunks_per_module=2)
+            for chunk_id in ('modulo_1_chunk_2', 'modulo_1_chunk_1'):
+                self.client.post(f'/api/progress/{course.id}/mark_chunk_complete/', {'chunk_id': chunk_id},
+                                 content_type='application/json')
+        
+        # Total de la página, progresos con curso y módulo actual, completados con su chunk
+        with self.assertNumQueries(3):
+            response = self.client.get('/api/progress/')
+        
+        self.assertEqual(response.status_code, 200)
+        results = response.data.get('results', response.data)
+        self.assertEqual(len(results), 3)
+        self.assertEqual(results[0]['completed_chunks'], ['modulo_1_chunk_2', 'modulo_1_chunk_1'])
+    
+    def test_module_detail(self):
+        module = self.course.modules.get(module_order=2)
+        
+        with self.assertNumQueries(3):
+            response = self.client.get(f'/api/modules/{module.id}/')
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['chunks']), 6)
+        self.assertEqual(response.data['course_title'], 'Python desde cero')
+    
+    def test_module_navigation(self):
+        with self.assertNumQueries(5):
+            response = self.client.post(
+                f'/api/courses/{self.course.id}/next_module/',
+                {'current_module_order': 1, 'direction': 'next'},
+                content_type='application/json'
+            )
+        self.assertEqual(response.data['module_order'], 2)
+        
+        with self.assertNumQueries(4):
+            response = self.client.post(
+                f'/api/courses/{self.course.id}/previous_module/',
+                {'current_module_order': 3},
+                content_type='application/json'
+            )
+        self.assertEqual(response.data['module_order'], 2)
+
+
+class CourseListTests(TestCase):
+    """GET /api/courses/ paginado por cursor"""
+    
+    def setUp(self):
+        create_course(total_modules=3, chunks_per_module=1, status=Course.StatusChoices.COMPLETE)
+        for number in range(24):
+            Course.objects.create(
+                user_prompt=f'Curso {number}',
+                title=f'Curso {number}',
+                user_level=Course.LevelChoices.AVANZADO if number % 2 else Course.LevelChoices.PRINCIPIANTE
+            )
+    
+    def test_pages_follow_the_cursor_with_a_single_query(self):
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/courses/')
+        
+        self.assertEqual(len(response.data['results']), 20)
+        self.assertNotIn('count', response.data)
+        
+        with self.assertNumQueries(1):
+            response = self.client.get(response.data['next'])
+        
+        self.assertEqual(len(response.data['results']), 5)
+        self.assertIsNone(response.data['next'])
+        self.assertEqual(response.data['results'][-1]['modules_count'], 3)
+    
+    def test_filters_by_status_and_level(self):
+        response = self.client.get('/api/courses/', {'status': 'complete'})
+        self.assertEqual([course['modules_count'] for course in response.data['results']], [3])
+        
+        response = self.client.get('/api/courses/', {'level': 'avanzado'})
+        self.assertEqual(len(response.data['results']), 12)
+        
+        response = self.client.get('/api/courses/', {'level': 'experto'})
+        self.assertEqual(response.status_code, 400)
+
+
+class CourseSnapshotTests(TestCase):
+    """GET /api/courses/{id}/ servido desde el snapshot de los cursos completos"""
+    
+    def setUp(self):
+        self.course = create_course(status=Course.StatusChoices.COMPLETE)
+        self.url = f'/api/courses/{self.course.id}/'
+    
+    def test_complete_course_is_served_from_snapshot(self):
+        response = self.client.get(self.url)  # Genera el snapshot
+        etag = response['ETag']
+        self.assertEqual(self.course.snapshot.content_hash, etag.strip('"'))
+        
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url)
+        self.assertEqual(response['ETag'], etag)
+        self.assertIn('max-age', response['Cache-Control'])
+        self.assertEqual(len(json.loads(response.content)['modules']), 6)
+        
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+    
+    def test_gzip_clients_receive_the_stored_blob(self):
+        snapshot = course_snapshot_service.refresh(self.course)
+        
+        response = self.client.get(self.url, HTTP_ACCEPT_ENCODING='gzip, br')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response.content, bytes(snapshot.data))
+        self.assertEqual(response['ETag'], f'"{snapshot.content_hash}-gzip"')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        
+        # El ETag de una codificación no valida la otra
+        identity = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(identity.status_code, 200)
+        self.assertEqual(identity['ETag'], f'"{snapshot.content_hash}"')
+        
+        response = self.client.get(self.url, HTTP_ACCEPT_ENCODING='gzip', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+    
+    def test_snapshot_is_refreshed_when_content_changes(self):
+        etag = self.client.get(self.url)['ETag']
+        
+        Chunk.objects.filter(module__course=self.course, chunk_order=1).update(content='Editado')
+        course_snapshot_service.refresh(self.course)
+        
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content)['modules'][0]['chunks'][0]['content'], 'Editado')
+
+
+class FakeStatusRedis:
+    """Lo mínimo de redis-py que usa status_event_service para el registro de estado"""
+    
+    def __init__(self):
+        self.hashes = {}
+    
+    def pipeline(self, transaction=True):
+        return self  # Las operaciones se aplican al momento
+    
+    def hset(self, key, mapping):
+        self.hashes.setdefault(key, {}).update({field.encode(): str(value).encode() for field, value in mapping.items()})
+    
+    def hincrby(self, key, field, amount):
+        record = self.hashes.setdefault(key, {})
+        record[field.encode()] = str(int(record.get(field.encode(), 0)) + amount).encode()
+    
+    def hgetall(self, key):
+        return dict(self.hashes.get(key, {}))
+    
+    def expire(self, key, seconds):
+        pass
+    
+    def delete(self, key):
+        self.hashes.pop(key, None)
+    
+    def publish(self, channel, message):
+        pass
+    
+    def execute(self):
+        pass
+
+
+class StatusPollingTests(TestCase):
+    """GET /api/courses/{id}/status/ y /course/{id}/status/ con ETag"""
+    
+    def setUp(self):
+        self.course = create_course(total_modules=1, chunks_per_module=2, status=Course.StatusChoices.GENERATING_MODULE_1)
+    
+    @override_settings(GENERATION_STATUS_EVENTS_ENABLED=False)
+    def test_matching_etag_returns_304(self):
+        url = f'/api/courses/{self.course.id}/status/'
+        response = self.client.get(url)
+        etag = response['ETag']
+        self.assertEqual(response.data['status'], Course.StatusChoices.GENERATING_MODULE_1)
+        
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+        
+        Course.objects.filter(pk=self.course.pk).update(status=Course.StatusChoices.READY)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+    
+    def use_fake_redis(self):
+        patches = [
+            mock.patch.object(status_event_service, '_get_client', return_value=FakeStatusRedis()),
+            mock.patch.object(status_event_service, '_redis_retry_at', 0.0),  # Sin fallos previos de otros tests
+        ]
+        for patcher in patches:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+    
+    @override_settings(GENERATION_STATUS_EVENTS_ENABLED=True)
+    def test_published_status_is_served_without_the_database(self):
+        self.use_fake_redis()
+        url = f'/course/{self.course.id}/status/'
+        
+        status_event_service.publish(self.course)
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        self.assertEqual(response.json()['status'], Course.StatusChoices.GENERATING_MODULE_1)
+        
+        self.course.status = Course.StatusChoices.READY
+        status_event_service.publish(self.course)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['status'], Course.StatusChoices.READY)
+    
+    @override_settings(GENERATION_STATUS_EVENTS_ENABLED=True)
+    def test_status_changes_outside_the_tasks_reach_the_next_poll(self):
+        self.use_fake_redis()
+        course_admin = CourseAdmin(Course, admin.site)
+        url = f'/api/courses/{self.course.id}/status/'
+        status_event_service.publish(self.course)
+        
+        self.course.status = Course.StatusChoices.READY
+        course_admin.save_model(None, self.course, None, True)
+        self.assertEqual(self.client.get(url).data['status'], Course.StatusChoices.READY)
+        
+        self.course.mark_complete()
+        self.assertEqual(self.client.get(url).data['status'], Course.StatusChoices.COMPLETE)
+        
+        course_id = self.course.id
+        self.assertIsNotNone(status_event_service.get_status(course_id))
+        course_admin.delete_model(None, self.course)
+        self.assertIsNone(status_event_service.get_status(course_id))
+
+
+class ChunkCompletionTests(TestCase):
+    """POST /api/progress/{course_id}/mark_chunk_complete/"""
+    
+    def setUp(self):
+        self.course = create_course(total_modules=1, chunks_per_module=2)
+        self.url = f'/api/progress/{self.course.id}/mark_chunk_complete/'
+    
+    def mark(self, chunk_id):
+        return self.client.post(self.url, {'chunk_id': chunk_id}, content_type='application/json')
+    
+    def test_marking_is_idempotent(self):
+        self.mark('modulo_1_chunk_1')
+        response = self.mark('modulo_1_chunk_1')
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['completed_chunks'], ['modulo_1_chunk_1'])
+        self.assertEqual(ChunkCompletion.objects.count(), 1)
+        self.assertEqual(UserProgress.objects.get(course=self.course).completed_count, 1)
+        self.assertEqual(response.data['completion_percentage'], 50)
+        self.assertIsNone(response.data['completed_at'])
+    
+    def test_progress_completes_with_the_last_chunk(self):
+        self.mark('modulo_1_chunk_1')
+        response = self.mark('modulo_1_chunk_2')
+        
+        self.assertEqual(response.data['completed_chunks'], ['modulo_1_chunk_1', 'modulo_1_chunk_2'])
+        self.assertEqual(response.data['completion_percentage'], 100)
+        self.assertIsNotNone(response.data['completed_at'])
+    
+    def test_chunk_is_resolved_within_the_course(self):
+        other_course = create_course(total_modules=1, chunks_per_module=2)
+        self.mark('modulo_1_chunk_1')
+        
+        # Curso, chunk, progreso, inserción (savepoint, insert, contador, release),
+        # punteros, contador, completed_at y chunks completados
+        with self.assertNumQueries(11):
+            response = self.mark('modulo_1_chunk_2')
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(ChunkCompletion.objects.filter(chunk__module__course=other_course).exists())
+    
+    def test_deleting_a_chunk_updates_the_counters(self):
+        self.mark('modulo_1_chunk_1')
+        
+        Chunk.objects.get(module__course=self.course, chunk_id='modulo_1_chunk_1').delete()
+        
+        self.course.refresh_from_db()
+        self.assertEqual(self.course.total_chunks, 1)
+        self.assertEqual(self.course.modules.get().total_chunks, 1)
+        self.assertEqual(UserProgress.objects.get(course=self.course).completed_count, 0)
+    
+    def test_regenerating_a_module_discounts_its_completions(self):
+        self.mark('modulo_1_chunk_1')
+        self.mark('modulo_1_chunk_2')
+        
+        self.course.modules.get().delete()  # Módulo a medio escribir que se regenera
+        
+        self.course.refresh_from_db()
+        self.assertEqual(self.course.total_chunks, 0)
+        self.assertEqual(UserProgress.objects.get(course=self.course).completed_count, 0)
+    
+    def test_unknown_chunk_is_rejected(self):
+        response = self.mark('modulo_9_chunk_1')
+        
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('chunk_id', response.data)
+
+
+class FieldSelectionTests(TestCase):
+    """?fields= y ?expand= en /api/courses/ y /api/modules/"""
+    
+    def setUp(self):
+        self.course = create_course(total_modules=2, chunks_per_module=3, status=Course.StatusChoices.COMPLETE)
+    
+    def test_course_outline_only_loads_the_requested_columns(self):
+        # Curso, módulos y chunks; sin snapshot, videos ni quizzes
+        with self.assertNumQueries(3) as queries:
+            response = self.client.get(
+                f'/api/courses/{self.course.id}/',
+                {'fields': 'title,modules.title,modules.chunks.chunk_id,modules.chunks.title'}
+            )
+        
+        self.assertEqual(response.data['title'], 'Python desde cero')
+        self.assertEqual(response.data['modules'][1], {
+            'title': 'Módulo 2',
+            'chunks': [
+                {'chunk_id': f'modulo_2_chunk_{order}', 'title': f'Chunk {order}'} for order in range(1, 4)
+            ]
+        })
+        self.assertNotIn('"content"', queries.captured_queries[2]['sql'])
+        self.assertFalse(CourseSnapshot.objects.exists())
+    
+    def test_expand_limits_nested_relations(self):
+        response = self.client.get(f'/api/courses/{self.course.id}/', {'expand': 'modules'})
+        
+        module = response.data['modules'][0]
+        self.assertEqual(module['title'], 'Módulo 1')
+        self.assertNotIn('chunks', module)
+        self.assertNotIn('quizzes', module)
+        self.assertIn('podcast_script', response.data)
+    
+    def test_module_and_list_fields(self):
+        module = self.course.modules.get(module_order=1)
+        
+        with self.assertNumQueries(2):
+            response = self.client.get(f'/api/modules/{module.id}/', {'fields': 'title,course_title,chunks.video.video_id'})
+        self.assertEqual(response.data['course_title'], 'Python desde cero')
+        self.assertEqual(response.data['chunks'][0], {'video': {'video_id': 'video11'}})
+        
+        response = self.client.get('/api/courses/', {'fields': 'title,modules_count,progress_percentage'})
+        self.assertEqual(response.data['results'], [
+            {'title': 'Python desde cero', 'progress_percentage': 100, 'modules_count': 2}
+        ])
@@ -7,6 +7,7 @@ router = DefaultRouter()
 router.register(r'courses', views.CourseViewSet, basename='course')
 router.register(r'modules', views.ModuleViewSet, basename='module')
 router.register(r'progress', views.UserProgressViewSet, basename='progress')
+router.register(r'queues', views.GenerationQueueViewSet, basename='queues')
 
 app_name = 'api'
 
@@ -1,39 +1,114 @@
 from django.shortcuts import render
+import gzip
 import logging
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import CursorPagination
 from rest_framework.response import Response
 from rest_framework.permissions import AllowAny
 from django.shortcuts import get_object_or_404
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Prefetch, prefetch_related_objects
 from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.http import HttpResponse
+from django.conf import settings
 
-from courses.models import Course, Module, Chunk, UserProgress
-from generation.tasks import generate_course_metadata, generate_remaining_modules
+from courses.models import Course, CourseSnapshot, Module, ChunkCompletion, UserProgress, GenerationLog
+from generation.tasks import generate_course_metadata, generate_remaining_modules, cancel_module_prefetch
+from generation.services.persistence_service import persistence_service
+from generation.services.similarity_service import course_similarity_service
+from generation.services.queue_metrics import queue_metrics_service
+from generation.services.status_events import status_event_service
+from generation.services.snapshot_service import course_snapshot_service
+from .field_selection import FieldSelectionMixin
 from .serializers import (
     CourseCreateSerializer, CourseDetailSerializer, CourseListSerializer,
     CourseStatusSerializer, CourseMetadataSerializer, ModuleSerializer,
     ModuleDetailSerializer, UserProgressSerializer, MarkChunkCompleteSerializer,
-    NextModuleSerializer, CourseWithLogsSerializer
+    NextModuleSerializer, CourseWithLogsSerializer, module_content_prefetches
 )
 
 logger = logging.getLogger(__name__)
 
+# Campos de texto pesados que no necesita el listado de cursos
+COURSE_LIST_DEFERRED_FIELDS = [
+    'user_prompt', 'user_interests', 'module_list', 'topics', 'prerequisites',
+    'podcast_script', 'introduction', 'final_project_data',
+]
 
-class CourseViewSet(viewsets.ModelViewSet):
+
+class CourseCursorPagination(CursorPagination):
+    """
+    Paginación por cursor sobre (created_at, id) para el listado de cursos
+    
+    A diferencia de PageNumberPagination no usa OFFSET ni COUNT(*): cada página
+    continúa desde la última fila de la anterior usando el índice de
+    created_at, así el coste no crece con el número de cursos.
+    """
+    ordering = ('-created_at', '-id')
+
+
+class CourseViewSet(FieldSelectionMixin, viewsets.ModelViewSet):
     """
     ViewSet principal para gestión de cursos del sistema P2C
     
     Endpoints disponibles:
+    - GET /api/courses/ - Listar cursos (?status=, ?level=, paginado por cursor)
     - POST /api/courses/ - Crear nuevo curso (Fase 1)
     - GET /api/courses/{id}/ - Obtener curso completo
     - GET /api/courses/{id}/status/ - Monitorear estado de generación
     - POST /api/courses/{id}/start_course/ - Iniciar curso (Fase 3)
     - POST /api/courses/{id}/next_module/ - Navegar módulos
     - GET /api/courses/{id}/metadata/ - Obtener solo metadata
+    
+    El listado y el detalle aceptan ?fields= (p. ej.
+    fields=title,modules.title,modules.chunks.title) y ?expand= (relaciones
+    anidadas a incluir, p. ej. expand=modules).
     """
     
     queryset = Course.objects.all()
     permission_classes = [AllowAny]  # Para MVP, sin autenticación
+    pagination_class = CourseCursorPagination
+    
+    def get_queryset(self):
+        """Cargar de una vez las relaciones que serializa cada acción (evita N+1)"""
+        queryset = Course.objects.all()
+        selection = self.get_field_selection()
+        
+        if self.action == 'list':
+            queryset = self._filter_list(queryset)
+            if selection is None:
+                queryset = queryset.defer(*COURSE_LIST_DEFERRED_FIELDS)
+            else:
+                queryset = self.select_queryset(queryset, extra_fields=['created_at'])  # Orden del cursor
+            return queryset.annotate(modules_count=Count('modules'))
+        if selection is not None:
+            return self.select_queryset(queryset)
+        if self.action in ['retrieve', 'logs']:
+            queryset = queryset.prefetch_related(*module_content_prefetches('modules__'))
+        if self.action == 'logs':
+            queryset = queryset.prefetch_related('logs')
+        
+        return queryset
+    
+    def _filter_list(self, queryset):
+        """
+        Filtros del listado: ?status= y ?level= (ambos con índice en Course)
+        """
+        filters = {
+            'status': ('status', Course.StatusChoices),
+            'level': ('user_level', Course.LevelChoices),
+        }
+        for param, (field, choices) in filters.items():
+            value = self.request.query_params.get(param)
+            if value is None:
+                continue
+            if value not in choices.values:
+                raise ValidationError({param: f"Valor inválido. Opciones: {', '.join(choices.values)}"})
+            queryset = queryset.filter(**{field: value})
+        return queryset
     
     def get_serializer_class(self):
         """Seleccionar serializer según la acción"""
@@ -83,6 +158,17 @@ class CourseViewSet(viewsets.ModelViewSet):
             
             logger.info(f"Curso creado: {course.id}")
             
+            # Reutilizar un curso casi idéntico en lugar de regenerarlo
+            if settings.COURSE_REUSE_ENABLED:
+                reused_course = self._reuse_similar_course(course)
+                if reused_course:
+                    return Response({
+                        'id': str(course.id),
+                        'status': course.status,
+                        'title': course.title or None,
+                        'message': 'Curso creado exitosamente a partir de un curso similar.'
+                    }, status=status.HTTP_201_CREATED)
+            
             # Iniciar tarea asíncrona de generación de metadata (Fase 1)
             generate_course_metadata.delay(str(course.id))
             
@@ -103,14 +189,58 @@ class CourseViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
     
+    def _reuse_similar_course(self, course):
+        """
+        Clonar un curso completo casi idéntico (mismo nivel) si existe
+        """
+        match = course_similarity_service.find_similar_course(
+            prompt=course.user_prompt,
+            level=course.user_level,
+            interests=course.user_interests
+        )
+        if not match:
+            return None
+        
+        source, similarity = match
+        persistence_service.clone_course(source, course)
+        status_event_service.publish(course, chunks_ready=course.get_ready_chunks_count(module_order=1))
+        course_snapshot_service.refresh(course)
+        
+        GenerationLog.objects.create(
+            course=course,
+            action=GenerationLog.ActionChoices.COMPLETION,
+            message=f"Curso reutilizado a partir de {source.course_id}",
+            details={'source_course': str(source.id), 'similarity': round(similarity, 4)}
+        )
+        
+        logger.info(f"Curso {course.id} clonado desde {source.id} (similitud {similarity:.2f})")
+        return course
+    
     def retrieve(self, request, pk=None):
         """
         Obtener curso completo con todos los módulos generados
         
         GET /api/courses/{id}/
+        
+        Los cursos completos se sirven desde su snapshot precalculado (con ETag
+        y caché HTTP); el snapshot se genera aquí si aún no existe. Con ?fields=
+        o ?expand= se serializa solo lo pedido desde la base de datos.
         """
         try:
-            course = get_object_or_404(Course, pk=pk)
+            use_snapshot = course_snapshot_service.enabled and self.get_field_selection() is None
+            
+            if use_snapshot:
+                snapshot = CourseSnapshot.objects.filter(course_id=pk).first()
+                if snapshot is not None:
+                    return self._snapshot_response(request, snapshot)
+            
+            course = get_object_or_404(self.get_queryset(), pk=pk)
+            
+            if use_snapshot and course.status == Course.StatusChoices.COMPLETE:
+                snapshot = course_snapshot_service.refresh(course)
+                if snapshot is not None:
+                    return self._snapshot_response(request, snapshot)
+            
             serializer = self.get_serializer(course)
             
             return Response(serializer.data)
@@ -122,6 +252,39 @@ class CourseViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
     
+    def _snapshot_response(self, request, snapshot):
+        """
+        Respuesta con el JSON del snapshot: 304 si If-None-Match coincide, el
+        cuerpo gzip tal cual si el cliente lo acepta y descomprimido si no
+        
+        Cada codificación es una representación distinta con su propio ETag
+        fuerte (sufijo -gzip para el cuerpo comprimido).
+        """
+        accepts_gzip = 'gzip' in request.META.get('HTTP_ACCEPT_ENCODING', '')
+        etag = f'"{snapshot.content_hash}-gzip"' if accepts_gzip else f'"{snapshot.content_hash}"'
+        response = get_conditional_response(request, etag=etag)
+        
+        if response is None:
+            data = bytes(snapshot.data)
+            if accepts_gzip:
+                response = HttpResponse(data, content_type='application/json')
+                response['Content-Encoding'] = 'gzip'
+            else:
+                response = HttpResponse(gzip.decompress(data), content_type='application/json')
+        
+        response['ETag'] = etag
+        response['Cache-Control'] = f'public, max-age={settings.COURSE_SNAPSHOT_MAX_AGE}'
+        patch_vary_headers(response, ['Accept-Encoding'])
+        return response
+    
+    def perform_destroy(self, instance):
+        """
+        Eliminar curso cancelando su pre-generación pendiente
+        """
+        cancel_module_prefetch(str(instance.id))
+        status_event_service.forget(instance.id)
+        instance.delete()
+    
     @action(detail=True, methods=['get'])
     def status(self, request, pk=None):
         """
@@ -135,12 +298,22 @@ class CourseViewSet(viewsets.ModelViewSet):
         {"status": "ready"}               - Listo para consumir (metadata + módulo 1)
         {"status": "complete"}           - Curso completo
         {"status": "failed"}             - Error en generación
+        
+        Se sirve desde el registro de estado en Redis y admite If-None-Match
+        (304 sin cuerpo si el estado no cambió).
         """
         try:
-            course = get_object_or_404(Course, pk=pk)
-            serializer = CourseStatusSerializer(course)
+            course_status = status_event_service.get_status(pk)
+            if course_status is None:
+                course_status = status_event_service.status_from_course(get_object_or_404(Course, pk=pk))
             
-            return Response(serializer.data)
+            etag = status_event_service.etag(course_status)
+            response = get_conditional_response(request, etag=etag) or Response({
+                field: course_status[field] for field in CourseStatusSerializer.Meta.fields
+            })
+            response['ETag'] = etag
+            response['Cache-Control'] = 'no-cache'
+            return response
             
         except Exception as e:
             logger.error(f"Error obteniendo status del curso {pk}: {e}")
@@ -235,6 +408,7 @@ class CourseViewSet(viewsets.ModelViewSet):
             serializer.is_valid(raise_exception=True)
             
             target_module = serializer.validated_data['target_module']
+            prefetch_related_objects([target_module], *module_content_prefetches())
             module_serializer = ModuleDetailSerializer(target_module)
             
             return Response(module_serializer.data)
@@ -267,7 +441,7 @@ class CourseViewSet(viewsets.ModelViewSet):
                 )
             
             previous_module = get_object_or_404(
-                course.modules, 
+                course.modules.prefetch_related(*module_content_prefetches()), 
                 module_order=current_order - 1
             )
             
@@ -289,7 +463,7 @@ class CourseViewSet(viewsets.ModelViewSet):
         GET /api/courses/{id}/logs/
         """
         try:
-            course = get_object_or_404(Course, pk=pk)
+            course = get_object_or_404(self.get_queryset(), pk=pk)
             serializer = CourseWithLogsSerializer(course)
             
             return Response(serializer.data)
@@ -302,18 +476,24 @@ class CourseViewSet(viewsets.ModelViewSet):
             )
 
 
-class ModuleViewSet(viewsets.ReadOnlyModelViewSet):
+class ModuleViewSet(FieldSelectionMixin, viewsets.ReadOnlyModelViewSet):
     """
     ViewSet para acceso a módulos individuales
     
     Endpoints:
-    - GET /api/modules/{id}/ - Obtener módulo específico
+    - GET /api/modules/{id}/ - Obtener módulo específico (acepta ?fields= y ?expand=)
     """
     
     queryset = Module.objects.all()
     serializer_class = ModuleDetailSerializer
     permission_classes = [AllowAny]
     
+    def get_queryset(self):
+        """Módulo con su curso, chunks (y videos) y quizzes en tres consultas"""
+        if self.get_field_selection() is not None:
+            return self.select_queryset(Module.objects.all())
+        return Module.objects.select_related('course').prefetch_related(*module_content_prefetches())
+    
     def retrieve(self, request, pk=None):
         """
         Obtener módulo específico con todo su contenido
@@ -321,7 +501,7 @@ class ModuleViewSet(viewsets.ReadOnlyModelViewSet):
         GET /api/modules/{id}/
         """
         try:
-            module = get_object_or_404(Module, pk=pk)
+            module = get_object_or_404(self.get_queryset(), pk=pk)
             serializer = self.get_serializer(module)
             
             return Response(serializer.data)
@@ -350,7 +530,11 @@ class UserProgressViewSet(viewsets.ModelViewSet):
     
     def get_queryset(self):
         """Filtrar por usuario si está autenticado"""
-        queryset = UserProgress.objects.all()
+        # completed_chunks sale de las completions precargadas (una consulta para todas las filas)
+        completions = ChunkCompletion.objects.select_related('chunk').only('progress_id', 'completed_at', 'chunk__chunk_id')
+        queryset = UserProgress.objects.select_related('course', 'current_module').prefetch_related(
+            Prefetch('completions', queryset=completions)
+        )
         
         # TODO: Filtrar por usuario cuando se implemente autenticación
         # if self.request.user.is_authenticated:
@@ -368,15 +552,13 @@ class UserProgressViewSet(viewsets.ModelViewSet):
             "chunk_id": "modulo_1_chunk_1"
         }
         """
+        course = get_object_or_404(Course, pk=pk)
+        
+        serializer = MarkChunkCompleteSerializer(data=request.data, context={'course': course})
+        serializer.is_valid(raise_exception=True)
+        chunk = serializer.validated_data['chunk']
+        
         try:
-            course = get_object_or_404(Course, pk=pk)
-            
-            serializer = MarkChunkCompleteSerializer(data=request.data)
-            serializer.is_valid(raise_exception=True)
-            
-            chunk_id = serializer.validated_data['chunk_id']
-            chunk = get_object_or_404(Chunk, chunk_id=chunk_id)
-            
             # Obtener o crear progreso del usuario
             # TODO: Usar usuario real cuando se implemente autenticación
             progress, created = UserProgress.objects.get_or_create(
@@ -387,24 +569,32 @@ class UserProgressViewSet(viewsets.ModelViewSet):
                     'current_chunk': chunk
                 }
             )
-            
-            # Agregar chunk a completados si no está ya
-            if chunk_id not in progress.completed_chunks:
-                progress.completed_chunks.append(chunk_id)
-                progress.current_chunk = chunk
-                progress.current_module = chunk.module
-                progress.last_accessed = timezone.now()
-                progress.save()
-            
-            # Verificar si el curso está completo
-            total_chunks = sum(
-                module.chunks.count() 
-                for module in course.modules.all()
+            progress.course = course  # Ya cargado, evita otra consulta al serializar
+            
+            # Registrar el chunk como completado; una fila por progreso y chunk,
+            # así marcarlo dos veces (o desde dos pestañas) no duplica ni pisa nada.
+            # El contador solo avanza si la fila se insertó de verdad
+            try:
+                with transaction.atomic():
+                    ChunkCompletion.objects.create(progress=progress, chunk=chunk)
+                    UserProgress.objects.filter(pk=progress.pk).update(completed_count=F('completed_count') + 1)
+            except IntegrityError:
+                pass  # Ya estaba completado
+            
+            progress.current_chunk = chunk
+            progress.current_module = chunk.module
+            progress.last_accessed = timezone.now()
+            UserProgress.objects.filter(pk=progress.pk).update(
+                current_chunk=chunk,
+                current_module=chunk.module,
+                last_accessed=progress.last_accessed
             )
+            progress.refresh_from_db(fields=['completed_count'])
             
-            if len(progress.completed_chunks) >= total_chunks:
+            # Verificar si el curso está completo
+            if progress.completed_at is None and progress.completed_count >= course.total_chunks:
                 progress.completed_at = timezone.now()
-                progress.save()
+                UserProgress.objects.filter(pk=progress.pk).update(completed_at=progress.completed_at)
             
             response_serializer = UserProgressSerializer(progress)
             return Response(response_serializer.data)
@@ -415,3 +605,22 @@ class UserProgressViewSet(viewsets.ModelViewSet):
                 {'error': 'Error marcando chunk como completado'},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
+
+
+class GenerationQueueViewSet(viewsets.ViewSet):
+    """
+    Métricas de las colas de generación
+    
+    GET /api/queues/ - Tareas pendientes en las colas interactive y bulk
+    """
+    
+    permission_classes = [AllowAny]
+    
+    def list(self, request):
+        depths = queue_metrics_service.get_queue_depths()
+        
+        return Response({
+            'queues': depths,
+            'concurrency': settings.CELERY_WORKER_QUEUE_CONCURRENCY,
+            'timestamp': timezone.now()
+        })
@@ -1,5 +1,6 @@
 import os
 from celery import Celery
+from celery.signals import celeryd_init, worker_process_shutdown
 from django.conf import settings
 
 # Configurar el módulo de configuración predeterminado de Django para Celery
@@ -25,6 +26,37 @@ app.conf.update(
     task_reject_on_worker_lost=True,
 )
 
+
+@celeryd_init.connect
+def configure_queue_concurrency(sender=None, conf=None, options=None, **kwargs):
+    """
+    Concurrencia por cola
+    
+    Un worker que consume una sola cola (celery -A config worker -Q interactive)
+    usa la concurrencia de CELERY_WORKER_QUEUE_CONCURRENCY para esa cola, salvo
+    que se indique -c explícitamente.
+    """
+    options = options or {}
+    queues = options.get('queues') or []
+    if isinstance(queues, str):
+        queues = queues.split(',')
+    
+    if options.get('concurrency') or len(queues) != 1:
+        return
+    
+    concurrency = settings.CELERY_WORKER_QUEUE_CONCURRENCY.get(queues[0])
+    if concurrency:
+        conf.worker_concurrency = concurrency
+
+
+@worker_process_shutdown.connect
+def close_event_loop(**kwargs):
+    """
+    Cerrar el event loop persistente (y el cliente de Anthropic) del proceso
+    """
+    from generation.services.worker_loop import close_worker_loop
+    close_worker_loop()
+
 @app.task(bind=True)
 def debug_task(self):
     print(f'Request: {self.request!r}') 
\ No newline at end of file
@@ -143,6 +143,21 @@ CORS_ALLOW_CREDENTIALS = True
 # AI Services Configuration
 ANTHROPIC_API_KEY = env('ANTHROPIC_API_KEY', default='')
 CLAUDE_API_KEY = env('CLAUDE_API_KEY', default='')
+# Pool de conexiones HTTP del cliente async de Anthropic (por proceso worker)
+ANTHROPIC_MAX_CONNECTIONS = env.int('ANTHROPIC_MAX_CONNECTIONS', default=20)
+ANTHROPIC_MAX_KEEPALIVE_CONNECTIONS = env.int('ANTHROPIC_MAX_KEEPALIVE_CONNECTIONS', default=10)
+ANTHROPIC_TIMEOUT = env.float('ANTHROPIC_TIMEOUT', default=600.0)
+# Prompt caching del prefijo común (contexto del curso) en prompts de módulos y proyecto final
+ANTHROPIC_PROMPT_CACHING_ENABLED = env.bool('ANTHROPIC_PROMPT_CACHING_ENABLED', default=True)
+# Límites compartidos por todos los workers (token bucket en Redis)
+ANTHROPIC_RATE_LIMIT_ENABLED = env.bool('ANTHROPIC_RATE_LIMIT_ENABLED', default=True)
+ANTHROPIC_RATE_LIMIT_REDIS_URL = env('ANTHROPIC_RATE_LIMIT_REDIS_URL', default=env('CACHE_URL', default='redis://localhost:6379/1'))
+ANTHROPIC_REQUESTS_PER_MINUTE = env.int('ANTHROPIC_REQUESTS_PER_MINUTE', default=50)
+ANTHROPIC_TOKENS_PER_MINUTE = env.int('ANTHROPIC_TOKENS_PER_MINUTE', default=80000)
+# Reintentos ante 429/5xx/errores de red (backoff exponencial con jitter)
+ANTHROPIC_MAX_RETRIES = env.int('ANTHROPIC_MAX_RETRIES', default=5)
+ANTHROPIC_RETRY_BASE_DELAY = env.float('ANTHROPIC_RETRY_BASE_DELAY', default=1.0)
+ANTHROPIC_RETRY_MAX_DELAY = env.float('ANTHROPIC_RETRY_MAX_DELAY', default=60.0)
 
 # YouTube API Configuration
 YOUTUBE_DATA_API_KEY = env('YOUTUBE_DATA_API_KEY', default='')
@@ -165,6 +180,72 @@ CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = TIME_ZONE
+# Colas: 'interactive' para lo que el usuario está esperando (metadata y
+# módulo 1) y 'bulk' para el trabajo en segundo plano (fase 3, videos, lotes,
+# limpieza). Cada cola se atiende con workers propios (-Q interactive / -Q bulk).
+GENERATION_INTERACTIVE_QUEUE = 'interactive'
+GENERATION_BULK_QUEUE = 'bulk'
+CELERY_TASK_DEFAULT_QUEUE = GENERATION_BULK_QUEUE
+CELERY_TASK_ROUTES = {
+    'generation.tasks.generate_course_metadata': {'queue': GENERATION_INTERACTIVE_QUEUE},
+    'generation.tasks.generate_module_1': {'queue': GENERATION_INTERACTIVE_QUEUE},
+    'generation.tasks.*': {'queue': GENERATION_BULK_QUEUE},
+}
+CELERY_WORKER_QUEUE_CONCURRENCY = {
+    GENERATION_INTERACTIVE_QUEUE: env.int('CELERY_INTERACTIVE_CONCURRENCY', default=4),
+    GENERATION_BULK_QUEUE: env.int('CELERY_BULK_CONCURRENCY', default=2),
+}
+# Prioridades de tareas con Redis como broker (0 = máxima, 9 = mínima)
+CELERY_BROKER_TRANSPORT_OPTIONS = {
+    'priority_steps': list(range(10)),
+    'sep': ':',
+    'queue_order_strategy': 'priority',
+}
+
+# Course Generation Configuration
+# Máximo de módulos generados en paralelo por cada worker (1 = secuencial)
+GENERATION_MODULE_CONCURRENCY = env.int('GENERATION_MODULE_CONCURRENCY', default=3)
+# Repartir la fase 3 como un chord de tareas generate_module (un módulo por tarea)
+GENERATION_USE_CHORD = env.bool('GENERATION_USE_CHORD', default=False)
+# Búsquedas de YouTube simultáneas por módulo
+GENERATION_VIDEO_CONCURRENCY = env.int('GENERATION_VIDEO_CONCURRENCY', default=4)
+# Diferir la búsqueda de videos a una tarea aparte (el módulo queda listo antes)
+GENERATION_DEFER_VIDEOS = env.bool('GENERATION_DEFER_VIDEOS', default=False)
+# Generar el módulo 1 en streaming, guardando cada chunk en cuanto se completa
+GENERATION_STREAM_MODULE_1 = env.bool('GENERATION_STREAM_MODULE_1', default=False)
+# Pre-generar el módulo 2 con prioridad baja en cuanto el curso está READY
+GENERATION_PREFETCH_MODULE_2 = env.bool('GENERATION_PREFETCH_MODULE_2', default=True)
+GENERATION_PREFETCH_PRIORITY = env.int('GENERATION_PREFETCH_PRIORITY', default=9)  # 0 = máxima, 9 = mínima
+GENERATION_PREFETCH_EXPIRES = env.int('GENERATION_PREFETCH_EXPIRES', default=60 * 30)  # segundos en cola
+# Tiempo máximo que un módulo queda marcado como "en generación"
+GENERATION_MODULE_LOCK_TIMEOUT = env.int('GENERATION_MODULE_LOCK_TIMEOUT', default=60 * 10)
+# Intentos por etapa (metadata, cada módulo, proyecto final) antes de darla por fallida
+GENERATION_MAX_STEP_ATTEMPTS = env.int('GENERATION_MAX_STEP_ATTEMPTS', default=3)
+
+# Eventos de estado de la generación (Redis pub/sub) servidos por SSE en /course/<id>/events/,
+# y registro de estado en Redis del que leen los endpoints de polling
+GENERATION_STATUS_EVENTS_ENABLED = env.bool('GENERATION_STATUS_EVENTS_ENABLED', default=True)
+GENERATION_STATUS_REDIS_URL = env('GENERATION_STATUS_REDIS_URL', default=env('CACHE_URL', default='redis://localhost:6379/1'))
+GENERATION_SSE_KEEPALIVE = env.int('GENERATION_SSE_KEEPALIVE', default=15)  # segundos entre comentarios keep-alive
+GENERATION_SSE_MAX_DURATION = env.int('GENERATION_SSE_MAX_DURATION', default=60 * 10)  # el navegador reconecta al cerrar
+# Vida del registro de estado en Redis que sirve el polling (desde el último cambio)
+GENERATION_STATUS_RECORD_TTL = env.int('GENERATION_STATUS_RECORD_TTL', default=60 * 60 * 24)
+
+# Generación offline por lotes (Message Batches API); 'stub' usa un backend local sin red
+ANTHROPIC_BATCH_BACKEND = env('ANTHROPIC_BATCH_BACKEND', default='anthropic')
+ANTHROPIC_BATCH_BASE_URL = env('ANTHROPIC_BATCH_BASE_URL', default='')
+GENERATION_BATCH_MAX_COURSES = env.int('GENERATION_BATCH_MAX_COURSES', default=100)
+GENERATION_BATCH_POLL_INTERVAL = env.int('GENERATION_BATCH_POLL_INTERVAL', default=60)  # segundos
+
+# Reutilización de cursos casi idénticos (índice de similitud local)
+COURSE_REUSE_ENABLED = env.bool('COURSE_REUSE_ENABLED', default=False)
+COURSE_REUSE_THRESHOLD = env.float('COURSE_REUSE_THRESHOLD', default=0.85)
+COURSE_REUSE_INDEX_TTL = env.int('COURSE_REUSE_INDEX_TTL', default=300)  # segundos
+COURSE_REUSE_INDEX_SIZE = env.int('COURSE_REUSE_INDEX_SIZE', default=5000)
+
+# Snapshots JSON precalculados de cursos completos (GET /api/courses/{id}/)
+COURSE_SNAPSHOT_ENABLED = env.bool('COURSE_SNAPSHOT_ENABLED', default=True)
+COURSE_SNAPSHOT_MAX_AGE = env.int('COURSE_SNAPSHOT_MAX_AGE', default=60 * 60 * 24)  # segundos de caché HTTP
 
 # Cache configuration
 CACHES = {
@@ -174,6 +255,30 @@ CACHES = {
     }
 }
 
+# Caché de respuestas de Claude: Redis por defecto o en disco si se define
+# ANTHROPIC_RESPONSE_CACHE_DIR. La expulsión por tamaño (allkeys-lru) necesita un
+# Redis propio (ANTHROPIC_RESPONSE_CACHE_URL): en el Redis compartido expulsaría
+# también las colas de Celery, los chords, los bloqueos y el rate limiter
+ANTHROPIC_RESPONSE_CACHE_ENABLED = env.bool('ANTHROPIC_RESPONSE_CACHE_ENABLED', default=True)
+ANTHROPIC_RESPONSE_CACHE_ALIAS = 'anthropic_responses'
+ANTHROPIC_RESPONSE_CACHE_DIR = env('ANTHROPIC_RESPONSE_CACHE_DIR', default='')
+
+CACHES[ANTHROPIC_RESPONSE_CACHE_ALIAS] = {
+    'BACKEND': (
+        'django.core.cache.backends.filebased.FileBasedCache'
+        if ANTHROPIC_RESPONSE_CACHE_DIR else
+        'django.core.cache.backends.redis.RedisCache'
+    ),
+    'LOCATION': ANTHROPIC_RESPONSE_CACHE_DIR or env(
+        'ANTHROPIC_RESPONSE_CACHE_URL', default=env('CACHE_URL', default='redis://localhost:6379/1')
+    ),
+    'KEY_PREFIX': 'p2c',
+    'TIMEOUT': env.int('ANTHROPIC_RESPONSE_CACHE_TTL', default=60 * 60 * 24 * 7),  # 7 días
+    'OPTIONS': {} if not ANTHROPIC_RESPONSE_CACHE_DIR else {
+        'MAX_ENTRIES': env.int('ANTHROPIC_RESPONSE_CACHE_MAX_ENTRIES', default=1000),
+    },
+}
+
 # Debug Toolbar configuration
 INTERNAL_IPS = [
     '127.0.0.1',
@@ -33,6 +33,7 @@ urlpatterns = [
     path('course/<uuid:course_id>/metadata/', course_views.course_metadata, name='course_metadata'),
     path('course/<uuid:course_id>/module/<str:module_id>/', course_views.module_view, name='module_view'),
     path('course/<uuid:course_id>/status/', course_views.course_status, name='course_status'),
+    path('course/<uuid:course_id>/events/', course_views.course_events, name='course_events'),
     
     # Demo course creation (sin APIs externas)
     path('demo-create-course/', course_views.simple_course_create, name='demo_create_course'),
@@ -1,9 +1,43 @@
 from django.contrib import admin
-from .models import Course, Module, Chunk, Video, Quiz, UserProgress, GenerationLog
+from .models import (
+    Course, Module, Chunk, Video, Quiz, UserProgress, ChunkCompletion, GenerationLog, GenerationBatch, GenerationStep
+)
+from generation.services.snapshot_service import course_snapshot_service
+from generation.services.status_events import status_event_service
+
+
+class CourseSnapshotAdminMixin:
+    """
+    Regenerar el snapshot del curso al editar su contenido desde el admin
+    
+    También publica el estado: el polling lo lee del registro de Redis, que solo
+    se actualiza con publish().
+    """
+    
+    def snapshot_course(self, obj):
+        return obj.course
+    
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        course = self.snapshot_course(obj)
+        course.refresh_from_db()  # Contadores actualizados con F() durante el guardado
+        course_snapshot_service.refresh(course)
+        status_event_service.publish(course)
+    
+    def delete_model(self, request, obj):
+        course = self.snapshot_course(obj)
+        course_id = course.id  # delete() deja el pk a None
+        super().delete_model(request, obj)
+        if course is obj:
+            status_event_service.forget(course_id)
+            return
+        course.refresh_from_db()
+        course_snapshot_service.refresh(course)
+        status_event_service.publish(course)
 
 
 @admin.register(Course)
-class CourseAdmin(admin.ModelAdmin):
+class CourseAdmin(CourseSnapshotAdminMixin, admin.ModelAdmin):
     list_display = ['title', 'course_id', 'status', 'user_level', 'created_at', 'get_progress_percentage']
     list_filter = ['status', 'user_level', 'created_at']
     search_fields = ['title', 'course_id', 'user_prompt']
@@ -26,10 +60,19 @@ class CourseAdmin(admin.ModelAdmin):
             'fields': ('created_at', 'updated_at', 'completed_at')
         }),
     )
+    
+    def snapshot_course(self, obj):
+        return obj
+    
+    def delete_queryset(self, request, queryset):
+        course_ids = list(queryset.values_list('id', flat=True))
+        super().delete_queryset(request, queryset)
+        for course_id in course_ids:
+            status_event_service.forget(course_id)
 
 
 @admin.register(Module)
-class ModuleAdmin(admin.ModelAdmin):
+class ModuleAdmin(CourseSnapshotAdminMixin, admin.ModelAdmin):
     list_display = ['title', 'course', 'module_order', 'created_at']
     list_filter = ['course', 'created_at']
     search_fields = ['title', 'description']
@@ -49,30 +92,63 @@ class ModuleAdmin(admin.ModelAdmin):
             'fields': ('created_at', 'updated_at')
         }),
     )
+    
+    def delete_queryset(self, request, queryset):
+        for module in queryset:
+            module.delete()  # Module.delete() mantiene los contadores
 
 
 @admin.register(Chunk)
-class ChunkAdmin(admin.ModelAdmin):
+class ChunkAdmin(CourseSnapshotAdminMixin, admin.ModelAdmin):
     list_display = ['__str__', 'chunk_order', 'total_chunks', 'created_at']
     list_filter = ['module__course', 'created_at']
     search_fields = ['content']
     readonly_fields = ['id', 'created_at', 'updated_at']
+    
+    def snapshot_course(self, obj):
+        return obj.module.course
+    
+    def save_model(self, request, obj, form, change):
+        # Antes de que el mixin regenere el snapshot
+        if not change:
+            obj.module.add_chunks(1)
+        elif 'module' in form.changed_data:
+            Module.objects.get(pk=form.initial['module']).add_chunks(-1)
+            obj.module.add_chunks(1)
+        super().save_model(request, obj, form, change)
+    
+    def delete_queryset(self, request, queryset):
+        for chunk in queryset:
+            chunk.delete()  # Chunk.delete() mantiene los contadores
 
 
 @admin.register(Video)
-class VideoAdmin(admin.ModelAdmin):
+class VideoAdmin(CourseSnapshotAdminMixin, admin.ModelAdmin):
     list_display = ['title', 'video_id', 'duration', 'view_count', 'created_at']
     list_filter = ['created_at']
     search_fields = ['title', 'video_id']
     readonly_fields = ['id', 'created_at', 'updated_at']
+    
+    def snapshot_course(self, obj):
+        return obj.chunk.module.course
 
 
 @admin.register(Quiz)
-class QuizAdmin(admin.ModelAdmin):
+class QuizAdmin(CourseSnapshotAdminMixin, admin.ModelAdmin):
     list_display = ['__str__', 'question', 'correct_answer', 'created_at']
     list_filter = ['module__course', 'created_at']
     search_fields = ['question']
     readonly_fields = ['id', 'created_at']
+    
+    def snapshot_course(self, obj):
+        return obj.module.course
+
+
+class ChunkCompletionInline(admin.TabularInline):
+    model = ChunkCompletion
+    extra = 0
+    raw_id_fields = ['chunk']
+    readonly_fields = ['completed_at']
 
 
 @admin.register(UserProgress)
@@ -80,7 +156,16 @@ class UserProgressAdmin(admin.ModelAdmin):
     list_display = ['user', 'course', 'get_completion_percentage', 'started_at', 'last_accessed']
     list_filter = ['course', 'started_at', 'completed_at']
     search_fields = ['user__username', 'course__title']
-    readonly_fields = ['id', 'started_at', 'last_accessed']
+    readonly_fields = ['id', 'started_at', 'last_accessed', 'completed_count']
+    list_select_related = ['user', 'course']
+    inlines = [ChunkCompletionInline]
+    
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        # El inline añade o borra ChunkCompletion sin pasar por la API
+        obj = form.instance
+        obj.completed_count = obj.completions.count()
+        UserProgress.objects.filter(pk=obj.pk).update(completed_count=obj.completed_count)
 
 
 @admin.register(GenerationLog)
@@ -92,3 +177,19 @@ class GenerationLogAdmin(admin.ModelAdmin):
     
     def has_add_permission(self, request):
         return False  # Solo lectura, los logs se crean automáticamente
+
+
+@admin.register(GenerationBatch)
+class GenerationBatchAdmin(admin.ModelAdmin):
+    list_display = ['batch_id', 'status', 'request_count', 'created_at', 'completed_at']
+    list_filter = ['status', 'created_at']
+    search_fields = ['batch_id']
+    readonly_fields = ['id', 'created_at', 'completed_at']
+
+
+@admin.register(GenerationStep)
+class GenerationStepAdmin(admin.ModelAdmin):
+    list_display = ['course', 'stage', 'module_number', 'status', 'attempts', 'updated_at']
+    list_filter = ['stage', 'status']
+    search_fields = ['course__title', 'last_error']
+    readonly_fields = ['started_at', 'finished_at', 'updated_at']
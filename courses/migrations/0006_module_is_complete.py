@@ -0,0 +1,18 @@
+# Generated by Django 5.2.1 on 2026-10-17 02:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0005_add_database_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='module',
+            name='is_complete',
+            field=models.BooleanField(default=True),
+        ),
+    ]
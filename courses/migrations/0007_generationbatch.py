@@ -0,0 +1,32 @@
+# Generated by Django 5.2.1 on 2026-10-17 02:32
+
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0006_module_is_complete'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GenerationBatch',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('batch_id', models.CharField(max_length=100, unique=True)),
+                ('status', models.CharField(choices=[('submitted', 'Enviado'), ('complete', 'Completado'), ('failed', 'Error')], default='submitted', max_length=20)),
+                ('request_count', models.PositiveIntegerField(default=0)),
+                ('details', models.JSONField(blank=True, default=dict)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('completed_at', models.DateTimeField(blank=True, null=True)),
+                ('courses', models.ManyToManyField(blank=True, related_name='generation_batches', to='courses.course')),
+            ],
+            options={
+                'verbose_name': 'Lote de Generación',
+                'verbose_name_plural': 'Lotes de Generación',
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.1 on 2026-10-17 02:38
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0007_generationbatch'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GenerationStep',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('stage', models.CharField(choices=[('metadata', 'Metadata'), ('module', 'Módulo'), ('final_project', 'Proyecto Final')], max_length=20)),
+                ('module_number', models.PositiveIntegerField(default=0)),
+                ('status', models.CharField(choices=[('pending', 'Pendiente'), ('running', 'En Progreso'), ('done', 'Completado'), ('failed', 'Error')], default='pending', max_length=20)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('last_error', models.TextField(blank=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('course', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='generation_steps', to='courses.course')),
+            ],
+            options={
+                'verbose_name': 'Paso de Generación',
+                'verbose_name_plural': 'Pasos de Generación',
+                'ordering': ['stage', 'module_number'],
+                'constraints': [models.UniqueConstraint(fields=('course', 'stage', 'module_number'), name='unique_generation_step')],
+            },
+        ),
+    ]
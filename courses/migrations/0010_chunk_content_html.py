@@ -0,0 +1,23 @@
+# Generated by Django 5.2.1 on 2026-10-17 02:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0009_coursesnapshot'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chunk',
+            name='content_html',
+            field=models.TextField(blank=True),
+        ),
+        migrations.AddField(
+            model_name='chunk',
+            name='content_html_checksum',
+            field=models.CharField(blank=True, max_length=32),
+        ),
+    ]
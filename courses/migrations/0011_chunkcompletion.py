@@ -0,0 +1,67 @@
+# Generated by Django 5.2.1 on 2026-10-17 02:50
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+def copy_completed_chunks(apps, schema_editor):
+    """Pasar la lista JSON completed_chunks de cada progreso a filas ChunkCompletion"""
+    UserProgress = apps.get_model('courses', 'UserProgress')
+    Chunk = apps.get_model('courses', 'Chunk')
+    ChunkCompletion = apps.get_model('courses', 'ChunkCompletion')
+    
+    for progress in UserProgress.objects.iterator():
+        chunk_ids = [chunk_id for chunk_id in progress.completed_chunks or [] if isinstance(chunk_id, str)]
+        if not chunk_ids:
+            continue
+        
+        chunks = Chunk.objects.filter(module__course_id=progress.course_id, chunk_id__in=chunk_ids)
+        ChunkCompletion.objects.bulk_create(
+            [ChunkCompletion(progress=progress, chunk=chunk) for chunk in chunks],
+            ignore_conflicts=True
+        )
+
+
+def restore_completed_chunks(apps, schema_editor):
+    """Reconstruir completed_chunks a partir de las filas ChunkCompletion"""
+    UserProgress = apps.get_model('courses', 'UserProgress')
+    ChunkCompletion = apps.get_model('courses', 'ChunkCompletion')
+    
+    completed = {}
+    for progress_id, chunk_id in ChunkCompletion.objects.order_by('completed_at').values_list(
+        'progress_id', 'chunk__chunk_id'
+    ):
+        completed.setdefault(progress_id, []).append(chunk_id)
+    
+    for progress_id, chunk_ids in completed.items():
+        UserProgress.objects.filter(pk=progress_id).update(completed_chunks=chunk_ids)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0010_chunk_content_html'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChunkCompletion',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('completed_at', models.DateTimeField(auto_now_add=True)),
+                ('chunk', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='completions', to='courses.chunk')),
+                ('progress', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='completions', to='courses.userprogress')),
+            ],
+            options={
+                'verbose_name': 'Chunk Completado',
+                'verbose_name_plural': 'Chunks Completados',
+                'constraints': [models.UniqueConstraint(fields=('progress', 'chunk'), name='unique_chunk_completion')],
+            },
+        ),
+        migrations.RunPython(copy_completed_chunks, restore_completed_chunks),
+        migrations.RemoveField(
+            model_name='userprogress',
+            name='completed_chunks',
+        ),
+    ]
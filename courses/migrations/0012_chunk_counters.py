@@ -0,0 +1,51 @@
+# Generated by Django 5.2.1 on 2026-10-17 02:52
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def fill_counters(apps, schema_editor):
+    """Calcular los contadores de los cursos, módulos y progresos existentes"""
+    Course = apps.get_model('courses', 'Course')
+    Module = apps.get_model('courses', 'Module')
+    Chunk = apps.get_model('courses', 'Chunk')
+    UserProgress = apps.get_model('courses', 'UserProgress')
+    ChunkCompletion = apps.get_model('courses', 'ChunkCompletion')
+    
+    def count_of(queryset, field):
+        return Coalesce(Subquery(
+            queryset.filter(**{field: OuterRef('pk')}).values(field).annotate(total=Count('pk')).values('total')
+        ), 0)
+    
+    Module.objects.update(total_chunks=count_of(Chunk.objects.all(), 'module'))
+    Course.objects.update(total_chunks=Coalesce(Subquery(
+        Module.objects.filter(course=OuterRef('pk')).values('course').annotate(total=Sum('total_chunks')).values('total')
+    ), 0))
+    UserProgress.objects.update(completed_count=count_of(ChunkCompletion.objects.all(), 'progress'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0011_chunkcompletion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='course',
+            name='total_chunks',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='module',
+            name='total_chunks',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='userprogress',
+            name='completed_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
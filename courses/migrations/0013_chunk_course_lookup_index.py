@@ -0,0 +1,17 @@
+# Generated by Django 5.2.1 on 2026-10-17 02:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0012_chunk_counters'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='chunk',
+            index=models.Index(fields=['module', 'chunk_id'], name='courses_chu_module__92cf5f_idx'),
+        ),
+    ]
@@ -1,9 +1,12 @@
 import uuid
 import json
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import User
 from django.utils import timezone
 from django.core.exceptions import ValidationError
+from django.utils.safestring import mark_safe
+
+from .rendering import content_checksum, render_markdown
 
 
 class Course(models.Model):
@@ -58,6 +61,9 @@ class Course(models.Model):
     total_size_estimate = models.CharField(max_length=100, blank=True)  # "~300KB contenido interactivo"
     language = models.CharField(max_length=10, default='es')
     
+    # Chunks guardados en todos los módulos (contador mantenido al persistir)
+    total_chunks = models.PositiveIntegerField(default=0)
+    
     def save(self, *args, **kwargs):
         if not self.course_id:
             self.course_id = f"course-{self.id}"
@@ -74,11 +80,44 @@ class Course(models.Model):
         if isinstance(self.topics, list) and len(self.topics) > 20:
             raise ValidationError("Máximo 20 temas permitidos")
     
+    def update_total_chunks(self):
+        """
+        Recalcular total_chunks sumando los contadores de los módulos
+        
+        Recuento completo para reparar el contador; la generación lo mantiene con
+        incrementos (Module.add_chunks) porque varios módulos se guardan a la vez.
+        """
+        self.total_chunks = self.modules.aggregate(total=models.Sum('total_chunks'))['total'] or 0
+        Course.objects.filter(pk=self.pk).update(total_chunks=self.total_chunks)
+    
+    def get_chunk(self, chunk_id):
+        """
+        Chunk del curso con ese chunk_id, o None
+        
+        chunk_id solo es único dentro de un curso ("modulo_1_chunk_1" existe en
+        todos), así que se busca a través de los módulos del curso usando el
+        índice (module, chunk_id).
+        """
+        return (
+            Chunk.objects.select_related('module')
+            .filter(module__course=self, chunk_id=chunk_id)
+            .order_by('module__module_order')
+            .first()
+        )
+    
+    def get_ready_chunks_count(self, module_order=1):
+        """Número de chunks ya disponibles del módulo indicado (útil durante el streaming)"""
+        ready = self.modules.filter(module_order=module_order).values_list('total_chunks', flat=True).first()
+        return ready or 0
+    
     def mark_complete(self):
-        """Marca el curso como completo"""
+        """Marca el curso como completo y publica el nuevo estado"""
+        from generation.services.status_events import status_event_service  # Importa este módulo
+        
         self.status = self.StatusChoices.COMPLETE
         self.completed_at = timezone.now()
         self.save()
+        status_event_service.publish(self)
     
     def get_progress_percentage(self):
         """Calcula el porcentaje de progreso del curso"""
@@ -133,6 +172,12 @@ class Module(models.Model):
     # Video representativo del módulo
     video_data = models.JSONField(default=dict, blank=True)  # Información del video principal
     
+    # False mientras el módulo se genera en streaming (chunks disponibles a medida que llegan)
+    is_complete = models.BooleanField(default=True)
+    
+    # Chunks guardados del módulo (contador mantenido al persistir)
+    total_chunks = models.PositiveIntegerField(default=0)
+    
     # Timestamps
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -150,6 +195,26 @@ class Module(models.Model):
     def __str__(self):
         return f"{self.course.title} - {self.title}"
 
+    def update_total_chunks(self):
+        """Recalcular total_chunks del módulo y del curso"""
+        self.total_chunks = self.chunks.count()
+        Module.objects.filter(pk=self.pk).update(total_chunks=self.total_chunks)
+        self.course.update_total_chunks()
+
+    def add_chunks(self, count):
+        """Sumar (o restar) chunks al contador del módulo y del curso con F()"""
+        Module.objects.filter(pk=self.pk).update(total_chunks=models.F('total_chunks') + count)
+        Course.objects.filter(pk=self.course_id).update(total_chunks=models.F('total_chunks') + count)
+
+    def delete(self, *args, **kwargs):
+        """Borrar el módulo descontando sus chunks del curso y sus completados del progreso"""
+        with transaction.atomic():
+            saved_chunks = Module.objects.filter(pk=self.pk).values_list('total_chunks', flat=True).first() or 0
+            _discount_completions(ChunkCompletion.objects.filter(chunk__module_id=self.pk))
+            result = super().delete(*args, **kwargs)
+            Course.objects.filter(pk=self.course_id).update(total_chunks=models.F('total_chunks') - saved_chunks)
+        return result
+
 
 class Chunk(models.Model):
     """Chunk de contenido dentro de un módulo"""
@@ -167,6 +232,10 @@ class Chunk(models.Model):
     content = models.TextField()  # Contenido markdown/texto del chunk
     checksum = models.CharField(max_length=32, blank=True)  # MD5 hash para verificación
     
+    # HTML del contenido ya renderizado; se regenera si cambia el contenido
+    content_html = models.TextField(blank=True)
+    content_html_checksum = models.CharField(max_length=32, blank=True)  # MD5 del contenido renderizado
+    
     # Timestamps
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -176,10 +245,37 @@ class Chunk(models.Model):
         verbose_name_plural = "Chunks"
         unique_together = ['module', 'chunk_order']
         ordering = ['chunk_order']
+        indexes = [
+            models.Index(fields=['module', 'chunk_id']),
+        ]
 
     def __str__(self):
         return f"{self.module.title} - Chunk {self.chunk_order}"
 
+    def render_content(self):
+        """Renderizar el markdown del contenido en content_html (sin guardar)"""
+        self.content_html = render_markdown(self.content)
+        self.content_html_checksum = content_checksum(self.content)
+
+    def get_content_html(self):
+        """HTML del contenido; solo se renderiza si falta o el contenido cambió"""
+        if self.content_html_checksum != content_checksum(self.content):
+            self.render_content()
+            if self.pk:
+                Chunk.objects.filter(pk=self.pk).update(
+                    content_html=self.content_html,
+                    content_html_checksum=self.content_html_checksum
+                )
+        return mark_safe(self.content_html)
+
+    def delete(self, *args, **kwargs):
+        """Borrar el chunk descontándolo de los contadores del módulo, el curso y el progreso"""
+        with transaction.atomic():
+            _discount_completions(ChunkCompletion.objects.filter(chunk_id=self.pk))
+            result = super().delete(*args, **kwargs)
+            self.module.add_chunks(-1)
+        return result
+
 
 class Video(models.Model):
     """Video de YouTube asociado a un chunk"""
@@ -241,7 +337,7 @@ class UserProgress(models.Model):
     # Progreso
     current_module = models.ForeignKey(Module, on_delete=models.SET_NULL, null=True, blank=True)
     current_chunk = models.ForeignKey(Chunk, on_delete=models.SET_NULL, null=True, blank=True)
-    completed_chunks = models.JSONField(default=list)  # Lista de IDs de chunks completados
+    completed_count = models.PositiveIntegerField(default=0)  # Filas de ChunkCompletion
     
     # Timestamps
     started_at = models.DateTimeField(auto_now_add=True)
@@ -263,10 +359,50 @@ class UserProgress(models.Model):
 
     def get_completion_percentage(self):
         """Calcula el porcentaje de completado"""
-        total_chunks = sum(module.chunks.count() for module in self.course.modules.all())
-        if total_chunks == 0:
+        if self.course.total_chunks == 0:
             return 0
-        return (len(self.completed_chunks) / total_chunks) * 100
+        return min(100, self.completed_count / self.course.total_chunks * 100)
+
+    def get_completed_chunk_ids(self):
+        """chunk_id de los chunks completados, en el orden en que se completaron"""
+        if 'completions' in getattr(self, '_prefetched_objects_cache', {}):
+            # Precargados junto con su chunk, como en /api/progress/
+            completions = sorted(self.completions.all(), key=lambda completion: completion.completed_at)
+            return [completion.chunk.chunk_id for completion in completions]
+        return list(self.completions.order_by('completed_at').values_list('chunk__chunk_id', flat=True))
+
+
+class ChunkCompletion(models.Model):
+    """Chunk completado por un usuario: una fila por progreso y chunk"""
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    progress = models.ForeignKey(UserProgress, on_delete=models.CASCADE, related_name='completions')
+    chunk = models.ForeignKey(Chunk, on_delete=models.CASCADE, related_name='completions')
+    
+    # Timestamps
+    completed_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Chunk Completado"
+        verbose_name_plural = "Chunks Completados"
+        constraints = [
+            models.UniqueConstraint(fields=['progress', 'chunk'], name='unique_chunk_completion'),
+        ]
+
+    def __str__(self):
+        return f"{self.progress} - {self.chunk.chunk_id}"
+
+
+def _discount_completions(completions):
+    """
+    Restar de UserProgress.completed_count las filas de ChunkCompletion que se
+    van a borrar en cascada junto con sus chunks
+    """
+    removed_by_progress = completions.values('progress_id').annotate(removed=models.Count('id'))
+    for row in removed_by_progress:
+        UserProgress.objects.filter(pk=row['progress_id']).update(
+            completed_count=models.F('completed_count') - row['removed']
+        )
 
 
 class GenerationLog(models.Model):
@@ -299,3 +435,90 @@ class GenerationLog(models.Model):
 
     def __str__(self):
         return f"{self.course.course_id} - {self.action} - {self.created_at}"
+
+
+class GenerationBatch(models.Model):
+    """Lote de generación offline enviado a la Message Batches API de Anthropic"""
+    
+    class StatusChoices(models.TextChoices):
+        SUBMITTED = 'submitted', 'Enviado'
+        COMPLETE = 'complete', 'Completado'
+        FAILED = 'failed', 'Error'
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    batch_id = models.CharField(max_length=100, unique=True)  # ID del lote en Anthropic
+    status = models.CharField(max_length=20, choices=StatusChoices.choices, default=StatusChoices.SUBMITTED)
+    courses = models.ManyToManyField(Course, related_name='generation_batches', blank=True)
+    request_count = models.PositiveIntegerField(default=0)
+    details = models.JSONField(default=dict, blank=True)  # Resumen de resultados
+    
+    # Timestamps
+    created_at = models.DateTimeField(auto_now_add=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Lote de Generación"
+        verbose_name_plural = "Lotes de Generación"
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.batch_id} - {self.status}"
+
+
+class GenerationStep(models.Model):
+    """Checkpoint de una etapa de generación de un curso (metadata, cada módulo, proyecto final)"""
+    
+    class StageChoices(models.TextChoices):
+        METADATA = 'metadata', 'Metadata'
+        MODULE = 'module', 'Módulo'
+        FINAL_PROJECT = 'final_project', 'Proyecto Final'
+    
+    class StatusChoices(models.TextChoices):
+        PENDING = 'pending', 'Pendiente'
+        RUNNING = 'running', 'En Progreso'
+        DONE = 'done', 'Completado'
+        FAILED = 'failed', 'Error'
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    course = models.ForeignKey(Course, on_delete=models.CASCADE, related_name='generation_steps')
+    stage = models.CharField(max_length=20, choices=StageChoices.choices)
+    module_number = models.PositiveIntegerField(default=0)  # 0 para etapas que no son de módulo
+    status = models.CharField(max_length=20, choices=StatusChoices.choices, default=StatusChoices.PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    
+    # Timestamps
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Paso de Generación"
+        verbose_name_plural = "Pasos de Generación"
+        ordering = ['stage', 'module_number']
+        constraints = [
+            models.UniqueConstraint(fields=['course', 'stage', 'module_number'], name='unique_generation_step'),
+        ]
+
+    def __str__(self):
+        return f"{self.course.course_id} - {self.stage} {self.module_number} - {self.status}"
+
+
+class CourseSnapshot(models.Model):
+    """Representación JSON precalculada de un curso completo, comprimida con gzip"""
+    
+    course = models.OneToOneField(Course, on_delete=models.CASCADE, primary_key=True, related_name='snapshot')
+    data = models.BinaryField()  # Salida de CourseDetailSerializer en JSON, comprimida con gzip
+    content_hash = models.CharField(max_length=64)  # SHA-256 del JSON sin comprimir (ETag)
+    size = models.PositiveIntegerField(default=0)  # Bytes del JSON sin comprimir
+    
+    # Timestamps
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Snapshot de Curso"
+        verbose_name_plural = "Snapshots de Cursos"
+
+    def __str__(self):
+        return f"{self.course_id} - {self.content_hash[:12]}"
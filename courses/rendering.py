@@ -0,0 +1,46 @@
+import hashlib
+import logging
+
+import markdown
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+# El resaltado de código lo hace highlight.js en el navegador (clases language-*)
+MARKDOWN_EXTENSIONS = ['fenced_code', 'tables', 'sane_lists']
+CACHE_PREFIX = 'markdown:html'
+CACHE_TIMEOUT = 60 * 60 * 24 * 7
+
+
+def content_checksum(text: str) -> str:
+    """MD5 del texto, para saber si el HTML renderizado sigue vigente"""
+    return hashlib.md5((text or '').encode('utf-8')).hexdigest()
+
+
+def render_markdown(text: str) -> str:
+    """Convertir markdown a HTML"""
+    return markdown.markdown(text or '', extensions=MARKDOWN_EXTENSIONS)
+
+
+def cached_markdown(text: str) -> str:
+    """
+    Convertir markdown a HTML guardando el resultado en caché por checksum del texto
+    
+    Para textos sin columna propia de HTML (introducción del curso, resumen del
+    módulo). Si la caché no está disponible se renderiza sin ella.
+    """
+    key = f'{CACHE_PREFIX}:{content_checksum(text)}'
+    try:
+        html = cache.get(key)
+        if html is not None:
+            return html
+    except Exception as e:
+        logger.warning(f"Caché de markdown no disponible: {e}")
+        return render_markdown(text)
+    
+    html = render_markdown(text)
+    try:
+        cache.set(key, html, CACHE_TIMEOUT)
+    except Exception as e:
+        logger.warning(f"No se pudo guardar el HTML en caché: {e}")
+    return html
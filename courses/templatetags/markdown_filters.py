@@ -0,0 +1,12 @@
+from django import template
+from django.utils.safestring import mark_safe
+
+from courses.rendering import cached_markdown
+
+register = template.Library()
+
+
+@register.filter
+def markdownify(value):
+    """Renderizar markdown a HTML (cacheado por contenido)"""
+    return mark_safe(cached_markdown(value))
@@ -1,3 +1,170 @@
-from django.test import TestCase
+import json
+import asyncio
+from unittest import mock
+from django.test import TestCase, override_settings
 
-# Create your tests here.
+from courses import rendering
+from courses.models import Course, Module, Chunk
+from courses.rendering import cached_markdown, content_checksum
+from generation.services import status_events
+from generation.services.status_events import status_event_service
+
+
+class ChunkContentHtmlTests(TestCase):
+    """HTML del contenido de los chunks renderizado de antemano"""
+    
+    def setUp(self):
+        course = Course.objects.create(user_prompt='Python desde cero', title='Python desde cero')
+        module = Module.objects.create(course=course, module_id='modulo_1', module_order=1,
+                                       title='Introducción', description='')
+        self.chunk = Chunk(module=module, chunk_id='modulo_1_chunk_1', chunk_order=1, content='# Variables')
+        self.chunk.render_content()
+        self.chunk.save()
+    
+    def test_stored_html_is_served_without_rendering(self):
+        chunk = Chunk.objects.get(pk=self.chunk.pk)
+        
+        with mock.patch('courses.models.render_markdown') as render, self.assertNumQueries(0):
+            html = chunk.get_content_html()
+        
+        render.assert_not_called()
+        self.assertIn('<h1>Variables</h1>', html)
+    
+    def test_html_is_rendered_again_when_the_content_changes(self):
+        Chunk.objects.filter(pk=self.chunk.pk).update(content='## Funciones')  # Edición sin render_content()
+        chunk = Chunk.objects.get(pk=self.chunk.pk)
+        
+        with self.assertNumQueries(1):
+            self.assertIn('<h2>Funciones</h2>', chunk.get_content_html())
+        
+        chunk.refresh_from_db()
+        self.assertIn('<h2>Funciones</h2>', chunk.content_html)
+        self.assertEqual(chunk.content_html_checksum, content_checksum('## Funciones'))
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class CachedMarkdownTests(TestCase):
+    """Markdown sin columna de HTML propia, cacheado por checksum"""
+    
+    def test_markdown_is_rendered_once_per_text(self):
+        with mock.patch.object(rendering, 'render_markdown', wraps=rendering.render_markdown) as render:
+            for _ in range(2):
+                self.assertIn('<strong>resumen</strong>', cached_markdown('Un **resumen** del módulo'))
+            cached_markdown('Otro texto')
+        
+        self.assertEqual(render.call_count, 2)
+
+
+class FakePubSub:
+    """Lo mínimo de la pub/sub asíncrona de redis-py que usa StatusEventService.listen"""
+    
+    def __init__(self, messages):
+        self.messages = list(messages)  # None simula un timeout sin mensajes
+        self.channels = []
+        self.closed = False
+    
+    async def subscribe(self, channel):
+        self.channels.append(channel)
+    
+    async def get_message(self, ignore_subscribe_messages=False, timeout=None):
+        if not self.messages:
+            await asyncio.Event().wait()  # Sin más mensajes: espera hasta que se cancele
+        message = self.messages.pop(0)
+        return message and {'type': 'message', 'data': json.dumps(message).encode()}
+    
+    async def aclose(self):
+        self.closed = True
+
+
+class FakeAsyncRedis:
+    def __init__(self, pubsub):
+        self._pubsub = pubsub
+        self.closed = False
+    
+    def pubsub(self):
+        return self._pubsub
+    
+    async def aclose(self):
+        self.closed = True
+
+
+@override_settings(GENERATION_SSE_KEEPALIVE=15, GENERATION_SSE_MAX_DURATION=60)
+class CourseEventsTests(TestCase):
+    """GET /course/{id}/events/: Server-Sent Events sobre StatusEventService.listen"""
+    
+    def setUp(self):
+        self.course = Course.objects.create(user_prompt='Python desde cero', title='Python desde cero',
+                                            status=Course.StatusChoices.GENERATING_MODULE_1)
+        self.url = f'/course/{self.course.id}/events/'
+    
+    def subscribe(self, *messages):
+        self.pubsub = FakePubSub(messages)
+        self.redis = FakeAsyncRedis(self.pubsub)
+        patcher = mock.patch.object(status_events.redis_async.Redis, 'from_url', return_value=self.redis)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+    
+    def payload(self, status, event='status', **extra):
+        course = Course(pk=self.course.pk, title=self.course.title, status=status)
+        return status_event_service.course_payload(course, event, **extra)
+    
+    async def read_events(self):
+        response = await self.async_client.get(self.url)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        return [part.decode() async for part in response.streaming_content]
+    
+    def event_data(self, event):
+        header, data = event.strip().split('\n')
+        return header.removeprefix('event: '), json.loads(data.removeprefix('data: '))
+    
+    async def test_snapshot_is_followed_by_published_events_until_a_terminal_status(self):
+        self.subscribe(self.payload(Course.StatusChoices.READY, 'chunk', module_number=1, chunks_ready=1),
+                       self.payload(Course.StatusChoices.COMPLETE))
+        
+        events = [self.event_data(event) for event in await self.read_events()]
+        
+        self.assertEqual([event for event, _ in events], ['status', 'chunk', 'status'])
+        self.assertEqual(events[0][1]['status'], Course.StatusChoices.GENERATING_MODULE_1)
+        self.assertEqual(events[0][1]['chunks_ready'], 0)
+        self.assertEqual(events[1][1]['chunks_ready'], 1)
+        self.assertEqual(events[2][1]['status'], Course.StatusChoices.COMPLETE)
+        self.assertEqual(self.pubsub.channels, [status_event_service.channel(self.course.id)])
+        self.assertTrue(self.pubsub.closed and self.redis.closed)
+    
+    async def test_finished_course_only_sends_the_snapshot(self):
+        await Course.objects.filter(pk=self.course.pk).aupdate(status=Course.StatusChoices.FAILED)
+        self.subscribe(self.payload(Course.StatusChoices.READY))
+        
+        events = await self.read_events()
+        
+        self.assertEqual(len(events), 1)
+        self.assertEqual(self.event_data(events[0])[1]['status'], Course.StatusChoices.FAILED)
+        self.assertTrue(self.redis.closed)
+    
+    async def test_keep_alive_comment_is_sent_while_there_are_no_events(self):
+        self.subscribe(None, self.payload(Course.StatusChoices.FAILED))
+        
+        events = await self.read_events()
+        
+        self.assertEqual(events[1], ': keep-alive\n\n')
+        self.assertEqual(self.event_data(events[2])[1]['status'], Course.StatusChoices.FAILED)
+    
+    async def test_client_disconnect_closes_the_subscription(self):
+        self.subscribe()
+        response = await self.async_client.get(self.url)
+        content = response.streaming_content
+        await anext(content)  # Snapshot
+        
+        # ASGIHandler cancela la respuesta cuando el cliente se desconecta
+        next_event = asyncio.ensure_future(anext(content))
+        await asyncio.sleep(0)
+        next_event.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await next_event
+        
+        self.assertTrue(self.pubsub.closed and self.redis.closed)
+    
+    def test_wsgi_requests_fall_back_to_polling(self):
+        response = self.client.get(self.url)
+        
+        self.assertEqual(response.status_code, 204)
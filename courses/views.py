@@ -1,11 +1,15 @@
 from django.shortcuts import render, get_object_or_404, redirect
-from django.http import JsonResponse
+from django.http import JsonResponse, HttpResponse, StreamingHttpResponse, Http404
+from django.core.handlers.asgi import ASGIRequest
+from django.utils.cache import get_conditional_response
+from asgiref.sync import sync_to_async
 from django.contrib.auth.decorators import login_required
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
 import json
 from .models import Course, Module, UserProgress
 from django.urls import reverse
+from generation.services.status_events import status_event_service
 
 
 def index(request):
@@ -60,6 +64,7 @@ def course_view(request, course_id):
     context = {
         'course': course,
         'user_progress': user_progress,
+        'completed_chunks_count': user_progress.completed_count if user_progress else 0,
         'breadcrumbs': [
             (reverse('index'), 'Inicio'),
             (None, course.title),
@@ -113,6 +118,7 @@ def module_view(request, course_id, module_id):
         'previous_module': previous_module,
         'next_module': next_module,
         'user_progress': user_progress,
+        'completed_chunk_ids': set(user_progress.get_completed_chunk_ids()) if user_progress else set(),
         'breadcrumbs': [
             (reverse('index'), 'Inicio'),
             (reverse('course_view', kwargs={'course_id': course.id}), course.title),
@@ -123,13 +129,53 @@ def module_view(request, course_id, module_id):
 
 
 def course_status(request, course_id):
-    """API endpoint para verificar el estado del curso"""
-    course = get_object_or_404(Course, id=course_id)
+    """
+    API endpoint para verificar el estado del curso
+    
+    Lee el registro de estado de Redis (la base de datos solo si no existe) y
+    responde 304 sin cuerpo cuando If-None-Match coincide con el ETag.
+    """
+    course_status = status_event_service.get_status(course_id)
+    if course_status is None:
+        course_status = status_event_service.status_from_course(get_object_or_404(Course, id=course_id))
     
-    return JsonResponse({
-        'status': course.status,
-        'status_display': course.get_status_display(),
-        'progress_percentage': course.get_progress_percentage(),
-        'title': course.title,
-        'description': course.description,
+    etag = status_event_service.etag(course_status)
+    response = get_conditional_response(request, etag=etag) or JsonResponse({
+        field: course_status[field]
+        for field in ['status', 'status_display', 'progress_percentage', 'chunks_ready', 'title', 'description']
     })
+    response['ETag'] = etag
+    response['Cache-Control'] = 'no-cache'
+    return response
+
+
+async def course_events(request, course_id):
+    """
+    Server-Sent Events con el estado de generación del curso
+    
+    Envía el estado actual y después cada transición publicada por las tareas.
+    Requiere ASGI; bajo WSGI responde 204 para que el navegador no reconecte y
+    use el polling de course_status.
+    """
+    if not isinstance(request, ASGIRequest):
+        return HttpResponse(status=204)
+    
+    if not await Course.objects.filter(id=course_id).aexists():
+        raise Http404("Curso no encontrado")
+    
+    async def snapshot():
+        course = await Course.objects.aget(id=course_id)
+        chunks_ready = await sync_to_async(course.get_ready_chunks_count)(module_order=1)
+        return status_event_service.course_payload(course, chunks_ready=chunks_ready)
+    
+    async def event_stream():
+        async for payload in status_event_service.listen(course_id, snapshot):
+            if payload is None:
+                yield ': keep-alive\n\n'
+            else:
+                yield f"event: {payload['event']}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+    
+    response = StreamingHttpResponse(event_stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # Evitar el buffering de nginx
+    return response
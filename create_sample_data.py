@@ -10,7 +10,7 @@ import django
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings.development')
 django.setup()
 
-from courses.models import Course, Module, Chunk, Video, Quiz, UserProgress
+from courses.models import Course, Module, Chunk, Video, Quiz, UserProgress, ChunkCompletion
 from django.contrib.auth.models import User
 import uuid
 import json
@@ -799,9 +799,10 @@ def create_sample_user_progress(course):
         user=user,
         course=course,
         current_module=first_module,
-        current_chunk=first_chunk,
-        completed_chunks=[first_chunk.chunk_id] if first_chunk else []
+        current_chunk=first_chunk
     )
+    if first_chunk:
+        ChunkCompletion.objects.create(progress=progress, chunk=first_chunk)
     
     print(f"📊 Progreso de usuario creado")
     return progress
@@ -14,10 +14,18 @@ if [ ! -f db.sqlite3 ] || [ $(sqlite3 db.sqlite3 ".tables" | wc -w) -eq 0 ]; the
     python create_sample_data.py || true
 fi
 
-# Ejecutar el comando que se pase (por defecto runserver)
+# Recarga automática de uvicorn solo en desarrollo (UVICORN_RELOAD=1)
+UVICORN_ARGS=""
+if [ "${UVICORN_RELOAD:-0}" = "1" ]; then
+    UVICORN_ARGS="--reload"
+fi
+
+# Ejecutar el comando que se pase (por defecto el servidor ASGI, necesario para SSE)
 if [ "$1" = "celery" ]; then
     shift
     celery -A config worker -l info "$@"
-else
+elif [ "$1" = "runserver" ]; then
     python manage.py runserver 0.0.0.0:8000
+else
+    uvicorn config.asgi:application --host 0.0.0.0 --port 8000 $UVICORN_ARGS
 fi 
\ No newline at end of file
@@ -0,0 +1,65 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+
+from courses.models import Course, GenerationBatch
+from generation.tasks import generate_course_metadata, submit_module_batch, poll_module_batch
+
+
+class Command(BaseCommand):
+    help = "Genera por lotes (Message Batches API) los módulos de los cursos con metadata lista"
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--topics-file', help="Fichero con un prompt por línea para crear cursos nuevos")
+        parser.add_argument('--level', default=Course.LevelChoices.PRINCIPIANTE, choices=Course.LevelChoices.values,
+                            help="Nivel de los cursos creados con --topics-file")
+        parser.add_argument('--courses', nargs='*', help="Limitar el lote a estos IDs de curso")
+        parser.add_argument('--limit', type=int, help="Máximo de cursos por lote")
+        parser.add_argument('--wait', action='store_true',
+                            help="Esperar al lote en este proceso en lugar de programar poll_module_batch")
+        parser.add_argument('--poll-interval', type=int, default=30, help="Segundos entre comprobaciones con --wait")
+    
+    def handle(self, *args, **options):
+        if options['topics_file']:
+            self._create_courses(options['topics_file'], options['level'])
+        
+        batch_id = submit_module_batch(
+            course_ids=options['courses'],
+            limit=options['limit'],
+            schedule_poll=not options['wait']
+        )
+        
+        if batch_id is None:
+            self.stdout.write("No hay cursos con metadata lista pendientes de generar")
+            return
+        
+        batch = GenerationBatch.objects.get(id=batch_id)
+        self.stdout.write(self.style.SUCCESS(
+            f"Lote {batch.batch_id} enviado con {batch.request_count} módulos de {batch.courses.count()} cursos"
+        ))
+        
+        if not options['wait']:
+            return
+        
+        while poll_module_batch(batch_id, reschedule=False) == GenerationBatch.StatusChoices.SUBMITTED:
+            time.sleep(options['poll_interval'])
+        
+        batch.refresh_from_db()
+        self.stdout.write(self.style.SUCCESS(f"Lote {batch.batch_id} procesado: {batch.status} {batch.details}"))
+    
+    def _create_courses(self, path, level):
+        """
+        Crear un curso por línea y encolar su metadata sin lanzar el módulo 1
+        """
+        try:
+            with open(path, encoding='utf-8') as topics_file:
+                prompts = [line.strip() for line in topics_file if line.strip()]
+        except OSError as e:
+            raise CommandError(f"No se pudo leer {path}: {e}")
+        
+        for prompt in prompts:
+            course = Course.objects.create(user_prompt=prompt, user_level=level)
+            generate_course_metadata.delay(str(course.id), continue_generation=False)
+        
+        self.stdout.write(
+            f"{len(prompts)} cursos creados; sus módulos entrarán en el lote cuando su metadata esté lista"
+        )
@@ -1,21 +1,31 @@
 import json
 import asyncio
 import logging
-from typing import Dict, Any, List
+import weakref
+from typing import Dict, Any, List, Tuple, AsyncIterator, Callable, Union
 from pathlib import Path
 from jinja2 import Environment, FileSystemLoader
 
+import httpx
 import anthropic
 from django.conf import settings
 
+from .json_stream import JsonArrayStreamParser
+from .response_parser import response_parser
+from .rate_limiter import rate_limiter, is_retryable, retry_delay
+from .response_cache import response_cache, record_call_stat
+
 logger = logging.getLogger(__name__)
 
 
 class AnthropicService:
     """Servicio para integración con Claude API de Anthropic"""
     
+    MODULE_MAX_TOKENS = 6000
+    MAX_CONTINUATIONS = 2
+    
     def __init__(self):
-        self._client = None
+        self._clients = weakref.WeakKeyDictionary()  # Un cliente por event loop
         
         # Configurar Jinja2 para templates
         template_dir = Path(__file__).parent.parent / 'prompts'
@@ -27,12 +37,39 @@ class AnthropicService:
     
     @property
     def client(self):
-        """Lazy initialization of Anthropic client"""
-        if self._client is None:
+        """
+        Lazy initialization of the async Anthropic client
+        
+        El cliente (y su pool de conexiones httpx) queda ligado al event loop en
+        el que se creó: se guarda uno por loop, así un loop nuevo no abandona el
+        cliente de otro sin cerrar. aclose() lo cierra antes de cerrar el loop.
+        """
+        loop = asyncio.get_running_loop()
+        client = self._clients.get(loop)
+        if client is None:
             if not settings.ANTHROPIC_API_KEY:
                 raise ValueError("Anthropic API key not configured")
-            self._client = anthropic.Anthropic(api_key=settings.ANTHROPIC_API_KEY)
-        return self._client
+            client = anthropic.AsyncAnthropic(
+                api_key=settings.ANTHROPIC_API_KEY,
+                timeout=settings.ANTHROPIC_TIMEOUT,
+                max_retries=0,  # Los reintentos los gestiona _create_message
+                http_client=httpx.AsyncClient(
+                    limits=httpx.Limits(
+                        max_connections=settings.ANTHROPIC_MAX_CONNECTIONS,
+                        max_keepalive_connections=settings.ANTHROPIC_MAX_KEEPALIVE_CONNECTIONS
+                    )
+                )
+            )
+            self._clients[loop] = client
+        return client
+    
+    async def aclose(self):
+        """
+        Cerrar el cliente del event loop actual y su pool de conexiones
+        """
+        client = self._clients.pop(asyncio.get_running_loop(), None)
+        if client is not None:
+            await client.close()
     
     async def create_course_metadata(self, prompt: str, level: str, interests: List[str], language: str = 'es') -> Dict[str, Any]:
         """
@@ -51,20 +88,17 @@ class AnthropicService:
             )
             
             # Llamada asíncrona a Claude
-            response = await asyncio.to_thread(
-                self._call_claude_sync,
+            metadata = await self._call_claude_json(
                 system_prompt,
                 "Genera la metadata del curso siguiendo exactamente la estructura P2C especificada.",
-                max_tokens=4000
+                max_tokens=4000,
+                validator=self.validate_course_structure
             )
             
-            # Parse JSON response
-            metadata = json.loads(response)
-            
             logger.info(f"Metadata generada exitosamente: {metadata.get('title', 'Sin título')}")
             return metadata
             
-        except json.JSONDecodeError as e:
+        except ValueError as e:
             logger.error(f"Error parsing JSON response: {e}")
             raise ValueError(f"Respuesta de Claude no válida: {e}")
         except Exception as e:
@@ -78,32 +112,108 @@ class AnthropicService:
         try:
             logger.info(f"Iniciando generación de módulo {module_number}")
             
-            template = self.template_env.get_template('module_content_prompt.j2')
-            system_prompt = template.render(
-                course_metadata=course_metadata,
-                module_number=module_number,
-                module_title=course_metadata['module_list'][module_number - 1]
-            )
+            system_prompt, user_message = self._render_module_prompt(course_metadata, module_number)
             
-            response = await asyncio.to_thread(
-                self._call_claude_sync,
+            module_content = await self._call_claude_json(
                 system_prompt,
-                f"Genera el contenido completo del módulo {module_number} siguiendo la estructura P2C.",
-                max_tokens=6000
+                user_message,
+                max_tokens=self.MODULE_MAX_TOKENS,
+                validator=self.validate_module_structure
             )
             
-            module_content = json.loads(response)
-            
             logger.info(f"Módulo {module_number} generado exitosamente")
             return module_content
             
-        except json.JSONDecodeError as e:
+        except ValueError as e:
             logger.error(f"Error parsing module content JSON: {e}")
             raise ValueError(f"Respuesta de Claude no válida para módulo: {e}")
         except Exception as e:
             logger.error(f"Error en generación de módulo {module_number}: {e}")
             raise
     
+    async def stream_module_content(self, course_metadata: Dict[str, Any], module_number: int) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+        """
+        Fase 2 en streaming: generar un módulo emitiendo cada chunk en cuanto se completa
+        
+        Produce eventos (tipo, datos):
+        - ('header', {...})  campos del módulo anteriores a los chunks (una vez)
+        - ('chunk', {...})   cada elemento de "chunks" al cerrarse
+        - ('module', {...})  el módulo completo al terminar la respuesta
+        """
+        logger.info(f"Iniciando generación en streaming de módulo {module_number}")
+        
+        params = self.module_request_params(course_metadata, module_number)
+        cache_key = response_cache.make_key(params)
+        parser = JsonArrayStreamParser('chunks')
+        header_sent = False
+        
+        cached_response = await response_cache.aget(cache_key)
+        record_call_stat('cache_hits' if cached_response is not None else 'cache_misses')
+        stop_reason = None
+        
+        async def text_fragments():
+            nonlocal stop_reason
+            if cached_response is not None:
+                yield cached_response  # Reproducir la respuesta cacheada como un único fragmento
+                return
+            
+            estimated_tokens = rate_limiter.estimate_tokens(params)
+            for attempt in range(settings.ANTHROPIC_MAX_RETRIES + 1):
+                await rate_limiter.acquire(estimated_tokens)
+                received = False
+                try:
+                    async with self._messages_api().stream(**params) as stream:
+                        async for text in stream.text_stream:
+                            received = True
+                            yield text
+                        final_message = await stream.get_final_message()
+                except anthropic.APIError as e:
+                    # Solo se reintenta si aún no se había recibido nada del stream
+                    if received or not is_retryable(e) or attempt >= settings.ANTHROPIC_MAX_RETRIES:
+                        raise
+                    delay = retry_delay(attempt, e)
+                    record_call_stat('retries')
+                    logger.warning(f"Error reintentable de Claude ({e}), reintento {attempt + 1} en {delay:.1f}s")
+                    await asyncio.sleep(delay)
+                    continue
+                
+                record_call_stat('api_calls')
+                stop_reason = final_message.stop_reason
+                await self._record_usage(estimated_tokens, final_message)
+                return
+        
+        async for text in text_fragments():
+            for chunk_data in parser.feed(text):
+                if not header_sent:
+                    header_sent = True
+                    yield 'header', parser.header() or {}
+                yield 'chunk', chunk_data
+        
+        # Respuesta truncada por max_tokens: continuar desde donde se quedó
+        continuations = 0
+        while (stop_reason == 'max_tokens' and continuations < self.MAX_CONTINUATIONS
+               and not self._is_complete_json(parser.buffer, self.validate_module_structure)):
+            continuations += 1
+            text, stop_reason = await self._continue_claude(params, parser.buffer)
+            for chunk_data in parser.feed(text):
+                if not header_sent:
+                    header_sent = True
+                    yield 'header', parser.header() or {}
+                yield 'chunk', chunk_data
+        
+        module_content = self._parse_json(parser.buffer, continuations)
+        
+        if not self.validate_module_structure(module_content):
+            record_call_stat('json_invalid')
+            await response_cache.adelete(cache_key)
+            raise ValueError("El JSON del módulo no tiene la estructura esperada")
+        
+        if cached_response is None and (stop_reason == 'end_turn' or continuations):
+            await response_cache.aset(cache_key, parser.buffer)
+        
+        logger.info(f"Módulo {module_number} generado exitosamente en streaming")
+        yield 'module', module_content
+    
     async def create_final_project(self, course_metadata: Dict[str, Any], modules_data: List[Dict[str, Any]]) -> Dict[str, Any]:
         """
         Generar proyecto final del curso
@@ -112,20 +222,18 @@ class AnthropicService:
             logger.info("Generando proyecto final del curso")
             
             template = self.template_env.get_template('final_project_prompt.j2')
-            system_prompt = template.render(
-                course_metadata=course_metadata,
-                modules_data=modules_data
+            # Una sola llamada por curso y el contexto solo no llega al mínimo cacheable
+            system_prompt = self._build_system_blocks(
+                (self._render_course_context(course_metadata), False),
+                (template.render(course_metadata=course_metadata, modules_data=modules_data), False)
             )
             
-            response = await asyncio.to_thread(
-                self._call_claude_sync,
+            final_project = await self._call_claude_json(
                 system_prompt,
                 "Genera un proyecto final completo y práctico para el curso.",
                 max_tokens=2500
             )
             
-            final_project = json.loads(response)
-            
             logger.info("Proyecto final generado exitosamente")
             return final_project
             
@@ -154,14 +262,11 @@ class AnthropicService:
             Ejemplo: ["tutorial python principiantes", "introducción programación python", "python desde cero"]
             """
             
-            response = await asyncio.to_thread(
-                self._call_claude_sync,
+            queries = await self._call_claude_json(
                 prompt,
                 "Genera las consultas de búsqueda en formato JSON array.",
                 max_tokens=200
             )
-            
-            queries = json.loads(response)
             return queries
             
         except Exception as e:
@@ -169,25 +274,233 @@ class AnthropicService:
             # Fallback queries
             return [f"{topic} tutorial {level}", f"aprende {topic}", f"{topic} explicación"]
     
-    def _call_claude_sync(self, system_prompt: str, user_message: str, max_tokens: int = 3000) -> str:
+    def module_request_params(self, course_metadata: Dict[str, Any], module_number: int) -> Dict[str, Any]:
+        """
+        Parámetros completos de la petición de un módulo (usados también por el modo batch)
+        """
+        system_prompt, user_message = self._render_module_prompt(course_metadata, module_number)
+        return self._build_message_params(system_prompt, user_message, self.MODULE_MAX_TOKENS)
+    
+    def _render_module_prompt(self, course_metadata: Dict[str, Any], module_number: int) -> Tuple[List[Dict[str, Any]], str]:
         """
-        Llamada síncrona a Claude API
+        Renderizar system prompt y mensaje de usuario para generar un módulo
+        
+        El system prompt se divide en un prefijo estable por curso (contexto del
+        curso + instrucciones de módulo) y un sufijo con el módulo concreto. El
+        único punto de caché va al final de las instrucciones: el contexto solo
+        no alcanza la longitud mínima que Anthropic cachea.
+        """
+        system_prompt = self._build_system_blocks(
+            (self._render_course_context(course_metadata), False),
+            (self.template_env.get_template('module_content_prompt.j2').render(course_metadata=course_metadata), True),
+            (self.template_env.get_template('module_target_prompt.j2').render(
+                course_metadata=course_metadata,
+                module_number=module_number,
+                module_title=course_metadata['module_list'][module_number - 1]
+            ), False)
+        )
+        user_message = f"Genera el contenido completo del módulo {module_number} siguiendo la estructura P2C."
+        return system_prompt, user_message
+    
+    def _render_course_context(self, course_metadata: Dict[str, Any]) -> str:
+        """
+        Contexto del curso compartido por los prompts de módulos y proyecto final
+        """
+        return self.template_env.get_template('course_context_prompt.j2').render(course_metadata=course_metadata)
+    
+    def _build_system_blocks(self, *parts: Tuple[str, bool]) -> List[Dict[str, Any]]:
+        """
+        Construir el system prompt como bloques de texto; los marcados como
+        cacheables llevan cache_control para el prompt caching de Anthropic
+        """
+        blocks = []
+        for text, cacheable in parts:
+            block = {"type": "text", "text": text}
+            if cacheable and settings.ANTHROPIC_PROMPT_CACHING_ENABLED:
+                block["cache_control"] = {"type": "ephemeral"}
+            blocks.append(block)
+        return blocks
+    
+    def _build_message_params(self, system_prompt: Union[str, List[Dict[str, Any]]], user_message: str,
+                              max_tokens: int) -> Dict[str, Any]:
         """
+        Construir los parámetros completos de la petición a Claude
+        """
+        return {
+            'model': "claude-3-5-sonnet-20241022",
+            'max_tokens': max_tokens,
+            'temperature': 0.3,  # Reducir temperatura para más consistencia
+            'system': system_prompt,
+            'messages': [
+                {
+                    "role": "user", 
+                    "content": user_message
+                }
+            ]
+        }
+    
+    async def _call_claude_json(self, system_prompt: Union[str, List[Dict[str, Any]]], user_message: str, max_tokens: int = 3000,
+                                validator: Callable[[Any], bool] = None) -> Any:
+        """
+        Llamada a Claude que devuelve el JSON de la respuesta ya interpretado
+        
+        Si la respuesta se corta por max_tokens y el JSON no está completo (o no
+        pasa el validator), se pide a Claude que continúe desde el texto ya
+        generado en lugar de repetir la petición entera. Si el JSON final (quizá
+        reparado) no pasa el validator se lanza ValueError y la respuesta no
+        queda en caché.
+        """
+        params = self._build_message_params(system_prompt, user_message, max_tokens)
+        response, stop_reason = await self._call_claude(params)
+        
+        continuations = 0
+        while (stop_reason == 'max_tokens' and continuations < self.MAX_CONTINUATIONS
+               and not self._is_complete_json(response, validator)):
+            continuations += 1
+            text, stop_reason = await self._continue_claude(params, response)
+            response = response.rstrip() + text
+        
+        data = self._parse_json(response, continuations)
+        
+        if validator is not None and not validator(data):
+            record_call_stat('json_invalid')
+            # _call_claude pudo cachear la respuesta; un reintento debe volver a la API
+            await response_cache.adelete(response_cache.make_key(params))
+            raise ValueError("El JSON de la respuesta no tiene la estructura esperada")
+        
+        if continuations and stop_reason == 'end_turn':
+            # Guardar la respuesta completa bajo la clave de la petición original
+            await response_cache.aset(response_cache.make_key(params), response)
+        
+        return data
+    
+    async def _continue_claude(self, params: Dict[str, Any], partial_response: str) -> Tuple[str, str]:
+        """
+        Pedir a Claude que continúe una respuesta truncada
+        
+        La respuesta parcial se envía como inicio del turno del asistente, así que
+        Claude solo genera lo que falta.
+        """
+        logger.warning("Respuesta de Claude truncada por max_tokens, solicitando continuación")
+        record_call_stat('json_continuations')
+        
+        continuation_params = dict(params)
+        continuation_params['messages'] = params['messages'] + [
+            {
+                "role": "assistant",
+                "content": partial_response.rstrip()  # La API no admite espacios finales
+            }
+        ]
+        return await self._call_claude(continuation_params)
+    
+    def _is_complete_json(self, response: str, validator: Callable[[Any], bool] = None) -> bool:
+        """
+        Comprobar si la respuesta ya contiene un JSON completo (y válido para el validator)
+        """
+        candidate, complete = response_parser.extract(response)
+        if not complete:
+            return False
         try:
-            message = self.client.messages.create(
-                model="claude-3-5-sonnet-20241022",
-                max_tokens=max_tokens,
-                temperature=0.3,  # Reducir temperatura para más consistencia
-                system=system_prompt,
-                messages=[
-                    {
-                        "role": "user", 
-                        "content": user_message
-                    }
-                ]
-            )
+            data = json.loads(candidate)
+        except json.JSONDecodeError:
+            return False
+        return validator is None or validator(data)
+    
+    def _parse_json(self, response: str, continuations: int = 0) -> Any:
+        """
+        Interpretar (y reparar si hace falta) el JSON de la respuesta, registrando el resultado
+        """
+        try:
+            data, outcome = response_parser.parse(response)
+        except ValueError:
+            record_call_stat('json_failed')
+            raise
+        
+        record_call_stat(f'json_{outcome}')
+        if continuations:
+            record_call_stat('json_continued')
+        if outcome != 'clean':
+            logger.info(f"JSON de la respuesta de Claude obtenido con resultado '{outcome}'")
+        return data
+    
+    async def _create_message(self, params: Dict[str, Any]):
+        """
+        Enviar la petición a Claude respetando el rate limiter compartido
+        
+        Ante 429, sobrecarga, 5xx o errores de red reintenta con backoff
+        exponencial con jitter (o lo que indique retry-after).
+        """
+        estimated_tokens = rate_limiter.estimate_tokens(params)
+        
+        for attempt in range(settings.ANTHROPIC_MAX_RETRIES + 1):
+            await rate_limiter.acquire(estimated_tokens)
+            try:
+                message = await self._messages_api().create(**params)
+            except anthropic.APIError as e:
+                if not is_retryable(e) or attempt >= settings.ANTHROPIC_MAX_RETRIES:
+                    raise
+                delay = retry_delay(attempt, e)
+                record_call_stat('retries')
+                logger.warning(f"Error reintentable de Claude ({e}), reintento {attempt + 1} en {delay:.1f}s")
+                await asyncio.sleep(delay)
+                continue
+            
+            record_call_stat('api_calls')
+            await self._record_usage(estimated_tokens, message)
+            return message
+    
+    def _messages_api(self):
+        """
+        API de mensajes a usar: la de prompt caching (beta en este SDK) si está activo
+        """
+        if settings.ANTHROPIC_PROMPT_CACHING_ENABLED:
+            return self.client.beta.prompt_caching.messages
+        return self.client.messages
+    
+    async def _record_usage(self, estimated_tokens: int, message):
+        """
+        Registrar el uso de tokens de la llamada (incluido prompt caching) y
+        devolver al rate limiter la diferencia con los tokens estimados
+        """
+        usage = getattr(message, 'usage', None)
+        if usage is None:
+            return
+        
+        cache_read_tokens = getattr(usage, 'cache_read_input_tokens', None) or 0
+        cache_write_tokens = getattr(usage, 'cache_creation_input_tokens', None) or 0
+        record_call_stat('input_tokens', usage.input_tokens)
+        record_call_stat('output_tokens', usage.output_tokens)
+        record_call_stat('cache_read_input_tokens', cache_read_tokens)
+        record_call_stat('cache_creation_input_tokens', cache_write_tokens)
+        
+        used_tokens = usage.input_tokens + usage.output_tokens + cache_read_tokens + cache_write_tokens
+        await rate_limiter.refund(estimated_tokens - used_tokens)
+    
+    async def _call_claude(self, params: Dict[str, Any]) -> Tuple[str, str]:
+        """
+        Llamada asíncrona a Claude API
+        
+        Retorna (texto, stop_reason). Las respuestas se guardan en response_cache
+        con una clave derivada de la petición completa, así que una petición
+        idéntica no vuelve a la API.
+        """
+        try:
+            cache_key = response_cache.make_key(params)
+            
+            cached_response = await response_cache.aget(cache_key)
+            if cached_response is not None:
+                record_call_stat('cache_hits')
+                return cached_response, 'end_turn'
+            
+            record_call_stat('cache_misses')
+            message = await self._create_message(params)
+            
+            response = message.content[0].text
+            if message.stop_reason == 'end_turn':
+                # No guardar respuestas truncadas por max_tokens
+                await response_cache.aset(cache_key, response)
             
-            return message.content[0].text
+            return response, message.stop_reason
             
         except anthropic.APIError as e:
             logger.error(f"Error en Claude API: {e}")
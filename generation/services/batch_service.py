@@ -0,0 +1,232 @@
+import json
+import uuid
+import logging
+from typing import Dict, Any, List, Optional, Tuple, Callable, Iterator
+
+import anthropic
+from django.conf import settings
+
+from .anthropic_service import anthropic_service
+from .response_cache import response_cache, record_call_stat
+from .response_parser import response_parser
+
+logger = logging.getLogger(__name__)
+
+
+class AnthropicBatchBackend:
+    """Message Batches API de Anthropic (beta en el SDK fijado)"""
+    
+    # Los system prompts de los módulos llevan cache_control, que en lotes exige
+    # también la beta de prompt caching (el SDK ya añade la de lotes)
+    PROMPT_CACHING_BETA = 'prompt-caching-2024-07-31'
+    
+    def __init__(self):
+        self._client = None
+    
+    @property
+    def client(self):
+        """Lazy initialization of the Anthropic client (ANTHROPIC_BATCH_BASE_URL permite un stub local)"""
+        if self._client is None:
+            if not settings.ANTHROPIC_API_KEY:
+                raise ValueError("Anthropic API key not configured")
+            self._client = anthropic.Anthropic(
+                api_key=settings.ANTHROPIC_API_KEY,
+                base_url=settings.ANTHROPIC_BATCH_BASE_URL or None,
+                timeout=settings.ANTHROPIC_TIMEOUT
+            )
+        return self._client
+    
+    def submit(self, requests: List[Dict[str, Any]]) -> str:
+        options = {}
+        if settings.ANTHROPIC_PROMPT_CACHING_ENABLED:
+            options['betas'] = [self.PROMPT_CACHING_BETA]
+        batch = self.client.beta.messages.batches.create(requests=requests, **options)
+        return batch.id
+    
+    def is_ended(self, batch_id: str) -> bool:
+        batch = self.client.beta.messages.batches.retrieve(batch_id)
+        return batch.processing_status == 'ended'
+    
+    def results(self, batch_id: str) -> Iterator[Dict[str, Any]]:
+        for item in self.client.beta.messages.batches.results(batch_id):
+            result = item.result
+            if result.type == 'succeeded':
+                yield {
+                    'custom_id': item.custom_id,
+                    'text': result.message.content[0].text,
+                    'stop_reason': result.message.stop_reason,
+                    'error': None
+                }
+            else:
+                error = getattr(result, 'error', None)
+                yield {
+                    'custom_id': item.custom_id,
+                    'text': None,
+                    'stop_reason': None,
+                    'error': f"{result.type}: {error}" if error else result.type
+                }
+
+
+class StubBatchBackend:
+    """
+    Implementación local de la Message Batches API, sin red
+    
+    Los lotes se guardan en memoria del proceso y terminan al instante; cada
+    petición se responde con responder(custom_id, params), que por defecto
+    devuelve un módulo de ejemplo con la estructura P2C. Pensado para tests y
+    para probar el modo batch con el comando en modo --wait.
+    """
+    
+    def __init__(self, responder: Callable[[str, Dict[str, Any]], Optional[str]] = None):
+        self.responder = responder or self.placeholder_module
+        self._batches: Dict[str, List[Dict[str, Any]]] = {}
+    
+    def submit(self, requests: List[Dict[str, Any]]) -> str:
+        batch_id = f"msgbatch_stub_{uuid.uuid4().hex}"
+        self._batches[batch_id] = list(requests)
+        return batch_id
+    
+    def is_ended(self, batch_id: str) -> bool:
+        return batch_id in self._batches
+    
+    def results(self, batch_id: str) -> Iterator[Dict[str, Any]]:
+        for request in self._batches.pop(batch_id, []):
+            text = self.responder(request['custom_id'], request['params'])
+            yield {
+                'custom_id': request['custom_id'],
+                'text': text,
+                'stop_reason': 'end_turn' if text is not None else None,
+                'error': None if text is not None else 'errored: stub'
+            }
+    
+    @staticmethod
+    def placeholder_module(custom_id: str, params: Dict[str, Any]) -> str:
+        _, module_number = BatchGenerationService.parse_custom_id(custom_id)
+        return json.dumps({
+            'module_id': f"modulo_{module_number}",
+            'title': f"Módulo {module_number}",
+            'description': "Contenido generado por el stub de lotes",
+            'objective': "",
+            'concepts': [],
+            'chunks': [
+                {
+                    'chunk_id': f"modulo_{module_number}_chunk_{order}",
+                    'title': f"Chunk {order}",
+                    'content': f"Contenido del chunk {order}",
+                    'chunk_order': order,
+                    'total_chunks': 4,
+                    'video_search_query': ""
+                }
+                for order in range(1, 5)
+            ],
+            'quiz': [
+                {
+                    'question': "Pregunta de ejemplo",
+                    'options': ["A", "B", "C", "D"],
+                    'correct_answer': 0,
+                    'explanation': ""
+                }
+            ],
+            'summary': ""
+        }, ensure_ascii=False)
+
+
+class BatchGenerationService:
+    """
+    Generación offline de módulos mediante lotes (Message Batches API)
+    
+    Agrupa las peticiones de módulos de muchos cursos en un único lote y
+    devuelve los resultados agrupados por curso y número de módulo. Los
+    resultados correctos se guardan también en response_cache.
+    """
+    
+    def __init__(self):
+        self._backend = None
+    
+    @property
+    def backend(self):
+        if self._backend is None:
+            if settings.ANTHROPIC_BATCH_BACKEND == 'stub':
+                self._backend = StubBatchBackend()
+            else:
+                self._backend = AnthropicBatchBackend()
+        return self._backend
+    
+    @backend.setter
+    def backend(self, backend):
+        self._backend = backend
+    
+    @staticmethod
+    def make_custom_id(course_id: str, module_number: int) -> str:
+        # custom_id solo admite [a-zA-Z0-9_-] y hasta 64 caracteres
+        return f"{uuid.UUID(str(course_id)).hex}-m{module_number}"
+    
+    @staticmethod
+    def parse_custom_id(custom_id: str) -> Tuple[str, int]:
+        course_hex, module_part = custom_id.rsplit('-m', 1)
+        return str(uuid.UUID(course_hex)), int(module_part)
+    
+    def submit_modules(self, modules: List[Tuple[str, Dict[str, Any], int]]) -> str:
+        """
+        Enviar un lote con los módulos indicados como (course_id, course_metadata, module_number)
+        """
+        requests = [
+            {
+                'custom_id': self.make_custom_id(course_id, module_number),
+                'params': anthropic_service.module_request_params(course_metadata, module_number)
+            }
+            for course_id, course_metadata, module_number in modules
+        ]
+        
+        batch_id = self.backend.submit(requests)
+        logger.info(f"Lote {batch_id} enviado con {len(requests)} módulos")
+        return batch_id
+    
+    def is_ended(self, batch_id: str) -> bool:
+        return self.backend.is_ended(batch_id)
+    
+    def module_results(self, batch_id: str) -> Dict[str, Dict[int, Dict[str, Any]]]:
+        """
+        Resultados del lote agrupados como {course_id: {module_number: resultado}}
+        """
+        results: Dict[str, Dict[int, Dict[str, Any]]] = {}
+        for result in self.backend.results(batch_id):
+            try:
+                course_id, module_number = self.parse_custom_id(result['custom_id'])
+            except ValueError:
+                logger.warning(f"custom_id desconocido en el lote {batch_id}: {result['custom_id']}")
+                continue
+            results.setdefault(course_id, {})[module_number] = result
+        return results
+    
+    def module_from_result(self, result: Optional[Dict[str, Any]], course_metadata: Dict[str, Any],
+                           module_number: int) -> Optional[Dict[str, Any]]:
+        """
+        Interpretar el resultado de un módulo; None si falló o no es un módulo válido
+        """
+        if not result or result.get('text') is None:
+            record_call_stat('batch_errors')
+            logger.warning(f"Módulo {module_number} sin resultado en el lote: {result and result.get('error')}")
+            return None
+        
+        try:
+            module_data, outcome = response_parser.parse(result['text'])
+        except ValueError as e:
+            record_call_stat('json_failed')
+            logger.warning(f"Respuesta del lote no válida para módulo {module_number}: {e}")
+            return None
+        
+        record_call_stat(f'json_{outcome}')
+        if not isinstance(module_data, dict) or not anthropic_service.validate_module_structure(module_data):
+            return None
+        
+        if result.get('stop_reason') == 'end_turn':
+            params = anthropic_service.module_request_params(course_metadata, module_number)
+            response_cache.set(response_cache.make_key(params), result['text'])
+        
+        record_call_stat('batch_results')
+        return module_data
+
+
+# Instancia global del servicio
+batch_generation_service = BatchGenerationService()
@@ -0,0 +1,116 @@
+import logging
+from typing import List
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from courses.models import Course, Module, GenerationStep
+
+logger = logging.getLogger(__name__)
+
+
+class CheckpointService:
+    """
+    Estado persistente de la generación de cada curso, por etapa y por módulo
+    
+    Cada etapa lo consulta antes de trabajar y lo actualiza al terminar, así una
+    tarea re-entregada (task_acks_late) o relanzada retoma exactamente donde se
+    quedó: no repite llamadas a Claude de lo ya guardado y rehace los módulos
+    que quedaron a medio escribir.
+    """
+    
+    def start(self, course: Course, stage: str, module_number: int = 0) -> bool:
+        """
+        Marcar la etapa como en progreso e incrementar sus intentos
+        
+        Retorna False si la etapa ya estaba completa o agotó sus intentos.
+        """
+        with transaction.atomic():
+            step, _ = GenerationStep.objects.select_for_update().get_or_create(
+                course=course, stage=stage, module_number=module_number
+            )
+            
+            if step.status == GenerationStep.StatusChoices.DONE:
+                return False
+            
+            if step.attempts >= settings.GENERATION_MAX_STEP_ATTEMPTS:
+                logger.warning(
+                    f"Etapa {stage} {module_number} del curso {course.id} sin reintentos "
+                    f"({step.attempts} intentos): {step.last_error}"
+                )
+                return False
+            
+            step.status = GenerationStep.StatusChoices.RUNNING
+            step.attempts += 1
+            step.started_at = timezone.now()
+            step.save(update_fields=['status', 'attempts', 'started_at', 'updated_at'])
+            return True
+    
+    def complete(self, course: Course, stage: str, module_number: int = 0):
+        GenerationStep.objects.update_or_create(
+            course=course, stage=stage, module_number=module_number,
+            defaults={
+                'status': GenerationStep.StatusChoices.DONE,
+                'last_error': '',
+                'finished_at': timezone.now()
+            }
+        )
+    
+    def fail(self, course: Course, stage: str, module_number: int = 0, error: Exception = None):
+        GenerationStep.objects.update_or_create(
+            course=course, stage=stage, module_number=module_number,
+            defaults={
+                'status': GenerationStep.StatusChoices.FAILED,
+                'last_error': str(error or '')[:2000],
+                'finished_at': timezone.now()
+            }
+        )
+    
+    def is_done(self, course: Course, stage: str, module_number: int = 0) -> bool:
+        return GenerationStep.objects.filter(
+            course=course, stage=stage, module_number=module_number,
+            status=GenerationStep.StatusChoices.DONE
+        ).exists()
+    
+    def is_running(self, course: Course, stage: str, module_number: int = 0) -> bool:
+        return GenerationStep.objects.filter(
+            course=course, stage=stage, module_number=module_number,
+            status=GenerationStep.StatusChoices.RUNNING
+        ).exists()
+    
+    def pending_modules(self, course: Course, module_numbers: List[int]) -> List[int]:
+        """
+        Módulos que aún hay que generar
+        
+        Un módulo cuenta como hecho si está guardado completo y con chunks. Los
+        que quedaron a medio escribir (is_complete=False o sin chunks) se borran
+        para generarlos de nuevo.
+        """
+        modules = {
+            module.module_order: module
+            for module in Module.objects.filter(course=course, module_order__in=module_numbers)
+            .annotate(saved_chunks=Count('chunks'))
+        }
+        
+        pending = []
+        for module_number in module_numbers:
+            module = modules.get(module_number)
+            
+            if module is not None and module.is_complete and module.saved_chunks:
+                if not self.is_done(course, GenerationStep.StageChoices.MODULE, module_number):
+                    # Guardado antes de caer el worker: solo faltaba el checkpoint
+                    self.complete(course, GenerationStep.StageChoices.MODULE, module_number)
+                continue
+            
+            if module is not None:
+                logger.warning(f"Módulo {module_number} del curso {course.id} a medio escribir, se regenera")
+                module.delete()
+            
+            pending.append(module_number)
+        
+        return pending
+
+
+# Instancia global del servicio
+checkpoint_service = CheckpointService()
@@ -0,0 +1,104 @@
+import json
+import logging
+from typing import Dict, Any, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class JsonArrayStreamParser:
+    """
+    Parser incremental para respuestas JSON que llegan por streaming
+    
+    Recibe fragmentos de texto con feed() y devuelve cada elemento del array
+    `array_key` del objeto raíz en cuanto se cierra, sin esperar al final de la
+    respuesta. También expone los campos del objeto raíz anteriores al array
+    (header), que en los módulos son module_id, title, description, etc.
+    """
+    
+    def __init__(self, array_key: str = 'chunks'):
+        self.array_key = array_key
+        self.buffer = ''
+        self._position = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._string_start = None
+        self._last_key = None
+        self._last_key_start = None
+        self._root_start = None
+        self._array_key_start = None
+        self._array_depth = None
+        self._element_start = None
+        self.array_closed = False
+    
+    def feed(self, text: str) -> List[Dict[str, Any]]:
+        """
+        Añadir texto recibido y devolver los elementos del array completados
+        """
+        self.buffer += text
+        completed = []
+        
+        while self._position < len(self.buffer):
+            index = self._position
+            char = self.buffer[index]
+            self._position += 1
+            
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == '\\':
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    if self._depth == 1:
+                        # En el objeto raíz, el último string antes de '[' es la clave del array
+                        self._last_key = self.buffer[self._string_start + 1:index]
+                        self._last_key_start = self._string_start
+                continue
+            
+            if char == '"':
+                self._in_string = True
+                self._string_start = index
+            elif char in '{[':
+                if self._depth == 0 and char == '{':
+                    self._root_start = index
+                elif (self._depth == 1 and char == '[' and self._array_depth is None
+                        and self._last_key == self.array_key):
+                    self._array_depth = 2
+                    self._array_key_start = self._last_key_start
+                elif self._array_depth is not None and self._depth == self._array_depth and not self.array_closed:
+                    self._element_start = index
+                self._depth += 1
+            elif char in '}]':
+                self._depth -= 1
+                if self._array_depth is not None and not self.array_closed:
+                    if self._depth == self._array_depth and self._element_start is not None:
+                        element = self._parse_element(self.buffer[self._element_start:index + 1])
+                        if element is not None:
+                            completed.append(element)
+                        self._element_start = None
+                    elif self._depth == 1 and char == ']':
+                        self.array_closed = True
+        
+        return completed
+    
+    def header(self) -> Optional[Dict[str, Any]]:
+        """
+        Campos del objeto raíz anteriores al array (None si aún no se alcanzó el array)
+        """
+        if self._root_start is None or self._array_key_start is None:
+            return None
+        
+        prefix = self.buffer[self._root_start:self._array_key_start].rstrip().rstrip(',')
+        try:
+            return json.loads(prefix + '}')
+        except json.JSONDecodeError as e:
+            logger.warning(f"No se pudo interpretar la cabecera del módulo en streaming: {e}")
+            return {}
+    
+    def _parse_element(self, text: str) -> Optional[Dict[str, Any]]:
+        try:
+            return json.loads(text)
+        except json.JSONDecodeError as e:
+            logger.warning(f"Elemento de '{self.array_key}' no válido en streaming: {e}")
+            return None
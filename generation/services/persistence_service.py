@@ -0,0 +1,236 @@
+import logging
+from typing import Dict, Any, List, Tuple
+from django.db import transaction
+from django.utils import timezone
+
+from courses.models import Course, Module, Chunk, Video, Quiz
+
+logger = logging.getLogger(__name__)
+
+# Campos de contenido que se copian al reutilizar un curso existente
+CLONED_COURSE_FIELDS = [
+    'title', 'description', 'prerequisites', 'total_modules', 'module_list', 'topics',
+    'podcast_script', 'podcast_audio_url', 'introduction', 'final_project_data',
+    'total_size_estimate', 'language', 'total_chunks',
+]
+
+
+class PersistenceService:
+    """Servicio para persistir en la base de datos el contenido generado por Claude"""
+    
+    def save_module(self, course: Course, module_number: int, module_data: Dict[str, Any]) -> Tuple[Module, List[Chunk]]:
+        """
+        Guardar un módulo completo (módulo, chunks y quiz) en una sola transacción
+        
+        Usa bulk_create para que un módulo cueste unas pocas sentencias en lugar de
+        una por fila, y nunca quede visible a medio escribir.
+        """
+        with transaction.atomic():
+            module = Module.objects.create(
+                course=course,
+                module_id=module_data.get('module_id', f'modulo_{module_number}'),
+                module_order=module_number,
+                title=module_data.get('title', ''),
+                description=module_data.get('description', ''),
+                objective=module_data.get('objective', ''),
+                concepts=module_data.get('concepts', []),
+                summary=module_data.get('summary', ''),
+                practical_exercise=module_data.get('practical_exercise', {}),
+                resources=module_data.get('resources', {})
+            )
+            
+            chunks = [
+                Chunk(
+                    module=module,
+                    chunk_id=chunk_data.get('chunk_id', ''),
+                    title=chunk_data.get('title', ''),
+                    chunk_order=chunk_data.get('chunk_order', 1),
+                    total_chunks=chunk_data.get('total_chunks', 6),
+                    content=chunk_data.get('content', ''),
+                    checksum=chunk_data.get('checksum', '')
+                )
+                for chunk_data in module_data.get('chunks', [])
+            ]
+            for chunk in chunks:
+                chunk.render_content()  # HTML listo antes de la primera visita
+            chunks = Chunk.objects.bulk_create(chunks)
+            module.add_chunks(len(chunks))
+            
+            Quiz.objects.bulk_create([
+                Quiz(
+                    module=module,
+                    question=question_data.get('question', ''),
+                    options=question_data.get('options', []),
+                    correct_answer=question_data.get('correct_answer', 0),
+                    explanation=question_data.get('explanation', '')
+                )
+                for question_data in module_data.get('quiz', [])
+            ])
+        
+        logger.info(f"Módulo {module_number} guardado con {len(chunks)} chunks")
+        return module, chunks
+    
+    def start_streamed_module(self, course: Course, module_number: int, header: Dict[str, Any]) -> Module:
+        """
+        Crear el módulo (incompleto) con los campos recibidos antes del primer chunk
+        """
+        return Module.objects.create(
+            course=course,
+            module_id=header.get('module_id', f'modulo_{module_number}'),
+            module_order=module_number,
+            title=header.get('title', ''),
+            description=header.get('description', ''),
+            objective=header.get('objective', ''),
+            concepts=header.get('concepts', []),
+            is_complete=False
+        )
+    
+    def save_streamed_chunk(self, module: Module, chunk_data: Dict[str, Any]) -> Chunk:
+        """
+        Guardar un chunk en cuanto llega por streaming (queda visible de inmediato)
+        """
+        chunk = Chunk(
+            module=module,
+            chunk_id=chunk_data.get('chunk_id', ''),
+            title=chunk_data.get('title', ''),
+            chunk_order=chunk_data.get('chunk_order', 1),
+            total_chunks=chunk_data.get('total_chunks', 6),
+            content=chunk_data.get('content', ''),
+            checksum=chunk_data.get('checksum', '')
+        )
+        chunk.render_content()
+        with transaction.atomic():
+            chunk.save()
+            module.add_chunks(1)
+        return chunk
+    
+    def finish_streamed_module(self, module: Module, module_data: Dict[str, Any]) -> List[Chunk]:
+        """
+        Completar un módulo generado en streaming: campos finales, quiz y marca de completo
+        """
+        with transaction.atomic():
+            module.title = module_data.get('title', module.title)
+            module.description = module_data.get('description', module.description)
+            module.objective = module_data.get('objective', module.objective)
+            module.concepts = module_data.get('concepts', module.concepts)
+            module.summary = module_data.get('summary', '')
+            module.practical_exercise = module_data.get('practical_exercise', {})
+            module.resources = module_data.get('resources', {})
+            module.is_complete = True
+            # Sin total_chunks: save_streamed_chunk ya lo incrementó en la base de datos
+            module.save(update_fields=[
+                'title', 'description', 'objective', 'concepts', 'summary',
+                'practical_exercise', 'resources', 'is_complete', 'updated_at'
+            ])
+            
+            Quiz.objects.bulk_create([
+                Quiz(
+                    module=module,
+                    question=question_data.get('question', ''),
+                    options=question_data.get('options', []),
+                    correct_answer=question_data.get('correct_answer', 0),
+                    explanation=question_data.get('explanation', '')
+                )
+                for question_data in module_data.get('quiz', [])
+            ])
+        
+        return list(module.chunks.all())
+    
+    def complete_partial_module(self, module: Module, module_data: Dict[str, Any]) -> List[Chunk]:
+        """
+        Completar un módulo que quedó a medias (streaming interrumpido) con una
+        respuesta nueva, sin tocar los chunks ya guardados
+        
+        Esos chunks pueden estar leyéndose ya: solo se añaden los chunk_order que
+        faltan y después se guardan quiz, resumen y la marca de completo.
+        """
+        saved_orders = set(module.chunks.values_list('chunk_order', flat=True))
+        with transaction.atomic():
+            for chunk_data in module_data.get('chunks', []):
+                if chunk_data.get('chunk_order', 1) not in saved_orders:
+                    self.save_streamed_chunk(module, chunk_data)
+            return self.finish_streamed_module(module, module_data)
+    
+    def save_chunk_videos(self, chunks: List[Chunk], videos_per_chunk: List[List[Dict[str, Any]]]) -> int:
+        """
+        Guardar el mejor video encontrado para cada chunk en una sola sentencia
+        
+        Los chunks que ya tienen video se ignoran, por lo que es seguro repetirlo.
+        """
+        videos = []
+        for chunk, chunk_videos in zip(chunks, videos_per_chunk):
+            if not chunk_videos:
+                continue  # Continuar sin video si falla la búsqueda
+            
+            video_data = chunk_videos[0]  # Tomar el primer video
+            videos.append(Video(
+                chunk=chunk,
+                video_id=video_data.get('video_id', ''),
+                title=video_data.get('title', ''),
+                url=video_data.get('url', ''),
+                embed_url=video_data.get('embed_url', ''),
+                thumbnail_url=video_data.get('thumbnail_url', ''),
+                duration=video_data.get('duration', 'N/A'),
+                view_count=video_data.get('view_count', 0)
+            ))
+        
+        with transaction.atomic():
+            Video.objects.bulk_create(videos, ignore_conflicts=True)
+        
+        return len(videos)
+    
+    def clone_course(self, source: Course, target: Course) -> Course:
+        """
+        Copiar el contenido y el árbol de módulos de un curso completo a otro curso
+        
+        Se usa para reutilizar cursos casi idénticos en lugar de regenerarlos; toda
+        la copia ocurre en una transacción con un bulk_create por tabla.
+        """
+        source_modules = list(
+            source.modules.prefetch_related('chunks__video', 'quizzes')
+        )
+        
+        new_modules, new_chunks, new_videos, new_quizzes = [], [], [], []
+        for module in source_modules:
+            new_module = Module(course=target, **self._copy_fields(module, exclude=['course']))
+            new_modules.append(new_module)
+            
+            for chunk in module.chunks.all():
+                new_chunk = Chunk(module=new_module, **self._copy_fields(chunk, exclude=['module']))
+                new_chunks.append(new_chunk)
+                
+                if hasattr(chunk, 'video'):
+                    new_videos.append(Video(chunk=new_chunk, **self._copy_fields(chunk.video, exclude=['chunk'])))
+            
+            for quiz in module.quizzes.all():
+                new_quizzes.append(Quiz(module=new_module, **self._copy_fields(quiz, exclude=['module'])))
+        
+        with transaction.atomic():
+            for field in CLONED_COURSE_FIELDS:
+                setattr(target, field, getattr(source, field))
+            target.status = Course.StatusChoices.COMPLETE
+            target.completed_at = timezone.now()
+            target.save()
+            
+            Module.objects.bulk_create(new_modules)
+            Chunk.objects.bulk_create(new_chunks)
+            Video.objects.bulk_create(new_videos)
+            Quiz.objects.bulk_create(new_quizzes)
+        
+        logger.info(f"Curso {source.id} clonado en {target.id} ({len(new_modules)} módulos)")
+        return target
+    
+    def _copy_fields(self, instance, exclude: List[str]) -> Dict[str, Any]:
+        """
+        Valores de los campos concretos de una fila, sin id ni timestamps
+        """
+        skipped = {'id', 'created_at', 'updated_at', *exclude}
+        return {
+            field.attname: getattr(instance, field.attname)
+            for field in instance._meta.concrete_fields
+            if field.name not in skipped
+        }
+
+
+# Instancia global del servicio
+persistence_service = PersistenceService()
@@ -0,0 +1,37 @@
+import logging
+from typing import Dict, Optional
+from celery import current_app
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+class QueueMetricsService:
+    """Métricas de las colas de Celery (mensajes pendientes por cola)"""
+    
+    @property
+    def queues(self):
+        return list(settings.CELERY_WORKER_QUEUE_CONCURRENCY.keys())
+    
+    def get_queue_depths(self) -> Dict[str, Optional[int]]:
+        """
+        Número de tareas en espera en cada cola (None si el broker no responde)
+        """
+        depths: Dict[str, Optional[int]] = {queue: None for queue in self.queues}
+        
+        try:
+            with current_app.connection_for_read() as connection:
+                channel = connection.default_channel
+                for queue in self.queues:
+                    try:
+                        depths[queue] = channel.queue_declare(queue=queue, passive=True).message_count
+                    except connection.channel_errors:
+                        depths[queue] = 0  # La cola aún no existe en el broker
+        except Exception as e:
+            logger.warning(f"No se pudo consultar la profundidad de las colas: {e}")
+        
+        return depths
+
+
+# Instancia global del servicio
+queue_metrics_service = QueueMetricsService()
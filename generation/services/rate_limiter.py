@@ -0,0 +1,217 @@
+import time
+import random
+import asyncio
+import logging
+import threading
+from email.utils import parsedate_to_datetime
+from typing import Dict, Any, Optional, Tuple
+
+import anthropic
+import redis
+from django.conf import settings
+
+from .response_cache import record_call_stat
+
+logger = logging.getLogger(__name__)
+
+
+# Dos token buckets (peticiones/minuto y tokens/minuto) actualizados de forma
+# atómica en Redis. Devuelve 0 si la llamada se admite (y descuenta el coste) o
+# los milisegundos a esperar hasta que haya capacidad. Un coste negativo
+# devuelve tokens al bucket (ajuste tras conocer el uso real).
+TOKEN_BUCKET_SCRIPT = """
+local time = redis.call('TIME')
+local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+local wait = 0
+local levels = {}
+
+for i = 1, 2 do
+    local capacity = tonumber(ARGV[(i - 1) * 2 + 1])
+    local cost = math.min(tonumber(ARGV[(i - 1) * 2 + 2]), capacity)
+    local state = redis.call('HMGET', KEYS[i], 'level', 'updated_at')
+    local level = tonumber(state[1]) or capacity
+    local updated_at = tonumber(state[2]) or now
+    level = math.min(capacity, level + (now - updated_at) * capacity / 60000)
+    if cost > 0 and level < cost then
+        wait = math.max(wait, math.ceil((cost - level) * 60000 / capacity))
+    end
+    levels[i] = {level, cost, capacity}
+end
+
+for i = 1, 2 do
+    local level = levels[i][1]
+    if wait == 0 then
+        level = math.min(levels[i][3], level - levels[i][2])
+    end
+    redis.call('HSET', KEYS[i], 'level', tostring(level), 'updated_at', now)
+    redis.call('PEXPIRE', KEYS[i], 120000)
+end
+
+return wait
+"""
+
+
+class RateLimiter:
+    """
+    Limitador de llamadas a Claude compartido por todos los workers de Celery
+    
+    Cada llamada se admite según su coste estimado (tokens de entrada + max_tokens)
+    contra los límites ANTHROPIC_REQUESTS_PER_MINUTE y ANTHROPIC_TOKENS_PER_MINUTE.
+    El estado vive en Redis (script Lua atómico); si Redis no está disponible se
+    usa un bucket en memoria del proceso.
+    """
+    
+    KEY_PREFIX = 'claude:ratelimit'
+    CHARS_PER_TOKEN = 3.5
+    REDIS_RETRY_INTERVAL = 30  # segundos usando el bucket local tras un fallo de Redis
+    
+    def __init__(self):
+        self._redis = None
+        self._script = None
+        self._redis_retry_at = 0.0
+        self._lock = threading.Lock()
+        self._local_buckets: Dict[str, Tuple[float, float]] = {}
+    
+    @property
+    def enabled(self) -> bool:
+        return settings.ANTHROPIC_RATE_LIMIT_ENABLED
+    
+    def estimate_tokens(self, params: Dict[str, Any]) -> int:
+        """
+        Estimar los tokens de una petición: entrada aproximada por caracteres + max_tokens
+        """
+        system = params.get('system', '')
+        if isinstance(system, list):
+            system = ''.join(block.get('text', '') for block in system)
+        characters = len(system)
+        for message in params.get('messages', []):
+            characters += len(str(message.get('content', '')))
+        return int(characters / self.CHARS_PER_TOKEN) + params.get('max_tokens', 0)
+    
+    async def acquire(self, tokens: int):
+        """
+        Esperar hasta que la llamada quepa en los límites de peticiones y tokens
+        """
+        if not self.enabled:
+            return
+        
+        while True:
+            wait = await asyncio.to_thread(self._take, 1, tokens)
+            if wait <= 0:
+                return
+            record_call_stat('rate_limit_waits')
+            logger.info(f"Límite de Claude alcanzado, esperando {wait:.1f}s")
+            await asyncio.sleep(wait)
+    
+    async def refund(self, tokens: int):
+        """
+        Devolver al bucket los tokens estimados de más (tras conocer el uso real)
+        """
+        if not self.enabled or tokens <= 0:
+            return
+        await asyncio.to_thread(self._take, 0, -tokens)
+    
+    def _take(self, requests: int, tokens: int) -> float:
+        """
+        Descontar el coste de los buckets; retorna los segundos a esperar (0 si se admite)
+        """
+        limits = [
+            (f'{self.KEY_PREFIX}:requests', settings.ANTHROPIC_REQUESTS_PER_MINUTE, requests),
+            (f'{self.KEY_PREFIX}:tokens', settings.ANTHROPIC_TOKENS_PER_MINUTE, tokens),
+        ]
+        
+        if time.monotonic() < self._redis_retry_at:
+            return self._take_local(limits)
+        
+        try:
+            wait_ms = self._get_script()(
+                keys=[key for key, _, _ in limits],
+                args=[value for _, capacity, cost in limits for value in (capacity, cost)]
+            )
+            return int(wait_ms) / 1000
+        except redis.RedisError as e:
+            logger.warning(f"Redis no disponible para el rate limiter, usando límite local: {e}")
+            self._redis_retry_at = time.monotonic() + self.REDIS_RETRY_INTERVAL
+            return self._take_local(limits)
+    
+    def _take_local(self, limits) -> float:
+        """
+        Mismo algoritmo que TOKEN_BUCKET_SCRIPT sobre buckets en memoria del proceso
+        """
+        with self._lock:
+            now = time.monotonic()
+            wait = 0.0
+            levels = []
+            
+            for key, capacity, cost in limits:
+                cost = min(cost, capacity)
+                level, updated_at = self._local_buckets.get(key, (capacity, now))
+                level = min(capacity, level + (now - updated_at) * capacity / 60)
+                if cost > 0 and level < cost:
+                    wait = max(wait, (cost - level) * 60 / capacity)
+                levels.append((key, capacity, cost, level))
+            
+            for key, capacity, cost, level in levels:
+                if not wait:
+                    level = min(capacity, level - cost)
+                self._local_buckets[key] = (level, now)
+            
+            return wait
+    
+    def _get_script(self):
+        if self._script is None:
+            self._redis = redis.Redis.from_url(
+                settings.ANTHROPIC_RATE_LIMIT_REDIS_URL,
+                socket_connect_timeout=1,
+                socket_timeout=1
+            )
+            self._script = self._redis.register_script(TOKEN_BUCKET_SCRIPT)
+        return self._script
+
+
+def is_retryable(error: Exception) -> bool:
+    """
+    Errores de Claude que merece la pena reintentar (429, sobrecarga, 5xx, red)
+    """
+    if isinstance(error, anthropic.APIConnectionError):
+        return True
+    if isinstance(error, anthropic.APIStatusError):
+        return error.status_code in (408, 409, 429) or error.status_code >= 500
+    return False
+
+
+def retry_delay(attempt: int, error: Exception = None) -> float:
+    """
+    Espera antes del reintento: retry-after si la API lo indica, si no backoff
+    exponencial con jitter completo
+    """
+    retry_after = _retry_after(error)
+    if retry_after is not None:
+        return retry_after + random.uniform(0, settings.ANTHROPIC_RETRY_BASE_DELAY)
+    
+    ceiling = min(settings.ANTHROPIC_RETRY_MAX_DELAY, settings.ANTHROPIC_RETRY_BASE_DELAY * 2 ** attempt)
+    return random.uniform(0, ceiling)
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    response = getattr(error, 'response', None)
+    if response is None:
+        return None
+    
+    headers = response.headers
+    try:
+        if headers.get('retry-after-ms'):
+            return float(headers['retry-after-ms']) / 1000
+        if headers.get('retry-after'):
+            value = headers['retry-after']
+            try:
+                return max(0.0, float(value))
+            except ValueError:
+                return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        pass
+    return None
+
+
+# Instancia global del limitador
+rate_limiter = RateLimiter()
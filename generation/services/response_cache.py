@@ -0,0 +1,120 @@
+import json
+import hashlib
+import logging
+import threading
+from contextvars import ContextVar
+from typing import Dict, Any, Optional
+from django.conf import settings
+from django.core.cache import caches
+
+logger = logging.getLogger(__name__)
+
+
+class CallStats:
+    """Contadores de llamadas a Claude acumulados durante una fase de generación"""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, int] = {}
+    
+    def increment(self, name: str, amount: int = 1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + amount
+    
+    def as_dict(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._counters)
+
+
+_current_stats: ContextVar[Optional[CallStats]] = ContextVar('claude_call_stats', default=None)
+
+
+def start_call_stats() -> CallStats:
+    """
+    Iniciar un CallStats nuevo para las llamadas a Claude de la tarea actual
+    
+    Las tareas asyncio (y los hilos de asyncio.to_thread) heredan el contexto,
+    por lo que todas las llamadas de la fase comparten el mismo CallStats.
+    """
+    stats = CallStats()
+    _current_stats.set(stats)
+    return stats
+
+
+def record_call_stat(name: str, amount: int = 1):
+    """Sumar a un contador del CallStats activo (si lo hay)"""
+    stats = _current_stats.get()
+    if stats is not None:
+        stats.increment(name, amount)
+
+
+class ResponseCache:
+    """
+    Caché de respuestas de Claude direccionada por contenido
+    
+    La clave es un hash SHA-256 de la petición completa (modelo, system prompt,
+    mensajes, max_tokens, temperatura). El almacenamiento es cualquier backend de
+    CACHES: Redis en producción (TTL + allkeys-lru en un Redis dedicado) o
+    FileBasedCache en local/tests (TTL + MAX_ENTRIES).
+    """
+    
+    def __init__(self, alias: str = None):
+        self.alias = alias
+    
+    @property
+    def enabled(self) -> bool:
+        return settings.ANTHROPIC_RESPONSE_CACHE_ENABLED
+    
+    @property
+    def backend(self):
+        return caches[self.alias or settings.ANTHROPIC_RESPONSE_CACHE_ALIAS]
+    
+    def make_key(self, request_params: Dict[str, Any]) -> str:
+        payload = json.dumps(request_params, sort_keys=True, ensure_ascii=False)
+        return f"claude:response:{hashlib.sha256(payload.encode('utf-8')).hexdigest()}"
+    
+    def get(self, key: str) -> Optional[str]:
+        if not self.enabled:
+            return None
+        try:
+            return self.backend.get(key)
+        except Exception as e:
+            logger.warning(f"Error leyendo caché de respuestas de Claude: {e}")
+            return None
+    
+    def set(self, key: str, response: str):
+        if not self.enabled:
+            return
+        try:
+            self.backend.set(key, response)
+        except Exception as e:
+            logger.warning(f"Error guardando en caché de respuestas de Claude: {e}")
+    
+    async def aget(self, key: str) -> Optional[str]:
+        if not self.enabled:
+            return None
+        try:
+            return await self.backend.aget(key)
+        except Exception as e:
+            logger.warning(f"Error leyendo caché de respuestas de Claude: {e}")
+            return None
+    
+    async def aset(self, key: str, response: str):
+        if not self.enabled:
+            return
+        try:
+            await self.backend.aset(key, response)
+        except Exception as e:
+            logger.warning(f"Error guardando en caché de respuestas de Claude: {e}")
+    
+    async def adelete(self, key: str):
+        if not self.enabled:
+            return
+        try:
+            await self.backend.adelete(key)
+        except Exception as e:
+            logger.warning(f"Error borrando de la caché de respuestas de Claude: {e}")
+
+
+# Instancia global de la caché
+response_cache = ResponseCache()
@@ -0,0 +1,180 @@
+import re
+import json
+import logging
+from typing import Any, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+# Bloque ``` que abre la respuesta; los ``` dentro de strings JSON (código en
+# los chunks) no se tocan
+OPENING_FENCE_PATTERN = re.compile(r"\A\s*```[a-zA-Z]*[ \t]*\n?")
+CLOSERS = {'{': '}', '[': ']'}
+
+
+class ResponseParser:
+    """
+    Extracción y reparación de JSON en respuestas de Claude
+    
+    parse() intenta, en orden:
+    - 'clean': la respuesta es JSON válido tal cual
+    - 'extracted': JSON válido tras quitar el bloque ``` exterior y el texto alrededor del valor
+    - 'repaired': JSON truncado (p. ej. por max_tokens) cerrando el string y los
+      arrays/objetos abiertos, o recortando hasta el último elemento completo
+    
+    Si nada funciona lanza ValueError.
+    """
+    
+    # Máximo de puntos de corte a probar al reparar (desde el final)
+    MAX_REPAIR_ATTEMPTS = 50
+    
+    # Máximo de valores ({...} o [...]) a probar al buscar el JSON
+    MAX_VALUE_STARTS = 20
+    
+    def parse(self, text: str) -> Tuple[Any, str]:
+        """
+        Interpretar la respuesta y devolver (datos, resultado)
+        """
+        try:
+            return json.loads(text), 'clean'
+        except (json.JSONDecodeError, TypeError):
+            pass
+        
+        candidate, complete = self.extract(text or '')
+        if candidate is None:
+            raise ValueError("La respuesta no contiene JSON")
+        
+        if complete:
+            try:
+                return json.loads(candidate), 'extracted'
+            except json.JSONDecodeError:
+                pass
+        
+        repaired = self.repair(candidate)
+        if repaired is not None:
+            return repaired, 'repaired'
+        
+        raise ValueError("No se pudo interpretar ni reparar el JSON de la respuesta")
+    
+    def extract(self, text: str) -> Tuple[Any, bool]:
+        """
+        Localizar el valor JSON más externo
+        
+        Retorna (texto del valor, completo). Recorre los { o [ de la respuesta
+        (el texto previo puede contener corchetes) saltando cada valor cerrado
+        que no es JSON válido, sin entrar en él. Un valor que no se cierra es una
+        respuesta truncada y se devuelve hasta el final con completo=False.
+        """
+        fence = OPENING_FENCE_PATTERN.match(text)
+        if fence:
+            text = text[fence.end():]
+        
+        first_invalid = None
+        position = 0
+        for _ in range(self.MAX_VALUE_STARTS):
+            start = min((index for index in (text.find('{', position), text.find('[', position)) if index >= 0),
+                        default=-1)
+            if start < 0:
+                break
+            
+            end = self._value_end(text, start)
+            if end is None:
+                return text[start:], False
+            
+            candidate = text[start:end]
+            try:
+                json.loads(candidate)
+            except json.JSONDecodeError:
+                first_invalid = first_invalid or candidate
+                position = end
+                continue
+            return candidate, True
+        
+        # Ningún valor válido: el primero cerrado queda para repair()
+        return first_invalid, first_invalid is not None
+    
+    def _value_end(self, text: str, start: int) -> Any:
+        """
+        Posición tras el cierre del valor que empieza en start (ignorando
+        corchetes dentro de strings), o None si no se cierra
+        """
+        depth = 0
+        in_string = False
+        escape = False
+        for index in range(start, len(text)):
+            char = text[index]
+            if in_string:
+                if escape:
+                    escape = False
+                elif char == '\\':
+                    escape = True
+                elif char == '"':
+                    in_string = False
+            elif char == '"':
+                in_string = True
+            elif char in '{[':
+                depth += 1
+            elif char in '}]':
+                depth -= 1
+                if depth == 0:
+                    return index + 1
+        
+        return None
+    
+    def repair(self, text: str) -> Any:
+        """
+        Reparar un JSON truncado; retorna el valor interpretado o None
+        """
+        stack: List[str] = []
+        cut_points: List[Tuple[int, str]] = []
+        in_string = False
+        escape = False
+        
+        for index, char in enumerate(text):
+            if in_string:
+                if escape:
+                    escape = False
+                elif char == '\\':
+                    escape = True
+                elif char == '"':
+                    in_string = False
+                continue
+            
+            if char == '"':
+                in_string = True
+            elif char in '{[':
+                stack.append(char)
+                cut_points.append((index + 1, self._closing(stack)))
+            elif char in '}]':
+                if stack:
+                    stack.pop()
+                cut_points.append((index + 1, self._closing(stack)))
+            elif char == ',':
+                # Cortar justo antes de la coma deja el último elemento completo
+                cut_points.append((index, self._closing(stack)))
+        
+        # Primer intento: cerrar el string abierto y los contenedores pendientes
+        tail = text[:-1] if escape else text
+        if in_string:
+            tail += '"'
+        attempts = [tail.rstrip().rstrip(',') + self._closing(stack)]
+        
+        # Después: recortar hasta el último elemento completo
+        for position, closing in reversed(cut_points[-self.MAX_REPAIR_ATTEMPTS:]):
+            attempts.append(text[:position].rstrip().rstrip(',') + closing)
+        
+        for attempt in attempts:
+            try:
+                return json.loads(attempt)
+            except json.JSONDecodeError:
+                continue
+        
+        logger.debug("No se pudo reparar el JSON truncado")
+        return None
+    
+    def _closing(self, stack: List[str]) -> str:
+        return ''.join(CLOSERS[char] for char in reversed(stack))
+
+
+# Instancia global del parser
+response_parser = ResponseParser()
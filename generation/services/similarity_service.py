@@ -0,0 +1,155 @@
+import re
+import math
+import time
+import logging
+import threading
+import unicodedata
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+from django.conf import settings
+
+from courses.models import Course
+
+logger = logging.getLogger(__name__)
+
+
+# Palabras sin contenido temático que se ignoran al comparar prompts
+STOPWORDS = {
+    'a', 'al', 'como', 'con', 'de', 'del', 'desde', 'el', 'en', 'es', 'la', 'las', 'lo', 'los',
+    'me', 'mi', 'para', 'por', 'que', 'se', 'sobre', 'su', 'un', 'una', 'y', 'o', 'cero',
+    'quiero', 'quisiera', 'aprender', 'aprende', 'aprendo', 'ensename', 'ensenar', 'curso',
+    'saber', 'entender', 'conocer', 'basico', 'basicos', 'introduccion', 'hacer', 'usar',
+}
+
+
+class CourseSimilarityService:
+    """
+    Índice local de similitud (TF-IDF sobre trigramas de caracteres) de cursos completos
+    
+    Permite detectar paráfrasis de cursos ya generados ("quiero aprender python",
+    "aprende Python desde cero") al mismo nivel sin llamar a servicios externos.
+    El índice se construye en memoria a partir de los cursos COMPLETE y se
+    reconstruye cada COURSE_REUSE_INDEX_TTL segundos.
+    """
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._built_at = 0.0
+        self._entries: List[Tuple[str, str, Dict[str, float]]] = []  # (course_id, level, vector)
+        self._idf: Dict[str, float] = {}
+        self._default_idf = 1.0
+    
+    def normalize(self, prompt: str, interests: List[str] = None) -> str:
+        """
+        Normalizar prompt e intereses: minúsculas, sin acentos, sin puntuación ni stopwords
+        """
+        text = ' '.join([prompt or ''] + list(interests or []))
+        text = unicodedata.normalize('NFKD', text.lower())
+        text = ''.join(char for char in text if not unicodedata.combining(char))
+        words = re.findall(r'[a-z0-9+#]+', text)
+        return ' '.join(word for word in words if word not in STOPWORDS)
+    
+    def find_similar_course(self, prompt: str, level: str, interests: List[str] = None) -> Optional[Tuple[Course, float]]:
+        """
+        Buscar el curso completo más parecido al mismo nivel
+        
+        Retorna (curso, similitud) si supera COURSE_REUSE_THRESHOLD, o None.
+        """
+        try:
+            self._refresh_index()
+            
+            query = self._vectorize(self._features(self.normalize(prompt, interests)))
+            if not query:
+                return None
+            
+            best_id, best_score = None, 0.0
+            for course_id, course_level, vector in self._entries:
+                if course_level != level:
+                    continue
+                score = sum(weight * vector.get(feature, 0.0) for feature, weight in query.items())
+                if score > best_score:
+                    best_id, best_score = course_id, score
+            
+            if best_id is None or best_score < settings.COURSE_REUSE_THRESHOLD:
+                return None
+            
+            course = Course.objects.filter(id=best_id, status=Course.StatusChoices.COMPLETE).first()
+            if course is None:
+                return None
+            
+            logger.info(f"Curso similar encontrado ({best_score:.2f}): {course.id}")
+            return course, best_score
+        
+        except Exception as e:
+            logger.error(f"Error buscando cursos similares: {e}")
+            return None
+    
+    def _refresh_index(self):
+        """
+        Reconstruir el índice si ha caducado
+        """
+        with self._lock:
+            if time.time() - self._built_at < settings.COURSE_REUSE_INDEX_TTL:
+                return
+            
+            courses = (
+                Course.objects
+                .filter(status=Course.StatusChoices.COMPLETE)
+                .order_by('-created_at')
+                .values_list('id', 'user_level', 'user_prompt', 'user_interests')
+                [:settings.COURSE_REUSE_INDEX_SIZE]
+            )
+            
+            documents = []
+            seen = set()
+            for course_id, level, prompt, interests in courses:
+                normalized = self.normalize(prompt, interests)
+                if not normalized or (level, normalized) in seen:
+                    continue  # Evitar entradas duplicadas (p. ej. cursos ya clonados)
+                seen.add((level, normalized))
+                documents.append((str(course_id), level, self._features(normalized)))
+            
+            document_frequency = Counter()
+            for _, _, features in documents:
+                document_frequency.update(features.keys())
+            
+            total = len(documents)
+            self._idf = {
+                feature: math.log((total + 1) / (count + 1)) + 1
+                for feature, count in document_frequency.items()
+            }
+            self._default_idf = math.log(total + 1) + 1
+            self._entries = [
+                (course_id, level, self._vectorize(features))
+                for course_id, level, features in documents
+            ]
+            self._built_at = time.time()
+            
+            logger.info(f"Índice de similitud reconstruido con {total} cursos")
+    
+    def _features(self, normalized: str) -> Counter:
+        """
+        Trigramas de caracteres por palabra (tolerantes a variaciones como aprende/aprender)
+        """
+        features = Counter()
+        for word in normalized.split():
+            padded = f" {word} "
+            features.update(padded[i:i + 3] for i in range(len(padded) - 2))
+        return features
+    
+    def _vectorize(self, features: Counter) -> Dict[str, float]:
+        """
+        Vector TF-IDF normalizado (norma L2)
+        """
+        vector = {
+            feature: count * self._idf.get(feature, self._default_idf)
+            for feature, count in features.items()
+        }
+        norm = math.sqrt(sum(weight * weight for weight in vector.values()))
+        if not norm:
+            return {}
+        return {feature: weight / norm for feature, weight in vector.items()}
+
+
+# Instancia global del servicio
+course_similarity_service = CourseSimilarityService()
@@ -0,0 +1,67 @@
+import gzip
+import hashlib
+import logging
+from typing import Optional
+from django.conf import settings
+from rest_framework.renderers import JSONRenderer
+
+from api.serializers import CourseDetailSerializer, module_content_prefetches
+from courses.models import Course, CourseSnapshot
+
+logger = logging.getLogger(__name__)
+
+
+class CourseSnapshotService:
+    """
+    Snapshots JSON precalculados de cursos completos
+    
+    Un curso COMPLETE ya no cambia, así que su representación de
+    CourseDetailSerializer se renderiza una sola vez, se guarda comprimida con
+    gzip junto con su hash y GET /api/courses/{id}/ la sirve tal cual. Se
+    regenera al terminar la generación, al asignar videos diferidos y al editar
+    el curso desde el admin.
+    """
+    
+    @property
+    def enabled(self) -> bool:
+        return settings.COURSE_SNAPSHOT_ENABLED
+    
+    def refresh(self, course: Course) -> Optional[CourseSnapshot]:
+        """
+        Regenerar el snapshot del curso; si el curso no está completo se elimina
+        
+        Nunca lanza: si falla, el endpoint sigue serializando desde la base de datos.
+        """
+        if not self.enabled:
+            return None
+        
+        try:
+            if course.status != Course.StatusChoices.COMPLETE:
+                CourseSnapshot.objects.filter(course_id=course.pk).delete()
+                return None
+            
+            course = Course.objects.prefetch_related(*module_content_prefetches('modules__')).get(pk=course.pk)
+            content = JSONRenderer().render(CourseDetailSerializer(course).data)
+            content_hash = hashlib.sha256(content).hexdigest()
+            
+            snapshot, _ = CourseSnapshot.objects.update_or_create(
+                course=course,
+                defaults={
+                    'data': gzip.compress(content, mtime=0),
+                    'content_hash': content_hash,
+                    'size': len(content)
+                }
+            )
+            logger.info(f"Snapshot del curso {course.id} actualizado ({len(content)} bytes)")
+            return snapshot
+        
+        except Course.DoesNotExist:
+            return None  # Curso eliminado
+        
+        except Exception as e:
+            logger.warning(f"No se pudo generar el snapshot del curso {course.pk}: {e}")
+            return None
+
+
+# Instancia global del servicio
+course_snapshot_service = CourseSnapshotService()
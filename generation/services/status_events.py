@@ -0,0 +1,221 @@
+import json
+import time
+import uuid
+import hashlib
+import asyncio
+import logging
+from typing import Dict, Any, Optional, AsyncIterator, Awaitable, Callable
+
+import redis
+import redis.asyncio as redis_async
+from django.conf import settings
+
+from courses.models import Course
+
+logger = logging.getLogger(__name__)
+
+
+# Estados tras los que ya no habrá más eventos de generación
+TERMINAL_STATUSES = [Course.StatusChoices.COMPLETE, Course.StatusChoices.FAILED]
+
+# Campos del registro de estado que sirven course_status y /api/courses/{id}/status/
+RECORD_FIELDS = ['status', 'status_display', 'progress_percentage', 'title', 'description']
+
+
+class StatusEventService:
+    """
+    Eventos de progreso de la generación publicados en Redis pub/sub
+    
+    Las tareas publican cada cambio de estado del curso y el avance por módulo
+    y por chunk en el canal del curso; la vista SSE (course_events) se suscribe
+    y los reenvía al navegador. Cada publicación actualiza también un registro
+    compacto del estado (hash con contador de versión) del que leen los
+    endpoints de polling sin consultar la base de datos. Publicar nunca
+    interrumpe la generación: si Redis no responde el evento se descarta y los
+    endpoints vuelven a leer de la base de datos.
+    """
+    
+    CHANNEL_PREFIX = 'course-status'
+    REDIS_RETRY_INTERVAL = 30  # segundos sin publicar tras un fallo de Redis
+    
+    def __init__(self):
+        self._redis = None
+        self._redis_retry_at = 0.0
+    
+    @property
+    def enabled(self) -> bool:
+        return settings.GENERATION_STATUS_EVENTS_ENABLED
+    
+    def channel(self, course_id) -> str:
+        return f'{self.CHANNEL_PREFIX}:{course_id}'
+    
+    def record_key(self, course_id) -> str:
+        return f'{self.CHANNEL_PREFIX}:{course_id}:record'
+    
+    def course_payload(self, course: Course, event: str = 'status', **extra) -> Dict[str, Any]:
+        """
+        Estado del curso con el formato de course_status, más el tipo de evento
+        """
+        payload = {
+            'event': event,
+            'status': course.status,
+            'status_display': course.get_status_display(),
+            'progress_percentage': course.get_progress_percentage(),
+            'title': course.title,
+            'description': course.description,
+        }
+        payload.update(extra)
+        return payload
+    
+    def publish(self, course: Course, event: str = 'status', **extra):
+        """
+        Publicar el estado actual del curso ('status', 'module' o 'chunk')
+        """
+        if not self._redis_available():
+            return
+        
+        payload = self.course_payload(course, event, **extra)
+        record = {field: json.dumps(payload[field], ensure_ascii=False) for field in RECORD_FIELDS}
+        if 'chunks_ready' in payload and payload.get('module_number', 1) == 1:
+            record['chunks_ready'] = payload['chunks_ready']
+        
+        try:
+            pipeline = self._get_client().pipeline(transaction=True)
+            pipeline.hset(self.record_key(course.id), mapping=record)
+            pipeline.hincrby(self.record_key(course.id), 'version', 1)
+            pipeline.expire(self.record_key(course.id), settings.GENERATION_STATUS_RECORD_TTL)
+            pipeline.publish(self.channel(course.id), json.dumps(payload, ensure_ascii=False))
+            pipeline.execute()
+        except redis.RedisError as e:
+            self._redis_failed(f"No se pudo publicar el estado del curso {course.id}: {e}")
+    
+    def get_status(self, course_id) -> Optional[Dict[str, Any]]:
+        """
+        Registro de estado del curso guardado por publish(); None si no existe
+        o Redis no está disponible (el llamador lee entonces de la base de datos)
+        """
+        try:
+            course_id = uuid.UUID(str(course_id))
+        except ValueError:
+            return None
+        
+        if not self._redis_available():
+            return None
+        
+        try:
+            record = self._get_client().hgetall(self.record_key(course_id))
+        except redis.RedisError as e:
+            self._redis_failed(f"No se pudo leer el estado del curso {course_id}: {e}")
+            return None
+        
+        if b'status' not in record:
+            return None
+        
+        course_status = {key.decode(): json.loads(value) for key, value in record.items()}
+        course_status.setdefault('chunks_ready', 0)
+        course_status['id'] = str(course_id)
+        return course_status
+    
+    def status_from_course(self, course: Course) -> Dict[str, Any]:
+        """
+        Estado del curso leído de la base de datos, con el formato de get_status()
+        """
+        course_status = {field: getattr(course, field) for field in ['status', 'title', 'description']}
+        course_status.update({
+            'id': str(course.id),
+            'status_display': course.get_status_display(),
+            'progress_percentage': course.get_progress_percentage(),
+            'chunks_ready': course.get_ready_chunks_count(module_order=1)
+        })
+        return course_status
+    
+    def etag(self, course_status: Dict[str, Any]) -> str:
+        """
+        ETag del estado: la versión del registro o, leído de la base de datos, un hash del contenido
+        """
+        if course_status.get('version'):
+            return f'"{uuid.UUID(course_status["id"]).hex}-{course_status["version"]}"'
+        content = json.dumps(course_status, sort_keys=True, default=str).encode()
+        return f'"{hashlib.md5(content).hexdigest()}"'
+    
+    def forget(self, course_id):
+        """
+        Eliminar el registro de estado (al borrar el curso)
+        """
+        if not self._redis_available():
+            return
+        try:
+            self._get_client().delete(self.record_key(course_id))
+        except redis.RedisError as e:
+            self._redis_failed(f"No se pudo eliminar el estado del curso {course_id}: {e}")
+    
+    async def listen(self, course_id, snapshot: Callable[[], Awaitable[Dict[str, Any]]]
+                     ) -> AsyncIterator[Optional[Dict[str, Any]]]:
+        """
+        Eventos del curso: primero snapshot() y después los publicados por las tareas
+        
+        La suscripción se abre antes de leer el snapshot para no perder
+        transiciones intermedias. Emite None cada GENERATION_SSE_KEEPALIVE
+        segundos sin eventos y termina con un estado final, al cumplirse
+        GENERATION_SSE_MAX_DURATION o si Redis deja de estar disponible.
+        """
+        client = redis_async.Redis.from_url(settings.GENERATION_STATUS_REDIS_URL, socket_connect_timeout=1)
+        pubsub = client.pubsub()
+        
+        try:
+            try:
+                await pubsub.subscribe(self.channel(course_id))
+                subscribed = True
+            except (redis.RedisError, asyncio.TimeoutError) as e:
+                logger.warning(f"No se pudo suscribir al estado del curso {course_id}: {e}")
+                subscribed = False
+            
+            # Sin Redis solo se envía el estado actual; el navegador reconecta y vuelve a pedirlo
+            payload = await snapshot()
+            yield payload
+            if not subscribed or payload['status'] in TERMINAL_STATUSES:
+                return
+            
+            deadline = time.monotonic() + settings.GENERATION_SSE_MAX_DURATION
+            while time.monotonic() < deadline:
+                message = await pubsub.get_message(
+                    ignore_subscribe_messages=True, timeout=settings.GENERATION_SSE_KEEPALIVE
+                )
+                if message is None:
+                    yield None
+                    continue
+                
+                payload = json.loads(message['data'])
+                yield payload
+                if payload['status'] in TERMINAL_STATUSES:
+                    return
+        
+        except (redis.RedisError, asyncio.TimeoutError) as e:
+            logger.warning(f"Suscripción al estado del curso {course_id} interrumpida: {e}")
+        
+        finally:
+            try:
+                await pubsub.aclose()
+                await client.aclose()
+            except redis.RedisError:
+                pass
+    
+    def _redis_available(self) -> bool:
+        return self.enabled and time.monotonic() >= self._redis_retry_at
+    
+    def _redis_failed(self, message: str):
+        logger.warning(message)
+        self._redis_retry_at = time.monotonic() + self.REDIS_RETRY_INTERVAL
+    
+    def _get_client(self):
+        if self._redis is None:
+            self._redis = redis.Redis.from_url(
+                settings.GENERATION_STATUS_REDIS_URL,
+                socket_connect_timeout=1,
+                socket_timeout=1
+            )
+        return self._redis
+
+
+# Instancia global del servicio
+status_event_service = StatusEventService()
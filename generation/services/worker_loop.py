@@ -0,0 +1,49 @@
+import os
+import asyncio
+import logging
+import threading
+
+from .anthropic_service import anthropic_service
+
+logger = logging.getLogger(__name__)
+
+_local = threading.local()
+
+
+def get_worker_loop() -> asyncio.AbstractEventLoop:
+    """
+    Event loop persistente del proceso worker (uno por hilo)
+    
+    Las tareas de Celery lo reutilizan en lugar de crear y cerrar un loop en cada
+    ejecución, de modo que los clientes async (p. ej. AsyncAnthropic) conservan su
+    pool de conexiones HTTP entre tareas. Tras un fork se crea un loop nuevo.
+    """
+    loop = getattr(_local, 'loop', None)
+    
+    if loop is None or loop.is_closed() or getattr(_local, 'pid', None) != os.getpid():
+        loop = asyncio.new_event_loop()
+        _local.loop = loop
+        _local.pid = os.getpid()
+        logger.debug(f"Nuevo event loop para el worker {os.getpid()}")
+    
+    asyncio.set_event_loop(loop)
+    return loop
+
+
+def close_worker_loop() -> None:
+    """
+    Cerrar el event loop del hilo actual al apagar el worker
+    
+    Antes cierra en ese mismo loop el cliente AsyncAnthropic ligado a él, para
+    no dejar conexiones HTTP abiertas.
+    """
+    loop = getattr(_local, 'loop', None)
+    if loop is None or loop.is_closed() or getattr(_local, 'pid', None) != os.getpid():
+        return
+    
+    try:
+        loop.run_until_complete(anthropic_service.aclose())
+        loop.run_until_complete(loop.shutdown_asyncgens())
+    finally:
+        loop.close()
+        _local.loop = None
@@ -97,6 +97,26 @@ class YouTubeService:
             logger.error(f"Error buscando videos para chunk: {e}")
             return []
     
+    async def search_videos_for_chunks(self, chunks_data: List[Dict[str, Any]], course_metadata: Dict[str, Any],
+                                       max_concurrency: int = 4) -> List[List[Dict[str, Any]]]:
+        """
+        Buscar videos para varios chunks en paralelo (acotado por max_concurrency)
+        
+        Retorna una lista de resultados alineada con chunks_data.
+        """
+        semaphore = asyncio.Semaphore(max(1, max_concurrency))
+        
+        async def search(chunk_data: Dict[str, Any]) -> List[Dict[str, Any]]:
+            async with semaphore:
+                return await self.search_videos_for_chunk(chunk_data, course_metadata)
+        
+        results = await asyncio.gather(
+            *(search(chunk_data) for chunk_data in chunks_data),
+            return_exceptions=True
+        )
+        
+        return [result if isinstance(result, list) else [] for result in results]
+    
     def _search_videos_sync(self, query: str, max_results: int) -> Dict[str, Any]:
         """
         Búsqueda síncrona en YouTube API
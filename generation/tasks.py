@@ -2,35 +2,74 @@ import asyncio
 import json
 import time
 import logging
-from typing import Dict, Any
-from celery import shared_task
+from typing import Dict, Any, List, Tuple, Iterator, AsyncIterator
+from celery import shared_task, chord, current_app
+from django.conf import settings
 from django.utils import timezone
+from django.core.cache import cache
+from django.db import transaction
 
-from courses.models import Course, Module, Chunk, Video, Quiz, GenerationLog
+from courses.models import Course, Module, Chunk, GenerationLog, GenerationBatch, GenerationStep
 from .services.anthropic_service import anthropic_service
+from .services.batch_service import batch_generation_service
+from .services.checkpoint_service import checkpoint_service
+from .services.persistence_service import persistence_service
+from .services.response_cache import start_call_stats, record_call_stat, CallStats
+from .services.status_events import status_event_service
+from .services.snapshot_service import course_snapshot_service
+from .services.worker_loop import get_worker_loop
 from .services.polly_service import polly_service
 from .services.youtube_service import youtube_service
 
 logger = logging.getLogger(__name__)
 
+METADATA_STAGE = GenerationStep.StageChoices.METADATA
+MODULE_STAGE = GenerationStep.StageChoices.MODULE
+FINAL_PROJECT_STAGE = GenerationStep.StageChoices.FINAL_PROJECT
+
+# Estados en los que tiene sentido pre-generar módulos (el curso sigue activo)
+PREFETCH_ACTIVE_STATUSES = [Course.StatusChoices.READY, Course.StatusChoices.GENERATING_REMAINING]
+MODULE_WAIT_POLL_SECONDS = 2
+
+# Campos del curso que escribe generate_course_metadata (total_chunks lo
+# mantienen los módulos con incrementos, nunca se guarda desde una instancia)
+METADATA_FIELDS = [
+    'title', 'description', 'prerequisites', 'total_modules', 'module_list', 'topics',
+    'podcast_script', 'podcast_audio_url', 'total_size_estimate', 'status', 'updated_at'
+]
+
 
 @shared_task(bind=True)
-def generate_course_metadata(self, course_id: str):
+def generate_course_metadata(self, course_id: str, continue_generation: bool = True):
     """
     Fase 1: Generar metadata del curso (título, descripción, módulos, podcast)
     
     Esta es la primera fase que se ejecuta inmediatamente después de crear el curso.
-    Genera la estructura básica y el podcast introductorio.
+    Genera la estructura básica y el podcast introductorio. Con
+    continue_generation=False (cursos para el modo batch) no lanza el módulo 1.
     """
     start_time = time.time()
+    claude_stats = start_call_stats()
     course = None
     
     try:
         logger.info(f"Iniciando generación de metadata para curso {course_id}")
         
         course = Course.objects.get(id=course_id)
+        
+        if checkpoint_service.is_done(course, METADATA_STAGE):
+            # Re-entrega tras guardar la metadata: continuar desde el módulo 1
+            logger.info(f"Metadata ya generada para curso {course_id}, se retoma la generación")
+            if continue_generation:
+                generate_module_1.delay(str(course_id))
+            return
+        
+        if not checkpoint_service.start(course, METADATA_STAGE):
+            raise ValueError("Metadata sin reintentos disponibles")
+        
         course.status = Course.StatusChoices.GENERATING_METADATA
-        course.save()
+        course.save(update_fields=['status', 'updated_at'])
+        status_event_service.publish(course)
         
         # Log de inicio
         GenerationLog.objects.create(
@@ -40,81 +79,82 @@ def generate_course_metadata(self, course_id: str):
         )
         
         # Ejecutar generación asíncrona
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
+        loop = get_worker_loop()
         
-        try:
-            metadata = loop.run_until_complete(
-                anthropic_service.create_course_metadata(
-                    prompt=course.user_prompt,
-                    level=course.user_level,
-                    interests=course.user_interests,
-                    language=course.language
-                )
+        metadata = loop.run_until_complete(
+            anthropic_service.create_course_metadata(
+                prompt=course.user_prompt,
+                level=course.user_level,
+                interests=course.user_interests,
+                language=course.language
             )
-            
-            # Validar estructura
-            if not anthropic_service.validate_course_structure(metadata):
-                raise ValueError("Estructura de metadata inválida")
-            
-            # Actualizar curso con metadata
-            course.title = metadata.get('title', '')
-            course.description = metadata.get('description', '')
-            course.prerequisites = metadata.get('prerequisites', [])
-            course.total_modules = metadata.get('total_modules', 4)
-            course.module_list = metadata.get('module_list', [])
-            course.topics = metadata.get('topics', [])
-            course.podcast_script = metadata.get('podcast_script', '')
-            course.total_size_estimate = metadata.get('total_size', '~300KB contenido interactivo')
-            
-            # Generar audio del podcast si hay script
-            if course.podcast_script:
-                try:
-                    podcast_result = loop.run_until_complete(
-                        polly_service.generate_podcast_audio(
-                            course.podcast_script,
-                            str(course_id)
-                        )
-                    )
-                    course.podcast_audio_url = podcast_result.get('main_audio_url', '')
-                    
-                    GenerationLog.objects.create(
-                        course=course,
-                        action=GenerationLog.ActionChoices.AUDIO_GENERATION,
-                        message="Podcast generado exitosamente",
-                        details={'duration': podcast_result.get('total_duration', 0)}
+        )
+        
+        # Validar estructura
+        if not anthropic_service.validate_course_structure(metadata):
+            raise ValueError("Estructura de metadata inválida")
+        
+        # Actualizar curso con metadata
+        course.title = metadata.get('title', '')
+        course.description = metadata.get('description', '')
+        course.prerequisites = metadata.get('prerequisites', [])
+        course.total_modules = metadata.get('total_modules', 4)
+        course.module_list = metadata.get('module_list', [])
+        course.topics = metadata.get('topics', [])
+        course.podcast_script = metadata.get('podcast_script', '')
+        course.total_size_estimate = metadata.get('total_size', '~300KB contenido interactivo')
+        
+        # Generar audio del podcast si hay script
+        if course.podcast_script:
+            try:
+                podcast_result = loop.run_until_complete(
+                    polly_service.generate_podcast_audio(
+                        course.podcast_script,
+                        str(course_id)
                     )
-                    
-                except Exception as audio_error:
-                    logger.error(f"Error generando audio del podcast: {audio_error}")
-                    # Continuar sin audio si falla
-            
+                )
+                course.podcast_audio_url = podcast_result.get('main_audio_url', '')
+                
+                GenerationLog.objects.create(
+                    course=course,
+                    action=GenerationLog.ActionChoices.AUDIO_GENERATION,
+                    message="Podcast generado exitosamente",
+                    details={'duration': podcast_result.get('total_duration', 0)}
+                )
+                
+            except Exception as audio_error:
+                logger.error(f"Error generando audio del podcast: {audio_error}")
+                # Continuar sin audio si falla
+        
+        with transaction.atomic():
             course.status = Course.StatusChoices.METADATA_READY
-            course.save()
-            
-            duration = time.time() - start_time
-            GenerationLog.objects.create(
-                course=course,
-                action=GenerationLog.ActionChoices.METADATA_GENERATION,
-                message="Metadata generada exitosamente",
-                duration_seconds=duration,
-                details=metadata
-            )
-            
-            logger.info(f"Metadata generada exitosamente para curso {course_id} en {duration:.2f}s")
-            
-            # Activar inmediatamente la generación del módulo 1
+            course.save(update_fields=METADATA_FIELDS)
+            checkpoint_service.complete(course, METADATA_STAGE)
+        status_event_service.publish(course)
+        
+        duration = time.time() - start_time
+        GenerationLog.objects.create(
+            course=course,
+            action=GenerationLog.ActionChoices.METADATA_GENERATION,
+            message="Metadata generada exitosamente",
+            duration_seconds=duration,
+            details={**metadata, 'claude_calls': claude_stats.as_dict()}
+        )
+        
+        logger.info(f"Metadata generada exitosamente para curso {course_id} en {duration:.2f}s")
+        
+        # Activar inmediatamente la generación del módulo 1
+        if continue_generation:
             generate_module_1.delay(str(course_id))
             
-        finally:
-            loop.close()
-            
     except Exception as e:
         logger.error(f"Error en generación de metadata para curso {course_id}: {e}")
         
         if course:
+            checkpoint_service.fail(course, METADATA_STAGE, error=e)
             course.status = Course.StatusChoices.FAILED
-            course.save()
+            course.save(update_fields=['status', 'updated_at'])
+            status_event_service.publish(course)
             
             GenerationLog.objects.create(
                 course=course,
@@ -135,14 +175,40 @@ def generate_module_1(self, course_id: str):
     para que el usuario pueda empezar a consumir el curso.
     """
     start_time = time.time()
+    claude_stats = start_call_stats()
     course = None
     
     try:
         logger.info(f"Iniciando generación de módulo 1 para curso {course_id}")
         
         course = Course.objects.get(id=course_id)
+        
+        if Module.objects.filter(course=course, module_order=1, is_complete=False, total_chunks__gt=0).exists():
+            # Un streaming anterior se cortó con chunks ya visibles: completar el
+            # módulo en lugar de borrarlo (pending_modules lo regeneraría entero)
+            if not _ensure_module_complete(course, 1, _build_course_metadata(course), get_worker_loop(), wait=False):
+                raise ValueError("No se pudo completar el módulo 1")
+            # El fallo anterior pudo dejarlo en FAILED si nadie lo había empezado
+            Course.objects.filter(pk=course.pk, status=Course.StatusChoices.FAILED).update(
+                status=Course.StatusChoices.READY, updated_at=timezone.now()
+            )
+            _mark_module_1_ready(course)
+            status_event_service.publish(course)
+            return
+        
+        if not checkpoint_service.pending_modules(course, [1]):
+            # Re-entrega tras guardar el módulo 1: solo faltaba marcar el curso
+            logger.info(f"Módulo 1 ya generado para curso {course_id}")
+            _mark_module_1_ready(course)
+            status_event_service.publish(course)
+            return
+        
+        if not checkpoint_service.start(course, MODULE_STAGE, 1):
+            raise ValueError("Módulo 1 sin reintentos disponibles")
+        
         course.status = Course.StatusChoices.GENERATING_MODULE_1
-        course.save()
+        course.save(update_fields=['status', 'updated_at'])
+        status_event_service.publish(course)
         
         GenerationLog.objects.create(
             course=course,
@@ -151,19 +217,16 @@ def generate_module_1(self, course_id: str):
         )
         
         # Preparar metadata del curso
-        course_metadata = {
-            'title': course.title,
-            'description': course.description,
-            'level': course.user_level,
-            'module_list': course.module_list,
-            'topics': course.topics
-        }
+        course_metadata = _build_course_metadata(course)
         
         # Ejecutar generación asíncrona
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
+        loop = get_worker_loop()
         
-        try:
+        if settings.GENERATION_STREAM_MODULE_1:
+            # Guardar cada chunk en cuanto llega; el curso pasa a READY con el primero
+            module, module_data = _stream_generated_module(course, 1, course_metadata, loop)
+            checkpoint_service.complete(course, MODULE_STAGE, 1)
+        else:
             # Generar contenido del módulo 1
             module_data = loop.run_until_complete(
                 anthropic_service.create_module_content(course_metadata, 1)
@@ -173,89 +236,38 @@ def generate_module_1(self, course_id: str):
             if not anthropic_service.validate_module_structure(module_data):
                 raise ValueError("Estructura de módulo inválida")
             
-            # Crear módulo en la base de datos
-            module = Module.objects.create(
-                course=course,
-                module_id=module_data.get('module_id', 'modulo_1'),
-                module_order=1,
-                title=module_data.get('title', ''),
-                description=module_data.get('description', ''),
-                objective=module_data.get('objective', ''),
-                concepts=module_data.get('concepts', []),
-                summary=module_data.get('summary', ''),
-                practical_exercise=module_data.get('practical_exercise', {}),
-                resources=module_data.get('resources', {})
-            )
-            
-            # Crear chunks del módulo
-            chunks_data = module_data.get('chunks', [])
-            for chunk_data in chunks_data:
-                chunk = Chunk.objects.create(
-                    module=module,
-                    chunk_id=chunk_data.get('chunk_id', ''),
-                    chunk_order=chunk_data.get('chunk_order', 1),
-                    total_chunks=chunk_data.get('total_chunks', 6),
-                    content=chunk_data.get('content', ''),
-                    checksum=chunk_data.get('checksum', '')
-                )
-                
-                # Buscar y asignar video para este chunk
-                try:
-                    videos = loop.run_until_complete(
-                        youtube_service.search_videos_for_chunk(chunk_data, course_metadata)
-                    )
-                    
-                    if videos:
-                        video_data = videos[0]  # Tomar el primer video
-                        Video.objects.create(
-                            chunk=chunk,
-                            video_id=video_data.get('video_id', ''),
-                            title=video_data.get('title', ''),
-                            url=video_data.get('url', ''),
-                            embed_url=video_data.get('embed_url', ''),
-                            thumbnail_url=video_data.get('thumbnail_url', ''),
-                            duration=video_data.get('duration', 'N/A'),
-                            view_count=video_data.get('view_count', 0)
-                        )
-                        
-                except Exception as video_error:
-                    logger.warning(f"Error buscando video para chunk {chunk.chunk_id}: {video_error}")
-                    # Continuar sin video si falla la búsqueda
-            
-            # Crear quiz del módulo
-            quiz_data = module_data.get('quiz', [])
-            for question_data in quiz_data:
-                Quiz.objects.create(
-                    module=module,
-                    question=question_data.get('question', ''),
-                    options=question_data.get('options', []),
-                    correct_answer=question_data.get('correct_answer', 0),
-                    explanation=question_data.get('explanation', '')
-                )
-            
-            course.status = Course.StatusChoices.READY
-            course.save()
-            
-            duration = time.time() - start_time
-            GenerationLog.objects.create(
-                course=course,
-                action=GenerationLog.ActionChoices.MODULE_GENERATION,
-                message="Módulo 1 generado exitosamente",
-                duration_seconds=duration,
-                details={'module_id': module.module_id, 'chunks_count': len(chunks_data)}
-            )
-            
-            logger.info(f"Módulo 1 generado exitosamente para curso {course_id} en {duration:.2f}s")
-            
-        finally:
-            loop.close()
+            # Guardar módulo, chunks y quiz; buscar videos en paralelo (o diferirlo)
+            module = _save_generated_module(course, 1, module_data, course_metadata, loop)
+        
+        _mark_module_1_ready(course)
+        status_event_service.publish(course)
+        
+        duration = time.time() - start_time
+        GenerationLog.objects.create(
+            course=course,
+            action=GenerationLog.ActionChoices.MODULE_GENERATION,
+            message="Módulo 1 generado exitosamente",
+            duration_seconds=duration,
+            details={
+                'module_id': module.module_id,
+                'chunks_count': len(module_data.get('chunks', [])),
+                'claude_calls': claude_stats.as_dict()
+            }
+        )
+        
+        logger.info(f"Módulo 1 generado exitosamente para curso {course_id} en {duration:.2f}s")
+        
+        # Pre-generar el módulo 2 mientras el usuario lee el módulo 1
+        if settings.GENERATION_PREFETCH_MODULE_2 and course.total_modules >= 2:
+            _schedule_module_prefetch(course, 2)
             
     except Exception as e:
         logger.error(f"Error en generación de módulo 1 para curso {course_id}: {e}")
         
         if course:
-            course.status = Course.StatusChoices.FAILED
-            course.save()
+            checkpoint_service.fail(course, MODULE_STAGE, 1, e)
+            _mark_module_1_failed(course)
+            status_event_service.publish(course)
             
             GenerationLog.objects.create(
                 course=course,
@@ -273,9 +285,13 @@ def generate_remaining_modules(self, course_id: str):
     Fase 3: Generar módulos restantes (2, 3, 4...) en background
     
     Esta fase se ejecuta cuando el usuario decide iniciar el curso,
-    generando todos los módulos restantes en paralelo.
+    generando todos los módulos restantes en paralelo (hasta
+    GENERATION_MODULE_CONCURRENCY a la vez por worker). Con
+    GENERATION_USE_CHORD activo, cada módulo se despacha como una tarea
+    generate_module independiente y finalize_course cierra el curso.
     """
     start_time = time.time()
+    claude_stats = start_call_stats()
     course = None
     
     try:
@@ -283,7 +299,8 @@ def generate_remaining_modules(self, course_id: str):
         
         course = Course.objects.get(id=course_id)
         course.status = Course.StatusChoices.GENERATING_REMAINING
-        course.save()
+        course.save(update_fields=['status', 'updated_at'])
+        status_event_service.publish(course)
         
         GenerationLog.objects.create(
             course=course,
@@ -292,153 +309,800 @@ def generate_remaining_modules(self, course_id: str):
         )
         
         # Preparar metadata del curso
-        course_metadata = {
-            'title': course.title,
-            'description': course.description,
-            'level': course.user_level,
-            'module_list': course.module_list,
-            'topics': course.topics
-        }
+        course_metadata = _build_course_metadata(course)
         
         modules_generated = 0
         total_modules = course.total_modules
         
+        # Módulos sin guardar (o a medio escribir) según los checkpoints
+        pending_numbers = checkpoint_service.pending_modules(course, list(range(2, total_modules + 1)))
+        
+        if settings.GENERATION_USE_CHORD:
+            # Repartir un módulo por tarea entre todos los workers; el callback
+            # del chord genera el proyecto final y marca el curso como completo
+            if pending_numbers:
+                chord([
+                    generate_module.s(str(course_id), module_number)
+                    for module_number in pending_numbers
+                ])(finalize_course.s(str(course_id)))
+            else:
+                finalize_course.delay([], str(course_id))
+            
+            logger.info(f"Despachados {len(pending_numbers)} módulos como chord para curso {course_id}")
+            return
+        
         # Ejecutar generación asíncrona
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
+        loop = get_worker_loop()
         
-        try:
-            # Generar módulos 2, 3, 4...
-            for module_number in range(2, total_modules + 1):
-                if Module.objects.filter(course=course, module_order=module_number).exists():
-                    continue  # Skip si ya existe
+        # Generar módulos 2, 3, 4... en paralelo (acotado por worker)
+        concurrency = max(1, settings.GENERATION_MODULE_CONCURRENCY)
+        semaphore = asyncio.Semaphore(concurrency)
+        
+        logger.info(f"Generando {len(pending_numbers)} módulos con concurrencia {concurrency}")
+        
+        # Los módulos que otro worker está generando (p. ej. la pre-generación
+        # del módulo 2) no se repiten: se espera a que terminen
+        locked_numbers = [
+            module_number for module_number in pending_numbers
+            if _acquire_module_lock(course_id, module_number)
+        ]
+        in_flight_numbers = [number for number in pending_numbers if number not in locked_numbers]
+        
+        pending = {}
+        for module_number in locked_numbers:
+            if not checkpoint_service.start(course, MODULE_STAGE, module_number):
+                _release_module_lock(course_id, module_number)
+                continue  # Sin reintentos disponibles
+            pending[loop.create_task(
+                _create_module_content_bounded(semaphore, course_metadata, module_number)
+            )] = module_number
+        
+        # Persistir cada módulo en cuanto llega su respuesta
+        while pending:
+            done, _ = loop.run_until_complete(
+                asyncio.wait(pending.keys(), return_when=asyncio.FIRST_COMPLETED)
+            )
+            
+            for future in done:
+                module_number = pending.pop(future)
                 
                 try:
-                    logger.info(f"Generando módulo {module_number}")
-                    
-                    module_data = loop.run_until_complete(
-                        anthropic_service.create_module_content(course_metadata, module_number)
-                    )
-                    
-                    # Crear módulo y su contenido (similar a generate_module_1)
-                    module = Module.objects.create(
-                        course=course,
-                        module_id=module_data.get('module_id', f'modulo_{module_number}'),
-                        module_order=module_number,
-                        title=module_data.get('title', ''),
-                        description=module_data.get('description', ''),
-                        objective=module_data.get('objective', ''),
-                        concepts=module_data.get('concepts', []),
-                        summary=module_data.get('summary', ''),
-                        practical_exercise=module_data.get('practical_exercise', {}),
-                        resources=module_data.get('resources', {})
-                    )
-                    
-                    # Crear chunks y videos
-                    chunks_data = module_data.get('chunks', [])
-                    for chunk_data in chunks_data:
-                        chunk = Chunk.objects.create(
-                            module=module,
-                            chunk_id=chunk_data.get('chunk_id', ''),
-                            chunk_order=chunk_data.get('chunk_order', 1),
-                            total_chunks=chunk_data.get('total_chunks', 6),
-                            content=chunk_data.get('content', ''),
-                            checksum=chunk_data.get('checksum', '')
-                        )
-                        
-                        # Buscar videos para chunks
-                        try:
-                            videos = loop.run_until_complete(
-                                youtube_service.search_videos_for_chunk(chunk_data, course_metadata)
-                            )
-                            
-                            if videos:
-                                video_data = videos[0]
-                                Video.objects.create(
-                                    chunk=chunk,
-                                    video_id=video_data.get('video_id', ''),
-                                    title=video_data.get('title', ''),
-                                    url=video_data.get('url', ''),
-                                    embed_url=video_data.get('embed_url', ''),
-                                    thumbnail_url=video_data.get('thumbnail_url', ''),
-                                    duration=video_data.get('duration', 'N/A'),
-                                    view_count=video_data.get('view_count', 0)
-                                )
-                        except Exception as video_error:
-                            logger.warning(f"Error buscando video para chunk {chunk.chunk_id}: {video_error}")
-                    
-                    # Crear quiz
-                    quiz_data = module_data.get('quiz', [])
-                    for question_data in quiz_data:
-                        Quiz.objects.create(
-                            module=module,
-                            question=question_data.get('question', ''),
-                            options=question_data.get('options', []),
-                            correct_answer=question_data.get('correct_answer', 0),
-                            explanation=question_data.get('explanation', '')
-                        )
+                    module_data = future.result()
+                    _save_generated_module(course, module_number, module_data, course_metadata, loop)
                     
                     modules_generated += 1
                     logger.info(f"Módulo {module_number} generado exitosamente")
                     
                 except Exception as module_error:
                     logger.error(f"Error generando módulo {module_number}: {module_error}")
+                    checkpoint_service.fail(course, MODULE_STAGE, module_number, module_error)
                     # Continuar con siguiente módulo
-            
-            # Generar proyecto final
-            try:
-                all_modules_data = []
-                for module in course.modules.all():
-                    all_modules_data.append({
-                        'title': module.title,
-                        'description': module.description,
-                        'concepts': module.concepts
-                    })
                 
-                final_project = loop.run_until_complete(
-                    anthropic_service.create_final_project(course_metadata, all_modules_data)
-                )
-                
-                course.final_project_data = final_project
-                
-            except Exception as project_error:
-                logger.error(f"Error generando proyecto final: {project_error}")
-                # Continuar sin proyecto final
-            
-            # Marcar curso como completo
-            course.status = Course.StatusChoices.COMPLETE
-            course.completed_at = timezone.now()
-            course.save()
+                finally:
+                    _release_module_lock(course_id, module_number)
+        
+        for module_number in in_flight_numbers:
+            if _wait_for_module(course, module_number):
+                modules_generated += 1
+        
+        if not _ensure_module_complete(course, 1, course_metadata, loop):
+            raise ValueError("Módulo 1 incompleto, el curso no se marca como completo")
+        
+        # Generar proyecto final y marcar curso como completo
+        _generate_final_project(course, course_metadata, loop)
+        duration = _complete_course(course, modules_generated, total_modules, start_time, claude_stats)
+        
+        logger.info(f"Módulos restantes generados exitosamente para curso {course_id} en {duration:.2f}s")
             
-            duration = time.time() - start_time
+    except Exception as e:
+        logger.error(f"Error en generación de módulos restantes para curso {course_id}: {e}")
+        
+        if course:
+            # No cambiar status a FAILED si algunos módulos se generaron exitosamente
             GenerationLog.objects.create(
                 course=course,
-                action=GenerationLog.ActionChoices.COMPLETION,
-                message=f"Curso completado. {modules_generated} módulos generados",
-                duration_seconds=duration,
-                details={'modules_generated': modules_generated, 'total_modules': total_modules}
+                action=GenerationLog.ActionChoices.ERROR,
+                message=f"Error en generación de módulos restantes: {str(e)}",
+                duration_seconds=time.time() - start_time
             )
+        
+        raise
+
+
+@shared_task(bind=True)
+def generate_module(self, course_id: str, module_number: int, speculative: bool = False):
+    """
+    Fase 3 (distribuida): Generar un único módulo del curso
+    
+    Se despacha como parte del chord de generate_remaining_modules, de modo que
+    cada módulo se genera en el worker que esté libre y un worker caído solo
+    repite su propio módulo. Con speculative=True es la pre-generación del
+    módulo 2 mientras el usuario lee el módulo 1 (baja prioridad, se descarta
+    si el curso ya no está activo).
+    """
+    start_time = time.time()
+    claude_stats = start_call_stats()
+    course = None
+    locked = False
+    
+    try:
+        logger.info(f"Iniciando generación de módulo {module_number} para curso {course_id}")
+        
+        course = Course.objects.get(id=course_id)
+        
+        if speculative and course.status not in PREFETCH_ACTIVE_STATUSES:
+            logger.info(f"Pre-generación del módulo {module_number} descartada: curso {course_id} en {course.status}")
+            return {'module_number': module_number, 'generated': False}
+        
+        locked = _acquire_module_lock(course_id, module_number)
+        if not locked:
+            # Otro worker ya lo está generando (p. ej. la pre-generación del módulo 2)
+            if speculative:
+                return {'module_number': module_number, 'generated': False}
+            return {'module_number': module_number, 'generated': _wait_for_module(course, module_number)}
+        
+        if not checkpoint_service.pending_modules(course, [module_number]):
+            return {'module_number': module_number, 'generated': False}  # Skip si ya existe
+        
+        if not checkpoint_service.start(course, MODULE_STAGE, module_number):
+            return {'module_number': module_number, 'generated': False}  # Sin reintentos disponibles
+        
+        course_metadata = _build_course_metadata(course)
+        
+        loop = get_worker_loop()
+        
+        module_data = loop.run_until_complete(
+            anthropic_service.create_module_content(course_metadata, module_number)
+        )
+        
+        module = _save_generated_module(course, module_number, module_data, course_metadata, loop)
+        
+        duration = time.time() - start_time
+        GenerationLog.objects.create(
+            course=course,
+            action=GenerationLog.ActionChoices.MODULE_GENERATION,
+            message=f"Módulo {module_number} generado exitosamente" + (" (pre-generado)" if speculative else ""),
+            duration_seconds=duration,
+            details={
+                'module_id': module.module_id,
+                'chunks_count': module.total_chunks,
+                'speculative': speculative,
+                'claude_calls': claude_stats.as_dict()
+            }
+        )
+        
+        logger.info(f"Módulo {module_number} generado exitosamente para curso {course_id} en {duration:.2f}s")
+        return {'module_number': module_number, 'generated': True}
             
-            logger.info(f"Módulos restantes generados exitosamente para curso {course_id} en {duration:.2f}s")
-            
-        finally:
-            loop.close()
+    except Exception as e:
+        logger.error(f"Error generando módulo {module_number} para curso {course_id}: {e}")
+        
+        if course:
+            if locked:
+                checkpoint_service.fail(course, MODULE_STAGE, module_number, e)
+            GenerationLog.objects.create(
+                course=course,
+                action=GenerationLog.ActionChoices.ERROR,
+                message=f"Error en generación de módulo {module_number}: {str(e)}",
+                duration_seconds=time.time() - start_time
+            )
+        
+        # No propagar el error para que el callback del chord se ejecute igualmente
+        return {'module_number': module_number, 'generated': False}
+    
+    finally:
+        if locked:
+            _release_module_lock(course_id, module_number)
+
+
+@shared_task(bind=True)
+def finalize_course(self, results: List[Dict[str, Any]], course_id: str):
+    """
+    Callback del chord de la fase 3: generar el proyecto final y marcar el curso como completo
+    """
+    start_time = time.time()
+    claude_stats = start_call_stats()
+    course = None
+    
+    try:
+        course = Course.objects.get(id=course_id)
+        course_metadata = _build_course_metadata(course)
+        modules_generated = sum(1 for result in results if result and result.get('generated'))
+        
+        loop = get_worker_loop()
+        
+        if not _ensure_module_complete(course, 1, course_metadata, loop):
+            raise ValueError("Módulo 1 incompleto, el curso no se marca como completo")
+        
+        _generate_final_project(course, course_metadata, loop)
+        duration = _complete_course(course, modules_generated, course.total_modules, start_time, claude_stats)
+        
+        logger.info(f"Curso {course_id} finalizado en {duration:.2f}s")
             
     except Exception as e:
-        logger.error(f"Error en generación de módulos restantes para curso {course_id}: {e}")
+        logger.error(f"Error finalizando curso {course_id}: {e}")
         
         if course:
-            # No cambiar status a FAILED si algunos módulos se generaron exitosamente
             GenerationLog.objects.create(
                 course=course,
                 action=GenerationLog.ActionChoices.ERROR,
-                message=f"Error en generación de módulos restantes: {str(e)}",
+                message=f"Error finalizando curso: {str(e)}",
                 duration_seconds=time.time() - start_time
             )
         
         raise
 
 
+@shared_task(bind=True)
+def submit_module_batch(self, course_ids: List[str] = None, limit: int = None, schedule_poll: bool = True):
+    """
+    Generación offline: enviar los módulos de muchos cursos como un único lote
+    
+    Toma cursos con la metadata lista y sin módulos (p. ej. el catálogo
+    pre-generado por la noche), envía todos sus módulos a la Message Batches
+    API y programa poll_module_batch para recoger los resultados.
+    """
+    courses = Course.objects.filter(
+        status=Course.StatusChoices.METADATA_READY,
+        modules__isnull=True
+    ).distinct()
+    if course_ids:
+        courses = courses.filter(id__in=course_ids)
+    courses = list(courses[:limit or settings.GENERATION_BATCH_MAX_COURSES])
+    
+    if not courses:
+        logger.info("No hay cursos pendientes para generar por lotes")
+        return None
+    
+    modules = []
+    for course in courses:
+        course_metadata = _build_course_metadata(course)
+        for module_number in range(1, min(course.total_modules, len(course.module_list)) + 1):
+            modules.append((str(course.id), course_metadata, module_number))
+    
+    batch_id = batch_generation_service.submit_modules(modules)
+    
+    batch = GenerationBatch.objects.create(batch_id=batch_id, request_count=len(modules))
+    batch.courses.set(courses)
+    
+    Course.objects.filter(id__in=[course.id for course in courses]).update(
+        status=Course.StatusChoices.GENERATING_MODULE_1, updated_at=timezone.now()
+    )
+    for course in courses:
+        # El UPDATE en bloque no pasa por las tareas: publicar el nuevo estado de cada curso
+        course.status = Course.StatusChoices.GENERATING_MODULE_1
+        status_event_service.publish(course)
+    GenerationLog.objects.bulk_create([
+        GenerationLog(
+            course=course,
+            action=GenerationLog.ActionChoices.MODULE_GENERATION,
+            message=f"Módulos enviados al lote {batch_id}"
+        )
+        for course in courses
+    ])
+    
+    logger.info(f"Lote {batch_id} enviado: {len(courses)} cursos, {len(modules)} módulos")
+    
+    if schedule_poll:
+        poll_module_batch.apply_async(args=[str(batch.id)], countdown=settings.GENERATION_BATCH_POLL_INTERVAL)
+    
+    return str(batch.id)
+
+
+@shared_task(bind=True)
+def poll_module_batch(self, batch_id: str, reschedule: bool = True):
+    """
+    Comprobar un lote enviado y, si terminó, guardar sus módulos y completar los cursos
+    
+    Los módulos que fallen en el lote se generan con una llamada normal a Claude.
+    """
+    batch = GenerationBatch.objects.get(id=batch_id)
+    
+    if batch.status != GenerationBatch.StatusChoices.SUBMITTED:
+        return batch.status
+    
+    try:
+        if not batch_generation_service.is_ended(batch.batch_id):
+            if reschedule:
+                poll_module_batch.apply_async(args=[batch_id], countdown=settings.GENERATION_BATCH_POLL_INTERVAL)
+            return batch.status
+        
+        logger.info(f"Lote {batch.batch_id} terminado, procesando resultados")
+        
+        results = batch_generation_service.module_results(batch.batch_id)
+        loop = get_worker_loop()
+        
+        courses_completed = 0
+        for course in batch.courses.all():
+            try:
+                _finish_batch_course(course, results.get(str(course.id), {}), loop)
+                courses_completed += 1
+            except Exception as course_error:
+                logger.error(f"Error completando curso {course.id} del lote {batch.batch_id}: {course_error}")
+                # Continuar con el siguiente curso
+        
+        batch.status = GenerationBatch.StatusChoices.COMPLETE
+        batch.details = {
+            'results': sum(len(course_results) for course_results in results.values()),
+            'courses_completed': courses_completed
+        }
+        
+    except Exception as e:
+        logger.error(f"Error procesando lote {batch.batch_id}: {e}")
+        batch.status = GenerationBatch.StatusChoices.FAILED
+        batch.details = {'error': str(e)}
+        raise
+    
+    finally:
+        if batch.status != GenerationBatch.StatusChoices.SUBMITTED:
+            batch.completed_at = timezone.now()
+            batch.save()
+    
+    return batch.status
+
+
+def cancel_module_prefetch(course_id: str) -> None:
+    """
+    Cancelar la pre-generación pendiente de un curso (p. ej. al eliminarlo)
+    
+    Solo afecta a la tarea si aún no ha empezado; si ya está en marcha,
+    generate_module descarta el resultado al no encontrar el curso.
+    """
+    try:
+        task_id = cache.get(_prefetch_key(course_id))
+        if task_id:
+            current_app.control.revoke(task_id)
+            cache.delete(_prefetch_key(course_id))
+            logger.info(f"Pre-generación cancelada para curso {course_id}")
+    except Exception as e:
+        logger.warning(f"No se pudo cancelar la pre-generación del curso {course_id}: {e}")
+
+
+def _schedule_module_prefetch(course: Course, module_number: int) -> None:
+    """
+    Encolar la generación especulativa de un módulo con prioridad baja
+    
+    La tarea caduca tras GENERATION_PREFETCH_EXPIRES segundos en cola, de
+    modo que un curso abandonado no consume workers más tarde.
+    """
+    try:
+        result = generate_module.apply_async(
+            args=[str(course.id), module_number],
+            kwargs={'speculative': True},
+            priority=settings.GENERATION_PREFETCH_PRIORITY,
+            expires=settings.GENERATION_PREFETCH_EXPIRES
+        )
+        cache.set(_prefetch_key(course.id), result.id, timeout=settings.GENERATION_PREFETCH_EXPIRES)
+        logger.info(f"Pre-generación del módulo {module_number} encolada para curso {course.id}")
+    except Exception as e:
+        logger.warning(f"No se pudo encolar la pre-generación del curso {course.id}: {e}")
+
+
+def _prefetch_key(course_id) -> str:
+    return f"generation:prefetch:{course_id}"
+
+
+def _module_lock_key(course_id, module_number: int) -> str:
+    return f"generation:module_lock:{course_id}:{module_number}"
+
+
+def _acquire_module_lock(course_id, module_number: int) -> bool:
+    """
+    Marcar un módulo como "en generación" para que otra tarea no lo repita
+    """
+    try:
+        return cache.add(_module_lock_key(course_id, module_number), 1, timeout=settings.GENERATION_MODULE_LOCK_TIMEOUT)
+    except Exception as e:
+        logger.warning(f"No se pudo bloquear el módulo {module_number} del curso {course_id}: {e}")
+        return True  # Sin caché, generar igualmente
+
+
+def _release_module_lock(course_id, module_number: int) -> None:
+    try:
+        cache.delete(_module_lock_key(course_id, module_number))
+    except Exception as e:
+        logger.warning(f"No se pudo liberar el módulo {module_number} del curso {course_id}: {e}")
+
+
+def _wait_for_module(course: Course, module_number: int) -> bool:
+    """
+    Esperar a que otra tarea termine un módulo en generación
+    
+    Si la otra tarea falla (se libera el bloqueo sin módulo) o se agota la
+    espera, el módulo se genera aquí. Retorna si el módulo quedó guardado.
+    """
+    deadline = time.time() + settings.GENERATION_MODULE_LOCK_TIMEOUT
+    while time.time() < deadline:
+        if checkpoint_service.is_done(course, MODULE_STAGE, module_number):
+            return True
+        try:
+            if cache.get(_module_lock_key(course.id, module_number)) is None:
+                break
+        except Exception:
+            break
+        time.sleep(MODULE_WAIT_POLL_SECONDS)
+    
+    if not checkpoint_service.pending_modules(course, [module_number]):
+        return True
+    
+    if not checkpoint_service.start(course, MODULE_STAGE, module_number):
+        return False  # Sin reintentos disponibles
+    
+    logger.info(f"Módulo {module_number} no disponible tras la espera, generándolo ahora")
+    try:
+        course_metadata = _build_course_metadata(course)
+        loop = get_worker_loop()
+        module_data = loop.run_until_complete(
+            anthropic_service.create_module_content(course_metadata, module_number)
+        )
+        _save_generated_module(course, module_number, module_data, course_metadata, loop)
+        return True
+    except Exception as module_error:
+        logger.error(f"Error generando módulo {module_number}: {module_error}")
+        checkpoint_service.fail(course, MODULE_STAGE, module_number, module_error)
+        return False
+
+
+def _mark_module_1_ready(course: Course) -> None:
+    """
+    Pasar el curso a READY solo si sigue en GENERATING_MODULE_1
+    
+    En streaming el curso ya está READY desde el primer chunk y el usuario puede
+    haberlo iniciado (GENERATING_REMAINING); un save() completo lo devolvería a
+    READY con campos obsoletos.
+    """
+    Course.objects.filter(pk=course.pk, status=Course.StatusChoices.GENERATING_MODULE_1).update(
+        status=Course.StatusChoices.READY,
+        updated_at=timezone.now()
+    )
+    course.refresh_from_db(fields=['status', 'updated_at'])
+
+
+def _mark_module_1_failed(course: Course) -> None:
+    """
+    Pasar el curso a FAILED solo si aún no se ha empezado
+    
+    Con streaming el curso está en READY desde el primer chunk; si el usuario ya
+    lo empezó (o está completo) un fallo posterior del módulo 1 no lo cambia.
+    """
+    Course.objects.filter(
+        pk=course.pk,
+        status__in=[Course.StatusChoices.GENERATING_MODULE_1, Course.StatusChoices.READY]
+    ).update(status=Course.StatusChoices.FAILED, updated_at=timezone.now())
+    course.refresh_from_db(fields=['status', 'updated_at'])
+
+
+def _ensure_module_complete(course: Course, module_number: int, course_metadata: Dict[str, Any],
+                            loop: asyncio.AbstractEventLoop, wait: bool = True) -> bool:
+    """
+    Asegurar que el módulo está guardado completo antes de cerrar el curso
+    
+    Con wait espera mientras otra tarea lo genera (checkpoint en curso, p. ej. el
+    streaming del módulo 1). Si no existe o quedó a medias lo genera aquí; un
+    módulo parcial conserva los chunks ya visibles y solo recibe los que faltan.
+    Retorna si el módulo quedó completo.
+    """
+    deadline = time.time() + settings.GENERATION_MODULE_LOCK_TIMEOUT
+    while wait and time.time() < deadline and checkpoint_service.is_running(course, MODULE_STAGE, module_number):
+        time.sleep(MODULE_WAIT_POLL_SECONDS)
+    
+    module = Module.objects.filter(course=course, module_order=module_number).first()
+    if module is not None and module.is_complete:
+        return True
+    
+    if not checkpoint_service.start(course, MODULE_STAGE, module_number):
+        return False  # Sin reintentos disponibles
+    
+    logger.info(f"Módulo {module_number} del curso {course.id} incompleto, completándolo")
+    try:
+        module_data = loop.run_until_complete(
+            anthropic_service.create_module_content(course_metadata, module_number)
+        )
+        if not anthropic_service.validate_module_structure(module_data):
+            raise ValueError("Estructura de módulo inválida")
+        
+        if module is None:
+            _save_generated_module(course, module_number, module_data, course_metadata, loop)
+            return True
+        
+        with transaction.atomic():
+            chunks = persistence_service.complete_partial_module(module, module_data)
+            checkpoint_service.complete(course, MODULE_STAGE, module_number)
+        status_event_service.publish(course, 'module', module_number=module_number, chunks_ready=len(chunks))
+        _schedule_chunk_videos(module, chunks, module_data.get('chunks', []), course_metadata, loop)
+        return True
+    except Exception as module_error:
+        logger.error(f"Error completando módulo {module_number} del curso {course.id}: {module_error}")
+        checkpoint_service.fail(course, MODULE_STAGE, module_number, module_error)
+        return False
+
+
+def _build_course_metadata(course: Course) -> Dict[str, Any]:
+    """
+    Preparar la metadata del curso que reciben los prompts de módulos y proyecto final
+    """
+    return {
+        'title': course.title,
+        'description': course.description,
+        'level': course.user_level,
+        'module_list': course.module_list,
+        'topics': course.topics
+    }
+
+
+def _generate_final_project(course: Course, course_metadata: Dict[str, Any], loop: asyncio.AbstractEventLoop) -> None:
+    """
+    Generar el proyecto final a partir de los módulos ya persistidos
+    """
+    if checkpoint_service.is_done(course, FINAL_PROJECT_STAGE):
+        return  # Ya generado en una entrega anterior
+    
+    if not checkpoint_service.start(course, FINAL_PROJECT_STAGE):
+        return  # Sin reintentos disponibles, continuar sin proyecto final
+    
+    try:
+        all_modules_data = []
+        for module in course.modules.all():
+            all_modules_data.append({
+                'title': module.title,
+                'description': module.description,
+                'concepts': module.concepts
+            })
+        
+        final_project = loop.run_until_complete(
+            anthropic_service.create_final_project(course_metadata, all_modules_data)
+        )
+        
+        course.final_project_data = final_project
+        with transaction.atomic():
+            course.save(update_fields=['final_project_data', 'updated_at'])
+            checkpoint_service.complete(course, FINAL_PROJECT_STAGE)
+        
+    except Exception as project_error:
+        logger.error(f"Error generando proyecto final: {project_error}")
+        checkpoint_service.fail(course, FINAL_PROJECT_STAGE, error=project_error)
+        # Continuar sin proyecto final
+
+
+def _complete_course(course: Course, modules_generated: int, total_modules: int, start_time: float,
+                     claude_stats: CallStats) -> float:
+    """
+    Marcar curso como completo y registrar el log de finalización
+    
+    Requiere el módulo 1 guardado completo: con streaming puede seguir
+    escribiéndose (o haber quedado a medias) cuando terminan los demás.
+    """
+    if not course.modules.filter(module_order=1, is_complete=True).exists():
+        raise ValueError("El módulo 1 no está completo")
+    
+    course.status = Course.StatusChoices.COMPLETE
+    course.completed_at = timezone.now()
+    course.save(update_fields=['status', 'completed_at', 'updated_at'])
+    course.refresh_from_db(fields=['total_chunks'])
+    status_event_service.publish(course)
+    course_snapshot_service.refresh(course)
+    
+    duration = time.time() - start_time
+    GenerationLog.objects.create(
+        course=course,
+        action=GenerationLog.ActionChoices.COMPLETION,
+        message=f"Curso completado. {modules_generated} módulos generados",
+        duration_seconds=duration,
+        details={
+            'modules_generated': modules_generated,
+            'total_modules': total_modules,
+            'claude_calls': claude_stats.as_dict()
+        }
+    )
+    
+    return duration
+
+
+def _finish_batch_course(course: Course, module_results: Dict[int, Dict[str, Any]],
+                         loop: asyncio.AbstractEventLoop) -> None:
+    """
+    Guardar los módulos de un curso recibidos en un lote y marcarlo como completo
+    """
+    start_time = time.time()
+    claude_stats = start_call_stats()
+    course_metadata = _build_course_metadata(course)
+    modules_generated = 0
+    
+    module_numbers = list(range(1, min(course.total_modules, len(course.module_list)) + 1))
+    for module_number in checkpoint_service.pending_modules(course, module_numbers):
+        if not checkpoint_service.start(course, MODULE_STAGE, module_number):
+            continue  # Sin reintentos disponibles
+        
+        module_data = batch_generation_service.module_from_result(
+            module_results.get(module_number), course_metadata, module_number
+        )
+        
+        try:
+            if module_data is None:
+                # El lote no trajo un módulo válido: generarlo con una llamada normal
+                record_call_stat('batch_fallbacks')
+                module_data = loop.run_until_complete(
+                    anthropic_service.create_module_content(course_metadata, module_number)
+                )
+            
+            _save_generated_module(course, module_number, module_data, course_metadata, loop)
+            modules_generated += 1
+            
+        except Exception as module_error:
+            logger.error(f"Error generando módulo {module_number} del curso {course.id}: {module_error}")
+            checkpoint_service.fail(course, MODULE_STAGE, module_number, module_error)
+            # Continuar con siguiente módulo
+    
+    _generate_final_project(course, course_metadata, loop)
+    _complete_course(course, modules_generated, course.total_modules, start_time, claude_stats)
+
+
+async def _create_module_content_bounded(semaphore: asyncio.Semaphore, course_metadata: Dict[str, Any], module_number: int) -> Dict[str, Any]:
+    """
+    Generar el contenido de un módulo respetando el límite de concurrencia
+    """
+    async with semaphore:
+        logger.info(f"Generando módulo {module_number}")
+        return await anthropic_service.create_module_content(course_metadata, module_number)
+
+
+def _save_generated_module(course: Course, module_number: int, module_data: Dict[str, Any],
+                           course_metadata: Dict[str, Any], loop: asyncio.AbstractEventLoop) -> Module:
+    """
+    Guardar el módulo generado en una transacción y asignar videos a sus chunks
+    """
+    with transaction.atomic():
+        module, chunks = persistence_service.save_module(course, module_number, module_data)
+        checkpoint_service.complete(course, MODULE_STAGE, module_number)
+    status_event_service.publish(course, 'module', module_number=module_number, chunks_ready=len(chunks))
+    _schedule_chunk_videos(module, chunks, module_data.get('chunks', []), course_metadata, loop)
+    
+    return module
+
+
+def _stream_generated_module(course: Course, module_number: int, course_metadata: Dict[str, Any],
+                             loop: asyncio.AbstractEventLoop) -> Tuple[Module, Dict[str, Any]]:
+    """
+    Generar un módulo en streaming persistiendo cada chunk en cuanto se completa
+    
+    El módulo se crea con is_complete=False al llegar el primer chunk y el curso
+    pasa a READY en ese momento; al terminar se guardan quiz y resumen. Si la
+    generación falla antes del primer chunk el módulo se elimina; con chunks ya
+    visibles se conserva a medias y _ensure_module_complete lo completa después.
+    """
+    module = None
+    module_data = None
+    chunks_ready = 0
+    events = anthropic_service.stream_module_content(course_metadata, module_number)
+    
+    try:
+        for event, data in _iterate_async(loop, events):
+            if event == 'header':
+                module = persistence_service.start_streamed_module(course, module_number, data)
+            elif event == 'chunk':
+                persistence_service.save_streamed_chunk(module, data)
+                chunks_ready += 1
+                if module_number == 1 and course.status == Course.StatusChoices.GENERATING_MODULE_1:
+                    _mark_module_1_ready(course)
+                status_event_service.publish(course, 'chunk', module_number=module_number, chunks_ready=chunks_ready)
+            elif event == 'module':
+                module_data = data
+        
+        if module is None or not anthropic_service.validate_module_structure(module_data):
+            raise ValueError("Estructura de módulo inválida")
+        
+        chunks = persistence_service.finish_streamed_module(module, module_data)
+        status_event_service.publish(course, 'module', module_number=module_number, chunks_ready=len(chunks))
+        _schedule_chunk_videos(module, chunks, module_data.get('chunks', []), course_metadata, loop)
+        
+        return module, module_data
+        
+    except Exception:
+        loop.run_until_complete(events.aclose())
+        if module is not None and not chunks_ready:
+            module.delete()  # Nadie lo ha visto todavía
+        raise
+
+
+def _iterate_async(loop: asyncio.AbstractEventLoop, async_iterator: AsyncIterator) -> Iterator:
+    """
+    Consumir un iterador asíncrono desde código síncrono, un elemento cada vez
+    
+    Permite usar el ORM entre elemento y elemento fuera del event loop.
+    """
+    while True:
+        try:
+            yield loop.run_until_complete(async_iterator.__anext__())
+        except StopAsyncIteration:
+            return
+
+
+def _schedule_chunk_videos(module: Module, chunks: List[Chunk], chunks_data: List[Dict[str, Any]],
+                           course_metadata: Dict[str, Any], loop: asyncio.AbstractEventLoop) -> None:
+    """
+    Asignar videos a los chunks del módulo, en línea o diferido a attach_module_videos
+    
+    Con GENERATION_DEFER_VIDEOS activo la búsqueda se encola como tarea aparte,
+    de modo que el módulo queda disponible sin esperar a YouTube.
+    """
+    video_queries = {
+        chunk_data.get('chunk_id', ''): chunk_data.get('video_search_query', '')
+        for chunk_data in chunks_data
+    }
+    
+    if settings.GENERATION_DEFER_VIDEOS:
+        attach_module_videos.delay(str(module.id), video_queries)
+        return
+    
+    _create_chunk_videos(chunks, video_queries, course_metadata, loop)
+
+
+def _create_chunk_videos(chunks: List[Chunk], video_queries: Dict[str, str],
+                         course_metadata: Dict[str, Any], loop: asyncio.AbstractEventLoop) -> int:
+    """
+    Buscar videos para todos los chunks en paralelo y crear los Video encontrados
+    """
+    chunks_data = [
+        {
+            'chunk_id': chunk.chunk_id,
+            'content': chunk.content,
+            'video_search_query': video_queries.get(chunk.chunk_id, '')
+        }
+        for chunk in chunks
+    ]
+    
+    videos_per_chunk = loop.run_until_complete(
+        youtube_service.search_videos_for_chunks(
+            chunks_data,
+            course_metadata,
+            max_concurrency=settings.GENERATION_VIDEO_CONCURRENCY
+        )
+    )
+    
+    return persistence_service.save_chunk_videos(chunks, videos_per_chunk)
+
+
+@shared_task(bind=True)
+def attach_module_videos(self, module_id: str, video_queries: Dict[str, str]):
+    """
+    Buscar y asignar videos de YouTube a los chunks de un módulo ya persistido
+    
+    Se encola cuando GENERATION_DEFER_VIDEOS está activo para que el curso pase a
+    READY sin esperar las búsquedas. Solo procesa chunks que aún no tienen video.
+    """
+    start_time = time.time()
+    
+    try:
+        module = Module.objects.select_related('course').get(id=module_id)
+        chunks = list(module.chunks.filter(video__isnull=True))
+        
+        if not chunks:
+            return 0
+        
+        loop = get_worker_loop()
+        
+        videos_created = _create_chunk_videos(
+            chunks, video_queries, _build_course_metadata(module.course), loop
+        )
+        
+        GenerationLog.objects.create(
+            course=module.course,
+            action=GenerationLog.ActionChoices.VIDEO_SEARCH,
+            message=f"Videos asignados al módulo {module.module_order}",
+            duration_seconds=time.time() - start_time,
+            details={'module_id': module.module_id, 'videos_created': videos_created, 'chunks': len(chunks)}
+        )
+        
+        if videos_created and module.course.status == Course.StatusChoices.COMPLETE:
+            course_snapshot_service.refresh(module.course)
+        
+        return videos_created
+        
+    except Exception as e:
+        logger.error(f"Error asignando videos al módulo {module_id}: {e}")
+        raise
+
+
 @shared_task(bind=True)
 def cleanup_old_generation_logs(self):
     """
@@ -1,3 +1,859 @@
-from django.test import TestCase
+import json
+import time
+import asyncio
+from types import SimpleNamespace
+from unittest import mock
+import anthropic
+import httpx
+from celery import current_app
+from django.core.cache import caches
+from django.db import IntegrityError
+from django.conf import settings
+from django.test import TestCase, override_settings
 
-# Create your tests here.
+from config.celery import app as celery_app, configure_queue_concurrency
+from courses.models import Course, Module, Chunk, Video, GenerationBatch, GenerationStep
+from generation import tasks
+from generation.services.anthropic_service import anthropic_service
+from generation.services.batch_service import batch_generation_service, AnthropicBatchBackend, StubBatchBackend
+from generation.services.response_cache import start_call_stats
+from generation.services.rate_limiter import RateLimiter, is_retryable, retry_delay
+from generation.services.response_parser import response_parser
+from generation.services.similarity_service import course_similarity_service
+from generation.services.worker_loop import get_worker_loop, close_worker_loop
+
+
+LOCAL_CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'anthropic_responses': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+}
+
+
+@override_settings(CACHES=LOCAL_CACHES, ANTHROPIC_RATE_LIMIT_ENABLED=False)
+class ModuleBatchGenerationTests(TestCase):
+    """Modo batch contra el backend local de la Message Batches API"""
+    
+    def setUp(self):
+        self.backend = StubBatchBackend()
+        batch_generation_service.backend = self.backend
+        self.addCleanup(setattr, batch_generation_service, 'backend', None)
+        
+        patches = [
+            mock.patch.object(tasks.youtube_service, 'search_videos_for_chunk', new=mock.AsyncMock(return_value=[])),
+            mock.patch.object(tasks.anthropic_service, 'create_final_project', new=mock.AsyncMock(return_value={})),
+        ]
+        for patcher in patches:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+    
+    def _create_course(self, prompt='Python desde cero'):
+        return Course.objects.create(
+            user_prompt=prompt,
+            status=Course.StatusChoices.METADATA_READY,
+            title=prompt,
+            total_modules=3,
+            module_list=['Introducción', 'Variables', 'Funciones']
+        )
+    
+    def test_batch_generates_all_modules_of_pending_courses(self):
+        courses = [self._create_course('Python desde cero'), self._create_course('Django básico')]
+        
+        with mock.patch.object(tasks.status_event_service, 'publish') as publish:
+            batch_id = tasks.submit_module_batch(schedule_poll=False)
+        batch = GenerationBatch.objects.get(id=batch_id)
+        self.assertEqual(batch.request_count, 6)
+        self.assertEqual({call.args[0].id for call in publish.call_args_list}, {course.id for course in courses})
+        self.assertEqual({call.args[0].status for call in publish.call_args_list},
+                         {Course.StatusChoices.GENERATING_MODULE_1})
+        
+        self.assertEqual(tasks.poll_module_batch(batch_id, reschedule=False), GenerationBatch.StatusChoices.COMPLETE)
+        
+        for course in courses:
+            course.refresh_from_db()
+            self.assertEqual(course.status, Course.StatusChoices.COMPLETE)
+            self.assertEqual(course.modules.count(), 3)
+            self.assertEqual(course.modules.get(module_order=2).chunks.count(), 4)
+    
+    def test_failed_batch_results_fall_back_to_interactive_generation(self):
+        course = self._create_course()
+        placeholder = StubBatchBackend.placeholder_module
+        self.backend.responder = lambda custom_id, params: (
+            None if custom_id.endswith('-m2') else placeholder(custom_id, params)
+        )
+        
+        fallback_module = mock.AsyncMock(side_effect=lambda metadata, number: json.loads(
+            placeholder(batch_generation_service.make_custom_id(course.id, number), {})
+        ))
+        with mock.patch.object(tasks.anthropic_service, 'create_module_content', new=fallback_module):
+            batch_id = tasks.submit_module_batch(schedule_poll=False)
+            tasks.poll_module_batch(batch_id, reschedule=False)
+        
+        fallback_module.assert_awaited_once()
+        self.assertEqual(fallback_module.await_args.args[1], 2)
+        self.assertEqual(course.modules.count(), 3)
+    
+    def submit_to_anthropic(self, course):
+        backend = AnthropicBatchBackend()
+        backend._client = mock.Mock()
+        backend._client.beta.messages.batches.create.return_value = SimpleNamespace(id='msgbatch_1')
+        batch_generation_service.backend = backend
+        
+        metadata = tasks._build_course_metadata(course)
+        self.assertEqual(batch_generation_service.submit_modules([(str(course.id), metadata, 1)]), 'msgbatch_1')
+        return backend._client.beta.messages.batches.create, metadata
+    
+    @override_settings(ANTHROPIC_PROMPT_CACHING_ENABLED=True)
+    def test_batch_requests_enable_prompt_caching(self):
+        course = self._create_course()
+        create, metadata = self.submit_to_anthropic(course)
+        
+        create.assert_called_once_with(
+            requests=[{
+                'custom_id': batch_generation_service.make_custom_id(course.id, 1),
+                'params': anthropic_service.module_request_params(metadata, 1)
+            }],
+            betas=['prompt-caching-2024-07-31']
+        )
+        self.assertTrue(any('cache_control' in block for block in create.call_args.kwargs['requests'][0]['params']['system']))
+    
+    @override_settings(ANTHROPIC_PROMPT_CACHING_ENABLED=False)
+    def test_batch_requests_without_prompt_caching(self):
+        course = self._create_course()
+        create, metadata = self.submit_to_anthropic(course)
+        
+        create.assert_called_once_with(requests=[{
+            'custom_id': batch_generation_service.make_custom_id(course.id, 1),
+            'params': anthropic_service.module_request_params(metadata, 1)
+        }])
+        self.assertFalse(any('cache_control' in block for block in create.call_args.kwargs['requests'][0]['params']['system']))
+
+
+@override_settings(CACHES=LOCAL_CACHES, ANTHROPIC_RATE_LIMIT_ENABLED=False)
+class CheckpointedGenerationTests(TestCase):
+    """Reanudación de la generación desde los checkpoints por etapa y módulo"""
+    
+    def setUp(self):
+        self.course = Course.objects.create(
+            user_prompt='Python desde cero',
+            status=Course.StatusChoices.READY,
+            title='Python desde cero',
+            total_modules=3,
+            module_list=['Introducción', 'Variables', 'Funciones']
+        )
+        self.create_module = mock.AsyncMock(side_effect=lambda metadata, number: json.loads(
+            StubBatchBackend.placeholder_module(f"{self.course.id.hex}-m{number}", {})
+        ))
+        
+        patches = [
+            mock.patch.object(tasks.anthropic_service, 'create_module_content', new=self.create_module),
+            mock.patch.object(tasks.anthropic_service, 'create_final_project', new=mock.AsyncMock(return_value={})),
+            mock.patch.object(tasks.youtube_service, 'search_videos_for_chunk', new=mock.AsyncMock(return_value=[])),
+        ]
+        for patcher in patches:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+    
+    def test_redelivery_only_regenerates_missing_and_half_written_modules(self):
+        for number in (1, 2):
+            tasks._save_generated_module(
+                self.course, number, self.create_module.side_effect(None, number), {}, tasks.get_worker_loop()
+            )
+        # Módulo 3 a medio escribir por un worker que cayó antes de terminar
+        Module.objects.create(course=self.course, module_id='modulo_3', module_order=3,
+                              title='Funciones', description='', is_complete=False)
+        self.create_module.reset_mock()
+        
+        tasks.generate_remaining_modules(str(self.course.id))
+        
+        self.assertEqual([call.args[1] for call in self.create_module.await_args_list], [3])
+        self.assertEqual(self.course.modules.get(module_order=3).chunks.count(), 4)
+        self.course.refresh_from_db()
+        self.assertEqual(self.course.total_chunks, 12)
+        self.assertEqual(
+            self.course.generation_steps.filter(status=GenerationStep.StatusChoices.DONE).count(), 4
+        )
+    
+    def test_module_is_not_retried_after_exhausting_attempts(self):
+        self.create_module.side_effect = RuntimeError("overloaded")
+        
+        for _ in range(4):
+            tasks.generate_module(str(self.course.id), 2)
+        
+        step = self.course.generation_steps.get(stage=GenerationStep.StageChoices.MODULE, module_number=2)
+        self.assertEqual(step.status, GenerationStep.StatusChoices.FAILED)
+        self.assertEqual(step.attempts, 3)
+        self.assertEqual(self.create_module.await_count, 3)
+
+
+def run_tasks_eagerly(test):
+    """Ejecutar en el proceso las tareas encoladas (chords, delay) durante el test"""
+    current_app.conf.task_always_eager = True
+    test.addCleanup(setattr, current_app.conf, 'task_always_eager', False)
+
+
+def placeholder_module(course, number):
+    return json.loads(StubBatchBackend.placeholder_module(f"{course.id.hex}-m{number}", {}))
+
+
+@override_settings(CACHES=LOCAL_CACHES, ANTHROPIC_RATE_LIMIT_ENABLED=False, GENERATION_MODULE_CONCURRENCY=2)
+class RemainingModulesGenerationTests(TestCase):
+    """Fase 3: módulos restantes generados en paralelo y persistidos al llegar"""
+    
+    def setUp(self):
+        self.course = Course.objects.create(
+            user_prompt='Python desde cero',
+            status=Course.StatusChoices.READY,
+            title='Python desde cero',
+            total_modules=4,
+            module_list=['Introducción', 'Variables', 'Funciones', 'Clases']
+        )
+        tasks.persistence_service.save_module(self.course, 1, placeholder_module(self.course, 1))
+        tasks.checkpoint_service.complete(self.course, tasks.MODULE_STAGE, 1)
+        self.in_flight = self.max_in_flight = 0
+        
+        async def create_module(metadata, number):
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            await asyncio.sleep(0.01)
+            self.in_flight -= 1
+            return placeholder_module(self.course, number)
+        
+        self.create_module = mock.AsyncMock(side_effect=create_module)
+        self.create_final_project = mock.AsyncMock(return_value={'title': 'Proyecto final'})
+        self.search_videos = mock.AsyncMock(return_value=[{
+            'video_id': 'abc123', 'title': 'Video', 'url': 'https://www.youtube.com/watch?v=abc123',
+            'embed_url': 'https://www.youtube.com/embed/abc123', 'thumbnail_url': '', 'duration': '10:00'
+        }])
+        
+        patches = [
+            mock.patch.object(tasks.anthropic_service, 'create_module_content', new=self.create_module),
+            mock.patch.object(tasks.anthropic_service, 'create_final_project', new=self.create_final_project),
+            mock.patch.object(tasks.youtube_service, 'search_videos_for_chunk', new=self.search_videos),
+        ]
+        for patcher in patches:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+    
+    def test_modules_are_generated_concurrently_within_the_limit(self):
+        tasks.generate_remaining_modules(str(self.course.id))
+        
+        self.course.refresh_from_db()
+        self.assertEqual(self.course.status, Course.StatusChoices.COMPLETE)
+        self.assertEqual(sorted(call.args[1] for call in self.create_module.await_args_list), [2, 3, 4])
+        self.assertEqual(self.max_in_flight, 2)
+        self.assertEqual(self.course.modules.count(), 4)
+        self.assertEqual(len(self.create_final_project.await_args.args[1]), 4)
+        self.assertEqual(self.course.final_project_data, {'title': 'Proyecto final'})
+        self.assertEqual(self.course.total_chunks, 16)  # No lo pisa el guardado final del curso
+    
+    @override_settings(GENERATION_USE_CHORD=True)
+    def test_chord_generates_each_module_as_a_task_and_finalizes(self):
+        run_tasks_eagerly(self)
+        tasks.generate_remaining_modules(str(self.course.id))
+        
+        self.course.refresh_from_db()
+        self.assertEqual(self.course.status, Course.StatusChoices.COMPLETE)
+        self.assertEqual(list(self.course.modules.values_list('module_order', flat=True)), [1, 2, 3, 4])
+        self.assertEqual(self.course.total_chunks, 16)
+        self.create_final_project.assert_awaited_once()
+    
+    def test_chunk_videos_are_searched_inline(self):
+        tasks.generate_remaining_modules(str(self.course.id))
+        
+        self.assertEqual(self.search_videos.await_count, 12)
+        self.assertEqual(Video.objects.filter(chunk__module__course=self.course).count(), 12)
+    
+    @override_settings(GENERATION_DEFER_VIDEOS=True)
+    def test_deferred_videos_are_attached_by_a_separate_task(self):
+        with mock.patch.object(tasks.attach_module_videos, 'delay') as attach_videos:
+            tasks.generate_remaining_modules(str(self.course.id))
+        
+        self.assertEqual(attach_videos.call_count, 3)
+        self.assertFalse(Video.objects.exists())
+        
+        for module_id, video_queries in (call.args for call in attach_videos.call_args_list):
+            self.assertEqual(tasks.attach_module_videos(module_id, video_queries), 4)
+        self.assertEqual(Video.objects.filter(chunk__module__course=self.course).count(), 12)
+        self.assertEqual(tasks.attach_module_videos(*attach_videos.call_args.args), 0)  # Idempotente
+    
+    def test_speculative_prefetch_is_skipped_unless_the_course_is_active(self):
+        Course.objects.filter(pk=self.course.pk).update(status=Course.StatusChoices.FAILED)
+        self.assertEqual(tasks.generate_module(str(self.course.id), 2, speculative=True),
+                         {'module_number': 2, 'generated': False})
+        self.create_module.assert_not_awaited()
+        
+        Course.objects.filter(pk=self.course.pk).update(status=Course.StatusChoices.READY)
+        self.assertEqual(tasks.generate_module(str(self.course.id), 2, speculative=True),
+                         {'module_number': 2, 'generated': True})
+        self.assertTrue(self.course.modules.filter(module_order=2).exists())
+    
+    def test_locked_module_is_waited_for_instead_of_generated_twice(self):
+        self.assertTrue(tasks._acquire_module_lock(self.course.id, 2))  # La pre-generación está en marcha
+        self.addCleanup(tasks._release_module_lock, self.course.id, 2)
+        
+        self.assertEqual(tasks.generate_module(str(self.course.id), 2, speculative=True),
+                         {'module_number': 2, 'generated': False})
+        
+        def prefetch_finishes(seconds):
+            tasks.persistence_service.save_module(self.course, 2, placeholder_module(self.course, 2))
+            tasks.checkpoint_service.complete(self.course, tasks.MODULE_STAGE, 2)
+        
+        with mock.patch.object(tasks.time, 'sleep', side_effect=prefetch_finishes) as sleep:
+            result = tasks.generate_module(str(self.course.id), 2)
+        
+        self.assertEqual(result, {'module_number': 2, 'generated': True})
+        sleep.assert_called_once_with(tasks.MODULE_WAIT_POLL_SECONDS)
+        self.create_module.assert_not_awaited()
+        self.assertEqual(self.course.modules.filter(module_order=2).count(), 1)
+    
+    def test_module_is_generated_if_the_lock_holder_fails(self):
+        self.assertTrue(tasks._acquire_module_lock(self.course.id, 2))
+        
+        with mock.patch.object(tasks.time, 'sleep', side_effect=lambda seconds: tasks._release_module_lock(self.course.id, 2)):
+            result = tasks.generate_module(str(self.course.id), 2)
+        
+        self.assertEqual(result, {'module_number': 2, 'generated': True})
+        self.create_module.assert_awaited_once()
+
+
+class QueueRoutingTests(TestCase):
+    """Colas interactive (lo que el usuario espera) y bulk (segundo plano)"""
+    
+    def queue(self, task_name):
+        return celery_app.amqp.router.route({}, task_name)['queue'].name
+    
+    def test_tasks_are_routed_by_priority(self):
+        self.assertEqual(self.queue('generation.tasks.generate_course_metadata'), 'interactive')
+        self.assertEqual(self.queue('generation.tasks.generate_module_1'), 'interactive')
+        self.assertEqual(self.queue('generation.tasks.generate_remaining_modules'), 'bulk')
+        self.assertEqual(self.queue('generation.tasks.generate_module'), 'bulk')
+        self.assertEqual(self.queue('generation.tasks.attach_module_videos'), 'bulk')
+    
+    def test_single_queue_workers_use_the_queue_concurrency(self):
+        conf = SimpleNamespace(worker_concurrency=None)
+        configure_queue_concurrency(conf=conf, options={'queues': 'interactive'})
+        self.assertEqual(conf.worker_concurrency, settings.CELERY_WORKER_QUEUE_CONCURRENCY['interactive'])
+        
+        # -c explícito o varias colas: se respeta la configuración del worker
+        conf = SimpleNamespace(worker_concurrency=None)
+        configure_queue_concurrency(conf=conf, options={'queues': 'interactive,bulk'})
+        configure_queue_concurrency(conf=conf, options={'queues': ['bulk'], 'concurrency': 8})
+        self.assertIsNone(conf.worker_concurrency)
+
+
+def claude_message(text, stop_reason='end_turn', input_tokens=100, output_tokens=50, cache_read=0, cache_write=0):
+    """Respuesta de la Messages API con el formato del SDK"""
+    return SimpleNamespace(
+        content=[SimpleNamespace(text=text)],
+        stop_reason=stop_reason,
+        usage=SimpleNamespace(
+            input_tokens=input_tokens,
+            output_tokens=output_tokens,
+            cache_read_input_tokens=cache_read,
+            cache_creation_input_tokens=cache_write
+        )
+    )
+
+
+def module_response(chunks):
+    """Módulo como lo devolvería Claude, con bloques de código dentro del contenido"""
+    return {
+        'title': 'Variables', 'description': 'Tipos y asignación',
+        'chunks': [
+            {'title': f'Parte {n}', 'content': f'Ejemplo {n}:\n```python\nx = {n}\nprint(x)\n```\nFin de la parte {n}.'}
+            for n in range(1, chunks + 1)
+        ],
+        'quiz': [{'question': '¿Qué imprime?', 'options': ['1', '2'], 'correct_answer': 0}]
+    }
+
+
+@override_settings(CACHES=LOCAL_CACHES, ANTHROPIC_RATE_LIMIT_ENABLED=False)
+class AnthropicServiceTests(TestCase):
+    """Llamadas a Claude contra un cliente falso de la Messages API"""
+    
+    course_metadata = {
+        'title': 'Python desde cero', 'description': '', 'level': 'principiante',
+        'module_list': ['Introducción', 'Variables', 'Funciones'], 'topics': []
+    }
+    
+    def setUp(self):
+        caches['anthropic_responses'].clear()
+        self.client = mock.Mock()
+        self.client.beta.prompt_caching.messages = self.client.messages
+        self.client.messages.create = mock.AsyncMock(return_value=claude_message('{"title": "Proyecto final"}'))
+        
+        patcher = mock.patch.object(type(anthropic_service), 'client', new_callable=mock.PropertyMock,
+                                    return_value=self.client)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.stats = start_call_stats()
+    
+    def run_async(self, coroutine):
+        return get_worker_loop().run_until_complete(coroutine)
+    
+    def test_identical_requests_are_served_from_the_response_cache(self):
+        for _ in range(2):
+            project = self.run_async(anthropic_service.create_final_project(self.course_metadata, []))
+        
+        self.assertEqual(project, {'title': 'Proyecto final'})
+        self.client.messages.create.assert_awaited_once()
+        self.assertEqual(self.stats.as_dict()['cache_hits'], 1)
+        self.assertEqual(self.stats.as_dict()['cache_misses'], 1)
+    
+    @override_settings(ANTHROPIC_PROMPT_CACHING_ENABLED=True)
+    def test_module_prompt_prefix_is_marked_for_prompt_caching(self):
+        module_2 = anthropic_service.module_request_params(self.course_metadata, 2)['system']
+        module_3 = anthropic_service.module_request_params(self.course_metadata, 3)['system']
+        
+        # Contexto del curso e instrucciones: prefijo común con un solo punto de caché al final
+        self.assertEqual([block.get('cache_control') for block in module_2],
+                         [None, {'type': 'ephemeral'}, None])
+        self.assertEqual(module_2[:2], module_3[:2])
+        self.assertNotEqual(module_2[2], module_3[2])
+    
+    @override_settings(ANTHROPIC_PROMPT_CACHING_ENABLED=False)
+    def test_prompt_caching_can_be_disabled(self):
+        system = anthropic_service.module_request_params(self.course_metadata, 2)['system']
+        
+        self.assertFalse(any('cache_control' in block for block in system))
+        self.assertIs(anthropic_service._messages_api(), self.client.messages)
+    
+    def test_token_usage_is_recorded(self):
+        self.client.messages.create.return_value = claude_message(
+            '{"title": "Proyecto final"}', input_tokens=120, output_tokens=80, cache_read=2000, cache_write=300
+        )
+        
+        self.run_async(anthropic_service.create_final_project(self.course_metadata, []))
+        
+        stats = self.stats.as_dict()
+        self.assertEqual(stats['input_tokens'], 120)
+        self.assertEqual(stats['output_tokens'], 80)
+        self.assertEqual(stats['cache_read_input_tokens'], 2000)
+        self.assertEqual(stats['cache_creation_input_tokens'], 300)
+    
+    @override_settings(ANTHROPIC_MAX_RETRIES=2)
+    def test_retryable_errors_are_retried_after_the_suggested_delay(self):
+        self.client.messages.create.side_effect = [
+            api_status_error(anthropic.RateLimitError, 429, {'retry-after': '3'}),
+            claude_message('{"title": "Proyecto final"}'),
+        ]
+        
+        with mock.patch('generation.services.anthropic_service.asyncio.sleep', new=mock.AsyncMock()) as sleep:
+            project = self.run_async(anthropic_service.create_final_project(self.course_metadata, []))
+        
+        self.assertEqual(project, {'title': 'Proyecto final'})
+        self.assertGreaterEqual(sleep.await_args.args[0], 3)
+        self.assertEqual(self.stats.as_dict()['retries'], 1)
+        self.assertEqual(self.stats.as_dict()['api_calls'], 1)
+    
+    @override_settings(ANTHROPIC_MAX_RETRIES=2)
+    def test_non_retryable_errors_are_raised(self):
+        self.client.messages.create.side_effect = api_status_error(anthropic.BadRequestError, 400)
+        
+        with self.assertRaises(anthropic.BadRequestError):
+            self.run_async(anthropic_service.create_final_project(self.course_metadata, []))
+        self.client.messages.create.assert_awaited_once()
+    
+    def test_fenced_module_keeps_code_blocks_inside_chunks(self):
+        module = module_response(chunks=4)
+        self.client.messages.create.return_value = claude_message(
+            f"Aquí tienes el módulo [v1]:\n```json\n{json.dumps(module)}\n```"
+        )
+        
+        module_content = self.run_async(anthropic_service.create_module_content(self.course_metadata, 1))
+        
+        self.assertEqual(module_content, module)
+        self.assertEqual(self.stats.as_dict()['json_extracted'], 1)
+    
+    def test_truncated_module_is_rejected_after_continuations(self):
+        truncated = json.dumps(module_response(chunks=4))[:-400]
+        self.client.messages.create.side_effect = [
+            claude_message(truncated, stop_reason='max_tokens'),
+            claude_message('', stop_reason='max_tokens'),
+            claude_message('', stop_reason='max_tokens'),
+        ]
+        
+        with self.assertRaises(ValueError):
+            self.run_async(anthropic_service.create_module_content(self.course_metadata, 1))
+        self.assertEqual(self.stats.as_dict()['json_continuations'], 2)
+        self.assertEqual(self.stats.as_dict()['json_invalid'], 1)
+    
+    def test_invalid_module_is_not_served_from_the_response_cache(self):
+        self.client.messages.create.return_value = claude_message(json.dumps(module_response(chunks=2)))
+        
+        for _ in range(2):
+            with self.assertRaises(ValueError):
+                self.run_async(anthropic_service.create_module_content(self.course_metadata, 1))
+        
+        self.assertEqual(self.client.messages.create.await_count, 2)
+
+
+def api_status_error(error_class, status_code, headers=None):
+    """Error de la API de Claude con la respuesta HTTP (y sus cabeceras) que lo originó"""
+    request = httpx.Request('POST', 'https://api.anthropic.com/v1/messages')
+    response = httpx.Response(status_code, headers=headers or {}, request=request)
+    return error_class(f'Error {status_code}', response=response, body=None)
+
+
+@override_settings(ANTHROPIC_RATE_LIMIT_ENABLED=True, ANTHROPIC_REQUESTS_PER_MINUTE=60,
+                   ANTHROPIC_TOKENS_PER_MINUTE=1000, ANTHROPIC_RETRY_BASE_DELAY=1.0, ANTHROPIC_RETRY_MAX_DELAY=30.0)
+class RateLimiterTests(TestCase):
+    """Token buckets del rate limiter (bucket local sin Redis) y política de reintentos"""
+    
+    def setUp(self):
+        self.limiter = RateLimiter()
+        self.limiter._redis_retry_at = time.monotonic() + 60  # Redis "caído": bucket en memoria
+        self.stats = start_call_stats()
+    
+    def run_async(self, coroutine):
+        return get_worker_loop().run_until_complete(coroutine)
+    
+    def test_local_bucket_waits_for_capacity_and_accepts_refunds(self):
+        self.assertEqual(self.limiter._take(1, 600), 0)
+        
+        # Quedan 400 tokens: faltan 200, que se recuperan en 12s a 1000 tokens/minuto
+        self.assertAlmostEqual(self.limiter._take(1, 600), 12, delta=0.1)
+        
+        self.run_async(self.limiter.refund(400))  # La llamada anterior usó 200 tokens, no 600
+        self.assertEqual(self.limiter._take(1, 600), 0)
+    
+    def test_acquire_sleeps_until_the_bucket_admits_the_call(self):
+        with mock.patch.object(self.limiter, '_take', side_effect=[2.5, 0]), \
+                mock.patch('generation.services.rate_limiter.asyncio.sleep', new=mock.AsyncMock()) as sleep:
+            self.run_async(self.limiter.acquire(600))
+        
+        sleep.assert_awaited_once_with(2.5)
+        self.assertEqual(self.stats.as_dict()['rate_limit_waits'], 1)
+    
+    def test_retryable_errors(self):
+        request = httpx.Request('POST', 'https://api.anthropic.com/v1/messages')
+        
+        self.assertTrue(is_retryable(api_status_error(anthropic.RateLimitError, 429)))
+        self.assertTrue(is_retryable(api_status_error(anthropic.InternalServerError, 529)))
+        self.assertTrue(is_retryable(anthropic.APIConnectionError(request=request)))
+        self.assertFalse(is_retryable(api_status_error(anthropic.BadRequestError, 400)))
+    
+    def test_retry_delay_honors_retry_after(self):
+        error = api_status_error(anthropic.RateLimitError, 429, {'retry-after': '7'})
+        self.assertTrue(7 <= retry_delay(0, error) <= 8)
+        
+        error = api_status_error(anthropic.RateLimitError, 429, {'retry-after-ms': '1500'})
+        self.assertTrue(1.5 <= retry_delay(3, error) <= 2.5)
+        
+        # Sin cabecera: backoff exponencial con jitter, acotado por ANTHROPIC_RETRY_MAX_DELAY
+        self.assertTrue(0 <= retry_delay(2, api_status_error(anthropic.InternalServerError, 500)) <= 4)
+        self.assertTrue(0 <= retry_delay(10) <= 30)
+
+
+class ResponseParserTests(TestCase):
+    """Localización y reparación del JSON en respuestas de Claude"""
+    
+    def test_preamble_with_brackets_is_skipped(self):
+        data, outcome = response_parser.parse('Resultado [final]: {"title": "Módulo", "chunks": []} ¿Algo más?')
+        self.assertEqual(data, {'title': 'Módulo', 'chunks': []})
+        self.assertEqual(outcome, 'extracted')
+    
+    def test_truncated_response_after_preamble_is_repaired(self):
+        text = 'Aquí está [v2]:\n```json\n{"title": "Módulo", "chunks": [{"content": "```py\\nx = 1\\n```"}, {"content": "Sin ter'
+        
+        data, outcome = response_parser.parse(text)
+        
+        self.assertEqual(outcome, 'repaired')
+        self.assertEqual(data['title'], 'Módulo')
+        self.assertEqual(data['chunks'][0], {'content': '```py\nx = 1\n```'})
+
+
+class SaveModuleTests(TestCase):
+    """persistence_service.save_module: todo o nada, con un número fijo de consultas"""
+    
+    def setUp(self):
+        self.course = Course.objects.create(user_prompt='Python desde cero', title='Python desde cero', total_modules=2)
+    
+    def module_data(self, number, chunk_count):
+        module_data = placeholder_module(self.course, number)
+        module_data['chunks'] = [
+            dict(module_data['chunks'][0], chunk_id=f'modulo_{number}_chunk_{order}', chunk_order=order)
+            for order in range(1, chunk_count + 1)
+        ]
+        return module_data
+    
+    def test_failure_mid_save_leaves_nothing_behind(self):
+        module_data = self.module_data(1, 4)
+        module_data['quiz'][0]['question'] = None  # Fila inválida después de módulo y chunks
+        
+        with self.assertRaises(IntegrityError):
+            tasks.persistence_service.save_module(self.course, 1, module_data)
+        
+        self.assertFalse(Module.objects.filter(course=self.course).exists())
+        self.assertFalse(Chunk.objects.filter(module__course=self.course).exists())
+        self.course.refresh_from_db()
+        self.assertEqual(self.course.total_chunks, 0)
+    
+    def test_query_count_does_not_grow_with_the_chunks(self):
+        # Savepoint, módulo, chunks, contadores de módulo y curso, quiz y release
+        with self.assertNumQueries(7):
+            tasks.persistence_service.save_module(self.course, 1, self.module_data(1, 2))
+        with self.assertNumQueries(7):
+            module, chunks = tasks.persistence_service.save_module(self.course, 2, self.module_data(2, 12))
+        
+        self.assertEqual(len(chunks), 12)
+        module.refresh_from_db()
+        self.assertEqual(module.total_chunks, 12)
+
+
+@override_settings(CACHES=LOCAL_CACHES, COURSE_REUSE_ENABLED=True, COURSE_REUSE_THRESHOLD=0.5)
+class CourseReuseTests(TestCase):
+    """Reutilización de cursos completos casi idénticos en lugar de regenerarlos"""
+    
+    def setUp(self):
+        self.source = Course.objects.create(
+            user_prompt='Quiero aprender Python desde cero',
+            user_interests=['programación'],
+            status=Course.StatusChoices.COMPLETE,
+            title='Python desde cero',
+            total_modules=1
+        )
+        module = Module.objects.create(course=self.source, module_id='modulo_1', module_order=1,
+                                       title='Introducción', description='')
+        chunk = Chunk.objects.create(module=module, chunk_id='modulo_1_chunk_1', chunk_order=1, content='Contenido')
+        Video.objects.create(chunk=chunk, video_id='abc123', title='Video', url='https://www.youtube.com/watch?v=abc123',
+                             embed_url='https://www.youtube.com/embed/abc123', thumbnail_url='', duration='10:00')
+        module.update_total_chunks()
+        Course.objects.create(user_prompt='Aprende cocina italiana', status=Course.StatusChoices.COMPLETE, title='Cocina')
+        
+        # El índice es global al proceso: reconstruirlo con los cursos de este test
+        course_similarity_service._built_at = 0
+        self.addCleanup(setattr, course_similarity_service, '_built_at', 0)
+    
+    def test_reuse_threshold(self):
+        match = course_similarity_service.find_similar_course('aprende Python', 'principiante', ['programación'])
+        self.assertEqual(match[0], self.source)
+        self.assertGreaterEqual(match[1], 0.5)
+        
+        self.assertIsNone(course_similarity_service.find_similar_course('Aprender JavaScript desde cero', 'principiante'))
+        self.assertIsNone(course_similarity_service.find_similar_course('aprende Python', 'avanzado', ['programación']))
+        with override_settings(COURSE_REUSE_THRESHOLD=1.0):
+            self.assertIsNone(course_similarity_service.find_similar_course('aprende Python', 'principiante'))
+    
+    def test_paraphrased_prompt_clones_the_complete_course(self):
+        with mock.patch('api.views.generate_course_metadata.delay') as generate_metadata:
+            response = self.client.post('/api/courses/', {
+                'user_prompt': 'aprende Python desde cero',
+                'user_level': 'principiante',
+                'user_interests': ['programación']
+            }, content_type='application/json')
+        
+        generate_metadata.assert_not_called()
+        course = Course.objects.get(id=response.json()['id'])
+        self.assertEqual(course.status, Course.StatusChoices.COMPLETE)
+        self.assertEqual(course.title, 'Python desde cero')
+        self.assertEqual(course.total_chunks, 1)
+        self.assertEqual(Video.objects.filter(chunk__module__course=course).count(), 1)
+
+
+@override_settings(ANTHROPIC_API_KEY='test-key')
+class WorkerLoopTests(TestCase):
+    """Event loop persistente del worker y cliente AsyncAnthropic ligado a él"""
+    
+    def setUp(self):
+        anthropic_service._clients.clear()
+        self.addCleanup(anthropic_service._clients.clear)
+    
+    async def current_client(self):
+        return anthropic_service.client
+    
+    def test_client_is_reused_across_tasks_on_the_worker_loop(self):
+        loop = get_worker_loop()
+        client = loop.run_until_complete(self.current_client())
+        
+        self.assertIs(get_worker_loop(), loop)
+        self.assertIs(get_worker_loop().run_until_complete(self.current_client()), client)
+        
+        other_loop = asyncio.new_event_loop()
+        self.addCleanup(other_loop.close)
+        self.assertIsNot(other_loop.run_until_complete(self.current_client()), client)
+    
+    def test_each_loop_keeps_its_client_until_the_loop_is_closed(self):
+        loop = get_worker_loop()
+        client = loop.run_until_complete(self.current_client())
+        
+        other_loop = asyncio.new_event_loop()
+        self.addCleanup(other_loop.close)
+        other_loop.run_until_complete(self.current_client())
+        self.assertIs(loop.run_until_complete(self.current_client()), client)  # No se abandona sin cerrar
+        
+        with mock.patch.object(client, 'close', wraps=client.close) as close:
+            close_worker_loop()
+        
+        close.assert_awaited_once()
+        self.assertTrue(loop.is_closed())
+        self.assertNotIn(loop, anthropic_service._clients)
+        self.assertIsNot(get_worker_loop(), loop)
+    
+    def test_closed_loop_is_replaced(self):
+        loop = get_worker_loop()
+        loop.close()
+        
+        self.assertFalse(get_worker_loop().is_closed())
+
+
+class FakeMessageStream:
+    """Stream de la Messages API que entrega el texto en fragmentos"""
+    
+    def __init__(self, text, fragment_size=40):
+        self.text = text
+        self.fragment_size = fragment_size
+    
+    async def __aenter__(self):
+        return self
+    
+    async def __aexit__(self, *exc_info):
+        return False
+    
+    @property
+    def text_stream(self):
+        return self._fragments()
+    
+    async def _fragments(self):
+        for start in range(0, len(self.text), self.fragment_size):
+            yield self.text[start:start + self.fragment_size]
+    
+    async def get_final_message(self):
+        return claude_message('', 'end_turn')
+
+
+@override_settings(CACHES=LOCAL_CACHES, ANTHROPIC_RATE_LIMIT_ENABLED=False,
+                   GENERATION_STREAM_MODULE_1=True, GENERATION_PREFETCH_MODULE_2=False)
+class StreamedModuleTests(TestCase):
+    """Módulo 1 en streaming: cada chunk se guarda en cuanto llega"""
+    
+    def setUp(self):
+        self.course = Course.objects.create(
+            user_prompt='Python desde cero',
+            status=Course.StatusChoices.METADATA_READY,
+            title='Python desde cero',
+            total_modules=3,
+            module_list=['Introducción', 'Variables', 'Funciones']
+        )
+        caches['anthropic_responses'].clear()  # Sin respuestas de otros tests
+        module_data = placeholder_module(self.course, 1)
+        module_data['summary'] = 'Resumen'
+        
+        client = mock.Mock()
+        client.beta.prompt_caching.messages = client.messages
+        client.messages.stream = lambda **params: FakeMessageStream(json.dumps(module_data, ensure_ascii=False))
+        
+        patches = [
+            mock.patch.object(type(anthropic_service), 'client', new_callable=mock.PropertyMock, return_value=client),
+            mock.patch.object(tasks.youtube_service, 'search_videos_for_chunk', new=mock.AsyncMock(return_value=[])),
+        ]
+        for patcher in patches:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        
+        self.saved = []
+        save_streamed_chunk = tasks.persistence_service.save_streamed_chunk
+        
+        def record_chunk(module, chunk_data):
+            chunk = save_streamed_chunk(module, chunk_data)
+            self.course.refresh_from_db()
+            self.saved.append((self.course.status, self.course.get_ready_chunks_count()))
+            return chunk
+        
+        patcher = mock.patch.object(tasks.persistence_service, 'save_streamed_chunk', side_effect=record_chunk)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+    
+    def test_chunks_are_saved_as_they_arrive(self):
+        tasks.generate_module_1(str(self.course.id))
+        
+        # El curso pasa a READY tras el primer chunk, no al terminar el módulo
+        self.assertEqual(self.saved[0], (Course.StatusChoices.GENERATING_MODULE_1, 1))
+        self.assertEqual(self.saved[1], (Course.StatusChoices.READY, 2))
+        self.assertEqual(len(self.saved), 4)
+        
+        module = self.course.modules.get(module_order=1)
+        self.assertTrue(module.is_complete)
+        self.assertEqual(module.summary, 'Resumen')
+        self.assertEqual(module.quizzes.count(), 1)
+        self.assertEqual(module.total_chunks, 4)
+        self.assertEqual(list(module.chunks.values_list('title', flat=True)), [f'Chunk {order}' for order in range(1, 5)])
+    
+    def test_course_started_during_streaming_is_not_reset_to_ready(self):
+        record_chunk = tasks.persistence_service.save_streamed_chunk.side_effect
+        
+        def start_course_after_first_chunk(module, chunk_data):
+            chunk = record_chunk(module, chunk_data)
+            # El usuario inicia el curso (start_course) en cuanto está READY
+            Course.objects.filter(pk=self.course.pk, status=Course.StatusChoices.READY).update(
+                status=Course.StatusChoices.GENERATING_REMAINING
+            )
+            return chunk
+        
+        tasks.persistence_service.save_streamed_chunk.side_effect = start_course_after_first_chunk
+        tasks.generate_module_1(str(self.course.id))
+        
+        self.course.refresh_from_db()
+        self.assertEqual(self.course.status, Course.StatusChoices.GENERATING_REMAINING)
+    
+    def fail_at_third_chunk(self, start_course=False):
+        record_chunk = tasks.persistence_service.save_streamed_chunk.side_effect
+        
+        def save_chunk(module, chunk_data):
+            if chunk_data['chunk_order'] == 3:
+                raise ConnectionError("Stream cortado")
+            if start_course:
+                Course.objects.filter(pk=self.course.pk, status=Course.StatusChoices.READY).update(
+                    status=Course.StatusChoices.GENERATING_REMAINING
+                )
+            return record_chunk(module, chunk_data)
+        
+        tasks.persistence_service.save_streamed_chunk.side_effect = save_chunk
+        with self.assertRaises(ConnectionError):
+            tasks.generate_module_1(str(self.course.id))
+        tasks.persistence_service.save_streamed_chunk.side_effect = record_chunk
+    
+    def test_failed_stream_keeps_the_chunks_already_visible(self):
+        self.fail_at_third_chunk()
+        
+        module = self.course.modules.get(module_order=1)
+        self.assertFalse(module.is_complete)
+        self.assertEqual(module.chunks.count(), 2)
+        self.course.refresh_from_db()
+        self.assertEqual(self.course.status, Course.StatusChoices.FAILED)  # Nadie lo había empezado
+        
+        visible_chunks = list(module.chunks.values_list('pk', flat=True))
+        with mock.patch.object(tasks.anthropic_service, 'create_module_content',
+                               new=mock.AsyncMock(return_value=placeholder_module(self.course, 1))):
+            tasks.generate_module_1(str(self.course.id))
+        
+        module.refresh_from_db()
+        self.assertTrue(module.is_complete)
+        self.assertEqual(module.total_chunks, 4)
+        self.assertEqual(list(module.chunks.values_list('pk', flat=True))[:2], visible_chunks)
+        self.course.refresh_from_db()
+        self.assertEqual(self.course.status, Course.StatusChoices.READY)
+    
+    def test_failure_after_the_course_started_does_not_fail_it(self):
+        self.fail_at_third_chunk(start_course=True)
+        
+        self.course.refresh_from_db()
+        self.assertEqual(self.course.status, Course.StatusChoices.GENERATING_REMAINING)
+    
+    def test_course_is_not_completed_until_module_1_is(self):
+        self.fail_at_third_chunk(start_course=True)
+        with self.assertRaises(ValueError):
+            tasks._complete_course(self.course, 0, self.course.total_modules, time.time(), start_call_stats())
+        
+        async def create_module(metadata, number):
+            return placeholder_module(self.course, number)
+        
+        with mock.patch.object(tasks.anthropic_service, 'create_module_content', new=create_module), \
+                mock.patch.object(tasks.anthropic_service, 'create_final_project',
+                                  new=mock.AsyncMock(return_value={'title': 'Proyecto final'})):
+            tasks.generate_remaining_modules(str(self.course.id))
+        
+        self.course.refresh_from_db()
+        self.assertEqual(self.course.status, Course.StatusChoices.COMPLETE)
+        self.assertTrue(self.course.modules.get(module_order=1).is_complete)
+        self.assertEqual(self.course.total_chunks, 12)